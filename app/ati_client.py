@@ -1,12 +1,15 @@
 import json
 import os
-import requests
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
 from app.models import Logist, Order  # Исправленный импорт
 from app.database import SessionLocal
+from app.metrics import ati_request_timer, PUBLISHES
+from app.ati_http import get_ati_http, HTTP_ERRORS, ATI_API_BASE_URL
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -17,7 +20,6 @@ engine = create_engine(DATABASE_URL)
 Session = sessionmaker(bind=engine)
 session = Session()
 
-ATI_API_BASE_URL = "https://api.ati.su"
 ATI_API_TOKEN = os.getenv("ATI_API_TOKEN")  # Используем правильный токен!
 
 HEADERS = {
@@ -25,10 +27,44 @@ HEADERS = {
     "Content-Type": "application/json"
 }
 
+# Ограничения для массовых операций с ATI
+ATI_MAX_CONCURRENCY = int(os.getenv("ATI_MAX_CONCURRENCY", 4))  # Одновременных запросов
+ATI_RATE_LIMIT = float(os.getenv("ATI_RATE_LIMIT", 5))  # Запросов в секунду (0 — без ограничения)
+ATI_MAX_RETRIES = 3  # Повторы при 429
+
+class RateLimiter:
+    """Потокобезопасный ограничитель частоты запросов (token bucket)"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Блокирует поток, пока не освободится слот для запроса"""
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Общий лимит запросов к ATI для всех потоков процесса
+ati_rate_limiter = RateLimiter(ATI_RATE_LIMIT)
+
 def get_car_types():
     """Получает словарь типов кузовов с ATI"""
     url = f"{ATI_API_BASE_URL}/v1.0/dictionaries/carTypes"
-    response = requests.get(url, headers=HEADERS)
+    response = get_ati_http().get(url, headers=HEADERS)
     if response.status_code == 200:
         car_types = response.json()
         return {item["Name"].lower(): item["TypeId"] for item in car_types}
@@ -38,7 +74,7 @@ def get_car_types():
 def get_loading_types():
     """Получает словарь способов загрузки с ATI"""
     url = f"{ATI_API_BASE_URL}/v1.0/dictionaries/loadingTypes"
-    response = requests.get(url, headers=HEADERS)
+    response = get_ati_http().get(url, headers=HEADERS)
     if response.status_code == 200:
         loading_types = response.json()
         return {item["Name"].lower(): item["Id"] for item in loading_types}
@@ -48,15 +84,15 @@ def get_loading_types():
 def get_unloading_types():
     """Получает словарь способов разгрузки с ATI"""
     url = f"{ATI_API_BASE_URL}/v1.0/dictionaries/unloadingTypes"
-    response = requests.get(url, headers=HEADERS)
+    response = get_ati_http().get(url, headers=HEADERS)
     if response.status_code == 200:
         unloading_types = response.json()
         return {item["Name"].lower(): item["Id"] for item in unloading_types}
     print(f"❌ Ошибка запроса unloadingTypes: {response.status_code}, {response.text}")
     return {}
 
-def get_city_id(city_name):
-    """Получает ID города по названию через API ATI."""
+def fetch_city_id(city_name):
+    """Запрос ID города в ATI без кеша. Возвращает `(status_code, city_id)`, city_id=None — не найден"""
     url = f"{ATI_API_BASE_URL}/gw/gis-dict/v1/autocomplete/suggestions"
     payload = {
         "prefix": city_name,
@@ -65,16 +101,26 @@ def get_city_id(city_name):
         "country_id": 1  
     }
 
-    response = requests.post(url, json=payload, headers=HEADERS)
-    data = response.json()
-    
-    if response.status_code == 200 and "suggestions" in data and data["suggestions"]:
-        city_id = data["suggestions"][0]["city"]["id"]
+    with ati_request_timer("city") as metric:
+        response = get_ati_http().post(url, json=payload, headers=HEADERS)
+        metric["status"] = response.status_code
+
+    if response.status_code != 200:
+        print(f"🚨 Ошибка запроса ID города {city_name}: {response.status_code}")
+        return response.status_code, None
+
+    suggestions = response.json().get("suggestions")
+    if suggestions:
+        city_id = suggestions[0]["city"]["id"]
         print(f"✅ Найден ID города {city_name}: {city_id}")
-        return city_id
-    else:
-        print(f"🚨 Ошибка: не найден ID для города {city_name}")
-        return None
+        return response.status_code, city_id
+
+    print(f"🚨 Ошибка: не найден ID для города {city_name}")
+    return response.status_code, None
+
+def get_city_id(city_name):
+    """Получает ID города по названию через API ATI (без кеша, см. app.city_cache)."""
+    return fetch_city_id(city_name)[1]
 
 def get_contact_id(logist_name):
     """Получает ID логиста из БД или API ATI."""
@@ -88,7 +134,9 @@ def get_contact_id(logist_name):
 
     # Запрашиваем API ATI
     url = f"{ATI_API_BASE_URL}/v1.0/firms/contacts"
-    response = requests.get(url, headers=HEADERS)
+    with ati_request_timer("contact") as metric:
+        response = get_ati_http().get(url, headers=HEADERS)
+        metric["status"] = response.status_code
 
     if response.status_code == 200:
         contacts = response.json()
@@ -117,7 +165,7 @@ def publish_cargo(cargo_data):
             "type": "bounded",
             "start": cargo_data["loading_dates"]["time"]["start"],
             "end": cargo_data["loading_dates"]["time"]["end"],
-            "offset": "+00:00"
+            "offset": cargo_data["loading_dates"]["time"].get("offset", "+00:00")
         },
         "first_date": cargo_data["loading_dates"]["first_date"],
         "last_date": cargo_data["loading_dates"]["last_date"]
@@ -131,7 +179,7 @@ def publish_cargo(cargo_data):
             "type": "bounded" if cargo_data["unloading_dates"]["time"]["start"] else "round-the-clock",
             "start": cargo_data["unloading_dates"]["time"]["start"],
             "end": cargo_data["unloading_dates"]["time"]["end"],
-            "offset": "+00:00"
+            "offset": cargo_data["unloading_dates"]["time"].get("offset", "+00:00")
         }
     } if cargo_data["unloading_dates"]["first_date"] else None  # Если нет даты, не передаем
 
@@ -174,9 +222,12 @@ def publish_cargo(cargo_data):
         }
     }
 
-    response = requests.post(url, json=payload, headers=HEADERS)
+    with ati_request_timer("publish") as metric:
+        response = get_ati_http().post(url, json=payload, headers=HEADERS)
+        metric["status"] = response.status_code
 
     if response.status_code == 200:
+        PUBLISHES.inc(result="ok")
         data = response.json()
         cargo_id = data["cargo_application"]["cargo_id"]
         cargo_number = data["cargo_application"]["cargo_number"]
@@ -195,6 +246,7 @@ def publish_cargo(cargo_data):
         
         return {"cargo_id": cargo_id, "cargo_number": cargo_number}
 
+    PUBLISHES.inc(result="error")
     print(f"❌ Ошибка публикации: {response.status_code}, {response.text}")
     return response.json()
 
@@ -231,7 +283,7 @@ def update_cargo(cargo_data):
             "type": "bounded",
             "start": cargo_data["loading_dates"]["time"]["start"],
             "end": cargo_data["loading_dates"]["time"]["end"],
-            "offset": "+00:00"
+            "offset": cargo_data["loading_dates"]["time"].get("offset", "+00:00")
         },
         "first_date": cargo_data["loading_dates"]["first_date"],
         "last_date": cargo_data["loading_dates"]["last_date"]
@@ -245,7 +297,7 @@ def update_cargo(cargo_data):
             "type": "bounded" if cargo_data["unloading_dates"]["time"]["start"] else "round-the-clock",
             "start": cargo_data["unloading_dates"]["time"]["start"],
             "end": cargo_data["unloading_dates"]["time"]["end"],
-            "offset": "+00:00"
+            "offset": cargo_data["unloading_dates"]["time"].get("offset", "+00:00")
         }
     } if cargo_data["unloading_dates"]["first_date"] else None  # Если нет даты, не передаем
 
@@ -288,7 +340,9 @@ def update_cargo(cargo_data):
         }
     }
 
-    response = requests.put(url, json=payload, headers=HEADERS)
+    with ati_request_timer("update") as metric:
+        response = get_ati_http().put(url, json=payload, headers=HEADERS)
+        metric["status"] = response.status_code
     if response.status_code == 200:
         print(f"✅ Груз {cargo_data['cargo_id']} ({cargo_data['external_id']}) обновлен успешно!")
         return response.json()
@@ -299,6 +353,23 @@ def update_cargo(cargo_data):
         print(f"❌ Ошибка обновления {cargo_data['cargo_id']}: {response.status_code}, {response.text}")
         return response.json()
 
+def _request_cargo_deletion(order):
+    """Отправляет DELETE в ATI с учетом лимита запросов, повторяет запрос при 429"""
+    url = f"{ATI_API_BASE_URL}/v1.0/loads/{order.cargo_id}"
+
+    for attempt in range(ATI_MAX_RETRIES + 1):
+        ati_rate_limiter.acquire()
+        with ati_request_timer("delete") as metric:
+            response = get_ati_http().delete(url, headers=HEADERS)
+            metric["status"] = response.status_code
+        if response.status_code != 429 or attempt == ATI_MAX_RETRIES:
+            return response
+
+        retry_after = response.headers.get("Retry-After")
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt
+        print(f"⚠️ Ошибка 429 при удалении {order.cargo_id}. Повтор через {delay} с.")
+        time.sleep(delay)
+
 def delete_cargo(order):
     """Удаляет заявку груза на ATI и обновляет БД"""
     
@@ -306,8 +377,7 @@ def delete_cargo(order):
         print(f"⚠️ Ошибка: У заявки {order.external_no} нет cargo_id, удаление невозможно.")
         return {"error": "cargo_id отсутствует, удаление невозможно"}
 
-    url = f"{ATI_API_BASE_URL}/v1.0/loads/{order.cargo_id}"
-    response = requests.delete(url, headers=HEADERS)
+    response = _request_cargo_deletion(order)
 
     if response.status_code == 200:
         print(f"✅ Груз {order.cargo_id} ({order.external_no}) удален успешно!")
@@ -329,3 +399,48 @@ def delete_cargo(order):
     else:
         print(f"❌ Ошибка удаления {order.cargo_id}: {response.status_code}, {response.text}")
         return response.json()
+
+def delete_cargos(orders, max_workers=ATI_MAX_CONCURRENCY):
+    """Параллельно снимает грузы с ATI и одним UPDATE очищает `cargo_id` в БД.
+
+    `orders` — объекты с атрибутами `external_no` и `cargo_id`; заявки еще должны
+    быть в БД (после очистки `cargo_id` повторное удаление им не грозит).
+    Возвращает кортеж `(deleted, failed)` со списками external_no.
+    """
+    orders = [order for order in orders if order.cargo_id]
+    if not orders:
+        return [], []
+
+    def delete_one(order):
+        try:
+            response = _request_cargo_deletion(order)
+        except HTTP_ERRORS as e:
+            print(f"❌ Ошибка удаления {order.cargo_id}: {e}")
+            return False
+
+        if response.status_code == 200:
+            print(f"✅ Груз {order.cargo_id} ({order.external_no}) удален успешно!")
+            return True
+
+        print(f"❌ Ошибка удаления {order.cargo_id}: {response.status_code}, {response.text}")
+        return False
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ati-delete") as pool:
+        results = list(pool.map(delete_one, orders))
+
+    deleted = [order.external_no for order, ok in zip(orders, results) if ok]
+    failed = [order.external_no for order, ok in zip(orders, results) if not ok]
+
+    # 🔄 Одна запись в БД для всех удаленных грузов
+    if deleted:
+        db = SessionLocal()
+        try:
+            db.query(Order).filter(Order.external_no.in_(deleted)).update(
+                {Order.cargo_id: None, Order.is_published: False}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    print(f"🗑 Снято с ATI: {len(deleted)}, ошибок: {len(failed)}")
+    return deleted, failed
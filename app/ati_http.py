@@ -0,0 +1,94 @@
+import importlib.util
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx  # HTTP/2 через httpx[http2] (необязательная зависимость)
+except ImportError:
+    httpx = None
+if httpx and importlib.util.find_spec("h2") is None:
+    httpx = None  # Без пакета h2 httpx работает только по HTTP/1.1 — тогда достаточно requests
+
+ATI_API_BASE_URL = "https://api.ati.su"
+
+# Пул соединений к ATI (один на процесс)
+ATI_POOL_SIZE = int(os.getenv("ATI_POOL_SIZE", 10))  # Соединений keep-alive; не меньше ATI_MAX_CONCURRENCY
+ATI_CONNECT_TIMEOUT = float(os.getenv("ATI_CONNECT_TIMEOUT", 5))  # Секунды на установку соединения
+ATI_READ_TIMEOUT = float(os.getenv("ATI_READ_TIMEOUT", 30))  # Секунды на ожидание ответа
+ATI_HTTP2 = os.getenv("ATI_HTTP2", "0").lower() in ("1", "true", "yes")
+
+# Сетевые ошибки обоих вариантов клиента
+HTTP_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx else ())
+
+class AtiHttpClient:
+    """Общий клиент для всех запросов к api.ati.su.
+
+    Одни и те же соединения (TCP+TLS) переиспользуются между вызовами и потоками,
+    у каждого запроса есть таймауты на соединение и чтение. По умолчанию —
+    `requests.Session` с пулом; при `ATI_HTTP2=1` и установленном `httpx[http2]` — HTTP/2.
+    """
+
+    def __init__(self, base_url=ATI_API_BASE_URL, pool_size=ATI_POOL_SIZE,
+                 connect_timeout=ATI_CONNECT_TIMEOUT, read_timeout=ATI_READ_TIMEOUT, http2=ATI_HTTP2):
+        self.base_url = base_url
+        self.http2 = bool(http2 and httpx)
+        if http2 and not httpx:
+            print("⚠️ ATI_HTTP2 включен, но httpx[http2] не установлен — используем HTTP/1.1")
+
+        if self.http2:
+            self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+            self.session = httpx.Client(
+                http2=True,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            )
+        else:
+            self.timeout = (connect_timeout, read_timeout)
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        """Запрос к ATI; `url` — полный адрес или путь относительно `base_url`"""
+        if url.startswith("/"):
+            url = f"{self.base_url}{url}"
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_ati_http():
+    """Общий клиент ATI процесса (создается при первом обращении)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AtiHttpClient()
+    return _client
+
+def close_ati_http():
+    """Закрывает соединения общего клиента (при завершении процесса)"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import CityCache
+from app.ati_client import fetch_city_id, ati_rate_limiter, ATI_MAX_CONCURRENCY
+from app.ati_http import HTTP_ERRORS
+from app.metrics import CITY_LOOKUPS
+from app.transformers.city_normalizer import normalize_city_name
+
+CITY_ID_CACHE_SIZE = int(os.getenv("CITY_ID_CACHE_SIZE", 5000))  # Городов в памяти процесса
+CITY_ID_TTL = float(os.getenv("CITY_ID_TTL", 30 * 24 * 3600))  # Через сколько секунд перепроверять найденный город
+CITY_MISS_TTL = float(os.getenv("CITY_MISS_TTL", 3600))  # Сколько секунд помнить, что ATI город не нашел
+CITY_PREWARM_WORKERS = int(os.getenv("CITY_PREWARM_WORKERS", ATI_MAX_CONCURRENCY))  # 0 — не прогревать при загрузке
+CITY_LOOKUP_CHUNK_SIZE = 500  # Ключей в одном запросе к ati_city_cache
+
+def store_city_ids(session: Session, entries):
+    """Сохраняет ответы ATI в `ati_city_cache` одной транзакцией.
+
+    `entries` — список словарей с полями name_key, city_name, city_id, resolved_at.
+    """
+    if not entries:
+        return
+    try:
+        if session.get_bind().dialect.name == "postgresql":
+            stmt = pg_insert(CityCache).values(entries)
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=[CityCache.name_key],
+                set_={column: stmt.excluded[column] for column in ("city_name", "city_id", "resolved_at")},
+            ))
+        else:
+            existing = dict(
+                session.query(CityCache.name_key, CityCache.id)
+                .filter(CityCache.name_key.in_([entry["name_key"] for entry in entries]))
+            )
+            session.bulk_insert_mappings(CityCache, [entry for entry in entries if entry["name_key"] not in existing])
+            session.bulk_update_mappings(CityCache, [
+                {"id": existing[entry["name_key"]], **entry} for entry in entries if entry["name_key"] in existing
+            ])
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+class CityIdCache:
+    """ID городов ATI: LRU в памяти процесса перед таблицей `ati_city_cache`.
+
+    Ключ — нормализованное название города (`normalize_city_name`), поэтому
+    "г. Москва" и "Москва" разрешаются одной записью. Найденные города
+    перепроверяются в ATI раз в CITY_ID_TTL, ненайденные — раз в CITY_MISS_TTL.
+    Ошибки ATI не кешируются.
+    """
+
+    def __init__(self, maxsize=CITY_ID_CACHE_SIZE, ttl=CITY_ID_TTL, miss_ttl=CITY_MISS_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._entries = OrderedDict()  # name_key -> (city_id, истекает по time.monotonic())
+        self._lock = threading.Lock()
+
+    def _remember(self, key, city_id, resolved_at):
+        """Кладет ответ в память с остатком срока жизни от `resolved_at`"""
+        age = (datetime.utcnow() - resolved_at).total_seconds()
+        expires_at = time.monotonic() + (self.ttl if city_id is not None else self.miss_ttl) - age
+        with self._lock:
+            self._entries[key] = (city_id, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _from_memory(self, key):
+        """(True, city_id) для актуальной записи в памяти, иначе (False, None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[0]
+
+    def _is_fresh(self, city_id, resolved_at):
+        ttl = self.ttl if city_id is not None else self.miss_ttl
+        return (datetime.utcnow() - resolved_at).total_seconds() < ttl
+
+    def get(self, city_name, session: Session = None):
+        """ID города ATI или None. Сеть — только если города нет в кеше или срок записи истек"""
+        key = normalize_city_name(city_name)
+        if not key:
+            return None
+
+        found, city_id = self._from_memory(key)
+        if found:
+            CITY_LOOKUPS.inc(source="memory")
+            return city_id
+
+        own_session = session is None
+        db = SessionLocal() if own_session else session
+        try:
+            row = db.query(CityCache.city_id, CityCache.resolved_at).filter(CityCache.name_key == key).first()
+            if row and self._is_fresh(row.city_id, row.resolved_at):
+                CITY_LOOKUPS.inc(source="db")
+                self._remember(key, row.city_id, row.resolved_at)
+                return row.city_id
+
+            try:
+                status_code, city_id = fetch_city_id(city_name)
+            except HTTP_ERRORS as e:
+                print(f"❌ Ошибка запроса ID города {city_name}: {e}")
+                status_code, city_id = None, None
+
+            if status_code != 200:
+                # ATI недоступен: лучше устаревший ID, чем никакого; ошибку не кешируем
+                CITY_LOOKUPS.inc(source="error")
+                return row.city_id if row else None
+
+            CITY_LOOKUPS.inc(source="ati")
+            resolved_at = datetime.utcnow()
+            store_city_ids(db, [{"name_key": key, "city_name": city_name, "city_id": city_id, "resolved_at": resolved_at}])
+            self._remember(key, city_id, resolved_at)
+            return city_id
+        finally:
+            if own_session:
+                db.close()
+
+    def prewarm(self, city_names, session: Session, max_workers=CITY_PREWARM_WORKERS):
+        """Заранее разрешает ID всех городов из `city_names`, которых еще нет в кеше.
+
+        Таблица читается пачками, неизвестные города запрашиваются в ATI параллельно
+        (не более `max_workers` запросов, с общим лимитом ati_rate_limiter) и
+        сохраняются одной транзакцией. Возвращает число запросов к ATI.
+        """
+        names = {}  # name_key -> название для запроса в ATI (первое встреченное)
+        for city_name in city_names:
+            key = normalize_city_name(city_name)
+            if key and key not in names and not self._from_memory(key)[0]:
+                names[key] = city_name
+        if not names:
+            return 0
+
+        keys = list(names)
+        for start in range(0, len(keys), CITY_LOOKUP_CHUNK_SIZE):
+            rows = session.query(CityCache.name_key, CityCache.city_id, CityCache.resolved_at).filter(
+                CityCache.name_key.in_(keys[start:start + CITY_LOOKUP_CHUNK_SIZE])
+            )
+            for key, city_id, resolved_at in rows:
+                if self._is_fresh(city_id, resolved_at):
+                    self._remember(key, city_id, resolved_at)
+                    del names[key]
+        if not names:
+            return 0
+
+        def resolve_one(item):
+            key, city_name = item
+            ati_rate_limiter.acquire()
+            try:
+                status_code, city_id = fetch_city_id(city_name)
+            except HTTP_ERRORS as e:
+                print(f"❌ Ошибка запроса ID города {city_name}: {e}")
+                return None
+            if status_code != 200:
+                return None  # Ошибку не кешируем — город запросится при публикации
+            return {"name_key": key, "city_name": city_name, "city_id": city_id, "resolved_at": datetime.utcnow()}
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="city-prewarm") as pool:
+            results = list(pool.map(resolve_one, names.items()))
+
+        entries = [entry for entry in results if entry]
+        store_city_ids(session, entries)
+        for entry in entries:
+            self._remember(entry["name_key"], entry["city_id"], entry["resolved_at"])
+        CITY_LOOKUPS.inc(len(entries), source="ati")
+        CITY_LOOKUPS.inc(len(results) - len(entries), source="error")
+
+        print(f"🏙 Прогрев ID городов: запрошено {len(results)}, сохранено {len(entries)}")
+        return len(results)
+
+    def invalidate(self, city_name=None):
+        """Сбрасывает память процесса (весь кеш или один город); таблица не меняется"""
+        with self._lock:
+            if city_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(normalize_city_name(city_name), None)
+
+# Общий кеш процесса
+city_id_cache = CityIdCache()
+
+def resolve_city_id(city_name, session: Session = None):
+    """ID города ATI через кеш (память → БД → ATI)"""
+    return city_id_cache.get(city_name, session)
+
+def prewarm_city_ids(session: Session, rows, max_workers=CITY_PREWARM_WORKERS):
+    """Прогревает кеш ID городов погрузки и выгрузки для записей заявок (словарей `orders`)"""
+    if max_workers <= 0 or not rows:
+        return 0
+    return city_id_cache.prewarm(
+        (row[field] for row in rows for field in ("loading_city", "unloading_city") if row.get(field)),
+        session, max_workers,
+    )
@@ -1,32 +1,268 @@
+import time
+from collections import namedtuple
+from sqlalchemy import or_, tuple_
 from sqlalchemy.orm import Session
-from app.models import Logist, DistributionRule
-
-def distribute_order(order, session: Session):
-    """Применяет правила распределения и возвращает логиста и расчетную цену."""
-    
-    # Фильтруем правила по площадке
-    rules = session.query(DistributionRule).filter(DistributionRule.platform == order["platform"]).all()
-    
+from app.models import Logist, Order
+from app.rule_index import rule_index, RuleSnapshot, CompiledRule
+from app.order_store import bulk_update_orders
+
+DEFAULT_PLATFORM = "transport2"  # Площадка правил распределения по умолчанию
+DEFAULT_CARGO_NAME = "ТНП"
+DEFAULT_PAYMENT_DAYS = 30
+
+# Результат применения правил к одной заявке
+RuleMatch = namedtuple("RuleMatch", (
+    "rule", "logistician", "logist_id", "contact_id", "cargo_name", "ati_price", "auto_publish", "payment_days",
+))
+
+def _field(order, name):
+    """Поле заявки: словарь записи или ORM-объект `Order`"""
+    return order.get(name) if isinstance(order, dict) else getattr(order, name, None)
+
+def calculate_ati_price(bid_price, rule, order_type):
+    """Ставка для ATI по марже правила: bid_price * (100 - margin) / 100.
+
+    Без ставки площадки (None или 0) цены нет — груз публикуется с запросом цены.
+    """
+    if not rule or not bid_price:
+        return None
+    margin = rule.auction_margin_percent if order_type == "AUCTION" else rule.margin_percent
+    if margin is None:
+        return None  # Запрос цены
+    return bid_price * ((100 - margin) / 100)
+
+def load_logists(session: Session):
+    """{имя логиста: (id, contact_id)} одним запросом"""
+    return {name: (logist_id, contact_id) for logist_id, name, contact_id in session.query(Logist.id, Logist.name, Logist.contact_id)}
+
+class RuleEngine:
+    """Правила распределения для пачки заявок: один набор правил и логистов на цикл.
+
+    Все потребители (конвейер, трансформер ATI, перерасчет ставок) получают
+    одинаковый результат с одинаковым порядком поиска правила.
+    """
+
+    _current = None
+
+    def __init__(self, snapshot, logists):
+        self.snapshot = snapshot  # app.rule_index.RuleSnapshot
+        self.logists = logists
+        self.loaded_at = time.monotonic()
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    @classmethod
+    def load(cls, session: Session):
+        """Свежие правила (с проверкой версии) и логисты — для начала цикла"""
+        engine = cls(rule_index.refresh(session), load_logists(session))
+        cls._current = engine
+        return engine
+
+    @classmethod
+    def current(cls, session: Session):
+        """Закешированный движок; правила и логисты перечитываются не чаще раза в RULE_INDEX_TTL"""
+        snapshot = rule_index.current(session)
+        engine = cls._current
+        if engine is None or engine.snapshot is not snapshot or time.monotonic() - engine.loaded_at > rule_index.ttl:
+            engine = cls(snapshot, load_logists(session))
+            cls._current = engine
+        return engine
+
+    def match(self, order):
+        """Применяет правила к заявке (словарь полей `orders` или объект `Order`)"""
+        order_type = _field(order, "order_type")
+        rule = self.snapshot.match(
+            _field(order, "platform") or DEFAULT_PLATFORM, _field(order, "loading_city"), _field(order, "unloading_city")
+        )
+        if not rule:
+            return RuleMatch(None, None, None, None, DEFAULT_CARGO_NAME, None, False, DEFAULT_PAYMENT_DAYS)
+
+        logist_id, contact_id = self.logists.get(rule.logistician, (None, None))
+        return RuleMatch(
+            rule=rule,
+            logistician=rule.logistician,
+            logist_id=logist_id,
+            contact_id=contact_id,
+            cargo_name=rule.cargo_name or DEFAULT_CARGO_NAME,
+            ati_price=calculate_ati_price(_field(order, "bid_price"), rule, order_type),
+            auto_publish=bool(rule.auto_publish_auction if order_type == "AUCTION" else rule.auto_publish),
+            payment_days=rule.payment_days or DEFAULT_PAYMENT_DAYS,
+        )
+
+    def match_many(self, orders):
+        """Применяет правила к пачке заявок без запросов к БД. Возвращает список RuleMatch"""
+        return [self.match(order) for order in orders]
+
+def compile_rules(rules):
+    """Правила-кандидаты (словари или объекты с полями правила) → список CompiledRule в порядке приоритета"""
+    compiled = []
     for rule in rules:
-        # Проверяем соответствие города загрузки и выгрузки
-        if (rule.loading_city in [None, order["loading_city"]]) and \
-           (rule.unloading_city in [None, order["unloading_city"]]):
-
-            # Определяем логиста
-            logist = session.query(Logist).filter_by(name=rule.logistician).first()
-            if not logist:
-                continue
-
-            # Рассчитываем ставку для АТИ
-            if rule.margin_percent is not None:
-                ati_price = order["factory_bid"] * ((100 - rule.margin_percent) / 100)
-            else:
-                ati_price = None  # Запрос цены
-
-            return {
-                "logist_id": logist.id,
-                "ati_price": ati_price,
-                "auto_publish": rule.auto_publish
-            }
-    
-    return None  # Если не найдено правило
+        values = {field: _field(rule, field) for field in CompiledRule._fields}
+        values["platform"] = values["platform"] or DEFAULT_PLATFORM
+        compiled.append(CompiledRule(**values))
+    return compiled
+
+# Поля заявки, нужные для применения правил
+SIMULATION_FIELDS = (
+    "external_no", "platform", "loading_city", "unloading_city", "order_type",
+    "bid_price", "ati_price", "logistician_name", "cargo_id",
+)
+
+def simulate_rule_set(session: Session, candidate_rules):
+    """Что изменится, если заменить правила распределения на `candidate_rules`.
+
+    Все заявки из БД прогоняются одним пакетом через текущие и новые правила.
+    Возвращает изменения логистов, новые ставки ATI и смену авто-публикации.
+    """
+    current_engine = RuleEngine.load(session)
+    candidate_engine = RuleEngine(RuleSnapshot(None, compile_rules(candidate_rules)), current_engine.logists)
+
+    columns = [getattr(Order, field) for field in SIMULATION_FIELDS]
+    orders = [dict(zip(SIMULATION_FIELDS, row)) for row in session.query(*columns)]
+
+    current_matches = current_engine.match_many(orders)
+    candidate_matches = candidate_engine.match_many(orders)
+
+    logist_changes, price_changes, auto_publish_start, auto_publish_stop = [], [], [], []
+    for order, current, candidate in zip(orders, current_matches, candidate_matches):
+        external_no = order["external_no"]
+
+        if candidate.logistician != order["logistician_name"]:
+            logist_changes.append({
+                "external_no": external_no,
+                "from": order["logistician_name"],
+                "to": candidate.logistician,
+                "rule_id": candidate.rule.id if candidate.rule else None,
+            })
+
+        if candidate.ati_price is not None and candidate.ati_price != order["ati_price"]:
+            price_changes.append({
+                "external_no": external_no,
+                "bid_price": order["bid_price"],
+                "from": order["ati_price"],
+                "to": candidate.ati_price,
+                "is_published": bool(order["cargo_id"]),  # Опубликованным заявкам понадобится обновление в ATI
+            })
+
+        if candidate.auto_publish != current.auto_publish:
+            (auto_publish_start if candidate.auto_publish else auto_publish_stop).append(external_no)
+
+    return {
+        "orders": len(orders),
+        "rules": len(candidate_engine.snapshot.rules),
+        "logist_changes": logist_changes,
+        "price_changes": price_changes,
+        "auto_publish_start": auto_publish_start,
+        "auto_publish_stop": auto_publish_stop,
+    }
+
+# Поля заявки для сверки с правилами и пересчета ставки
+ATTRIBUTION_FIELDS = (
+    "id", "external_no", "platform", "loading_city", "unloading_city", "order_type", "bid_price",
+    "rule_id", "logistician_name", "cargo_name", "ati_price", "cargo_id",
+)
+ROUTE_CHUNK_SIZE = 300  # Направлений в одном запросе заявок
+
+def attribution(match, version):
+    """Поля заявки, которые определяет сработавшее правило (логист, груз, ставка и само правило)"""
+    return {
+        "rule_id": match.rule.id if match.rule else None,
+        "rule_set_version": version,
+        "logistician_name": match.logistician,
+        "cargo_name": match.cargo_name,
+        "ati_price": match.ati_price,
+    }
+
+def _load_orders(query):
+    return [dict(zip(ATTRIBUTION_FIELDS, row)) for row in query]
+
+def affected_routes(session: Session, patterns):
+    """Направления заявок (площадка, погрузка, выгрузка), подходящие под шаблоны городов правил.
+
+    `patterns` — тройки (площадка, город погрузки, город выгрузки) в формате правил.
+    Проверяются только различные направления, а не все заявки.
+    """
+    snapshot = RuleSnapshot(None, compile_rules([
+        {"id": index, "platform": platform, "loading_city": loading_city, "unloading_city": unloading_city}
+        for index, (platform, loading_city, unloading_city) in enumerate(patterns)
+    ]))
+    routes = session.query(Order.platform, Order.loading_city, Order.unloading_city).distinct()
+    return [tuple(route) for route in routes if snapshot.match(*route)]
+
+def reattribute_orders(session: Session, patterns, rule_id=None):
+    """Сверяет правила заявок, на которые могло повлиять изменение одного правила.
+
+    Проверяются заявки правила `rule_id`, заявки на направлениях, подходящих под
+    шаблоны `patterns` (города правила до и после изменения, см. affected_routes),
+    и еще ни разу не сверенные заявки. Заявкам, попавшим под другое правило, логист,
+    наименование груза, ставка и `rule_id` записываются из одного результата правил
+    одним массовым UPDATE. Возвращает `(reattributed, ati_updates)` — число заявок со
+    сменившимся правилом и external_no опубликованных из них (груз нужно обновить в ATI).
+    """
+    engine = RuleEngine.load(session)
+
+    columns = [getattr(Order, field) for field in ATTRIBUTION_FIELDS]
+    dependent = [Order.rule_set_version.is_(None)]
+    if rule_id is not None:
+        dependent.append(Order.rule_id == rule_id)
+    orders = {order["id"]: order for order in _load_orders(session.query(*columns).filter(or_(*dependent)))}
+
+    routes = affected_routes(session, patterns)
+    for start in range(0, len(routes), ROUTE_CHUNK_SIZE):
+        route_filter = tuple_(Order.platform, Order.loading_city, Order.unloading_city).in_(routes[start:start + ROUTE_CHUNK_SIZE])
+        for order in _load_orders(session.query(*columns).filter(route_filter)):
+            orders.setdefault(order["id"], order)
+
+    orders = list(orders.values())
+    moved = [
+        (order, match) for order, match in zip(orders, engine.match_many(orders))
+        if (match.rule.id if match.rule else None) != order["rule_id"]
+        # Правило удалено (в Postgres `rule_id` уже обнулен внешним ключом), а логист от него остался
+        or (match.rule is None and order["logistician_name"] is not None)
+    ]
+    moved_ids = {order["id"] for order, _ in moved}
+    bulk_update_orders(session, [
+        {"id": order["id"], **attribution(match, engine.version)} for order, match in moved
+    ] + [
+        {"id": order["id"], "rule_set_version": engine.version} for order in orders if order["id"] not in moved_ids
+    ])
+    reattributed = len(moved)
+
+    ati_updates = [order["external_no"] for order, _ in moved if order["cargo_id"]]
+    print(f"🧭 Правила заявок сверены с версией {engine.version}: проверено {len(orders)}, сменили правило {reattributed}")
+    return reattributed, ati_updates
+
+def reprice_orders(session: Session, rule_id, dependent_only=True):
+    """Пересчитывает `ati_price` всех заявок, на которые действует правило `rule_id`.
+
+    `dependent_only=True` — проверяются только заявки с `rule_id` этого правила
+    (принадлежность заявок правилам поддерживает reattribute_orders); иначе — все
+    заявки. Заявке, которая по правилам уже относится к `rule_id`, но хранит другое
+    правило, вместе со ставкой записываются логист, груз и `rule_id`. Ставки считаются
+    одним проходом по пачке и пишутся одним массовым UPDATE. Возвращает
+    `(repriced, ati_updates)` — число измененных заявок и external_no опубликованных
+    заявок, которые нужно обновить в ATI.
+    """
+    engine = RuleEngine.load(session)  # Уже с измененным правилом
+
+    query = session.query(*(getattr(Order, field) for field in ATTRIBUTION_FIELDS))
+    if dependent_only:
+        query = query.filter(Order.rule_id == rule_id)
+    orders = _load_orders(query)
+
+    changed = []  # (заявка, новые значения полей)
+    for order, match in zip(orders, engine.match_many(orders)):
+        if not match.rule or match.rule.id != rule_id:
+            continue
+        if order["rule_id"] != rule_id:
+            changed.append((order, attribution(match, engine.version)))
+        elif match.ati_price is not None and match.ati_price != order["ati_price"]:
+            changed.append((order, {"ati_price": match.ati_price}))
+
+    repriced = bulk_update_orders(session, [{"id": order["id"], **values} for order, values in changed])
+
+    ati_updates = [order["external_no"] for order, _ in changed if order["cargo_id"]]
+    print(f"💱 Правило {rule_id}: пересчитано ставок {repriced}, к обновлению в ATI {len(ati_updates)}")
+    return repriced, ati_updates
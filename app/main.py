@@ -1,7 +1,7 @@
 import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import users, orders, distribution_rules, platforms, logists
+from app.routes import users, orders, distribution_rules, platforms, logists, metrics
 
 app = FastAPI()
 
@@ -22,5 +22,6 @@ app.include_router(orders.router, prefix="/orders", tags=["orders"])
 app.include_router(distribution_rules.router, prefix="/distribution-rules", tags=["distribution_rules"])
 app.include_router(platforms.router, prefix="/platforms", tags=["Platforms"])
 app.include_router(logists.router, prefix="/logists", tags=["logists"])
+app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
 
 logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
\ No newline at end of file
@@ -0,0 +1,304 @@
+import copy
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import fcntl
+except ImportError:  # Windows: файлы метрик пишутся без блокировки
+    fcntl = None
+
+# Метрики конвейера в текстовом формате Prometheus.
+# Заявки обрабатываются не в процессе API, а в воркере, runner'е и их дочерних процессах:
+# они сохраняют прирост своих метрик в METRICS_DIR (save_metrics), а GET /metrics API
+# отдает свои метрики вместе с сохраненными. Поэтому отдельный порт воркера (METRICS_PORT)
+# не обязателен — он нужен, только если API и воркер не видят общий METRICS_DIR.
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # 0 — HTTP-сервер метрик воркера не запускается
+# Общий для API и обработчиков каталог метрик; пустое значение отключает сохранение
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "asp-metrics"))
+
+# Границы корзин гистограмм (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _add_state(state, other, sign=1):
+    """Складывает (или вычитает) значения метрики: число счетчика или [корзины, сумма, количество] гистограммы"""
+    if isinstance(state, list):
+        return [_add_state(value, other_value, sign) for value, other_value in zip(state, other)]
+    return state + sign * other
+
+def _zero_state(state):
+    return [_zero_state(value) for value in state] if isinstance(state, list) else 0
+
+def _is_zero(state):
+    return all(_is_zero(value) for value in state) if isinstance(state, list) else state == 0
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    type_name = "counter"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self, values=None):
+        if values is None:
+            with self.lock:
+                values = dict(self.values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, key)} {value}"
+
+class Histogram:
+    """Гистограмма длительностей с метками"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # labels -> [counts по корзинам, sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self.lock:
+            state = self.values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет длительность блока `with`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self, values=None):
+        if values is None:
+            with self.lock:
+                values = {key: ([*state[0]], state[1], state[2]) for key, state in self.values.items()}
+        for key, (bucket_counts, total, count) in sorted(values.items()):
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', bound))} {bucket_count}"
+            yield f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', '+Inf'))} {count}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {count}"
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self.metrics = []
+        self._reported = {}  # Снимок на момент прошлого delta()
+
+    def counter(self, name, documentation, label_names=()):
+        metric = Counter(name, documentation, label_names)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, label_names, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """Значения всех метрик в виде, пригодном для pickle/JSON: {имя: [[метки, значение], ...]}"""
+        snapshot = {}
+        for metric in self.metrics:
+            with metric.lock:
+                values = [[list(key), copy.deepcopy(state)] for key, state in metric.values.items()]
+            if values:
+                snapshot[metric.name] = values
+        return snapshot
+
+    def delta(self):
+        """Прирост метрик с прошлого вызова `delta()` — для передачи из дочернего процесса в родительский"""
+        current = self.snapshot()
+        previous, self._reported = self._reported, current
+        return subtract_snapshot(current, previous)
+
+    def merge(self, snapshot):
+        """Добавляет к метрикам процесса значения из `snapshot` (например, прирост из дочернего процесса)"""
+        by_name = {metric.name: metric for metric in self.metrics}
+        for name, values in snapshot.items():
+            metric = by_name.get(name)
+            if metric is None:
+                continue
+            with metric.lock:
+                for key, state in values:
+                    key = tuple(key)
+                    metric.values[key] = _add_state(metric.values[key], state) if key in metric.values else copy.deepcopy(state)
+
+    def render(self, snapshots=()):
+        """Все метрики в текстовом формате Prometheus; `snapshots` — метрики других процессов"""
+        combined = self.snapshot()
+        for snapshot in snapshots:
+            combined = combine_snapshots(combined, snapshot)
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples({tuple(key): state for key, state in combined.get(metric.name, ())}))
+        return "\n".join(lines) + "\n"
+
+def combine_snapshots(first, second, sign=1):
+    """`first + sign * second` для снимков `MetricsRegistry.snapshot()`, без нулевых значений"""
+    combined = {}
+    for name in {*first, *second}:
+        values = {tuple(key): copy.deepcopy(state) for key, state in first.get(name, ())}
+        for key, state in second.get(name, ()):
+            key = tuple(key)
+            if key in values:
+                values[key] = _add_state(values[key], state, sign)
+            else:
+                values[key] = _add_state(_zero_state(state), state, sign)
+        changed = [[list(key), state] for key, state in values.items() if not _is_zero(state)]
+        if changed:
+            combined[name] = changed
+    return combined
+
+def subtract_snapshot(current, previous):
+    """`current - previous` для снимков `MetricsRegistry.snapshot()`, без нулевых значений"""
+    return combine_snapshots(current, previous, sign=-1)
+
+def save_metrics(name, metrics=None, directory=None):
+    """Добавляет прирост метрик процесса с прошлого сохранения в `<METRICS_DIR>/<name>.json`.
+
+    Несколько процессов с одним `name` пишут в один файл по очереди (блокировка файла).
+    """
+    metrics = registry if metrics is None else metrics
+    directory = METRICS_DIR if directory is None else directory
+    if not directory:
+        return
+    reported = metrics._reported
+    delta = metrics.delta()
+    if not delta:
+        return
+    path = os.path.join(directory, f"{name}.json")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(f"{path}.lock", "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            saved = _read_snapshot(path) or {}
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(combine_snapshots(saved, delta), file, ensure_ascii=False)
+            os.replace(temporary, path)
+    except OSError as e:
+        metrics._reported = reported  # Прирост уйдет со следующим сохранением
+        print(f"⚠️ Не удалось сохранить метрики в {path}: {e}")
+
+def load_saved_metrics(directory=None):
+    """Снимки метрик, сохраненные процессами обработки (`save_metrics`)"""
+    directory = METRICS_DIR if directory is None else directory
+    if not directory:
+        return []
+    snapshots = (_read_snapshot(path) for path in sorted(glob.glob(os.path.join(directory, "*.json"))))
+    return [snapshot for snapshot in snapshots if snapshot]
+
+def _read_snapshot(path):
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+registry = MetricsRegistry()
+
+# Длительность этапов конвейера: fetch, parse, rules, db_write, db_delete, transform
+STAGE_SECONDS = registry.histogram(
+    "asp_stage_duration_seconds", "Длительность этапа обработки заявок", ("platform", "stage")
+)
+# Длительность запросов к ATI: publish, update, delete, city, contact
+ATI_REQUEST_SECONDS = registry.histogram(
+    "asp_ati_request_duration_seconds", "Длительность запроса к API ATI", ("operation",)
+)
+ATI_REQUESTS = registry.counter(
+    "asp_ati_requests_total", "Запросы к API ATI по коду ответа", ("operation", "status")
+)
+
+CYCLES = registry.counter("asp_cycles_total", "Завершенные циклы обработки", ("platform",))
+ORDERS_SEEN = registry.counter("asp_orders_seen_total", "Заявки, полученные из TMS", ("platform",))
+ORDERS_INSERTED = registry.counter("asp_orders_inserted_total", "Добавленные заявки", ("platform",))
+ORDERS_UPDATED = registry.counter("asp_orders_updated_total", "Обновленные заявки", ("platform",))
+ORDERS_DELETED = registry.counter("asp_orders_deleted_total", "Удаленные неактуальные заявки", ("platform",))
+PUBLISHES = registry.counter("asp_publishes_total", "Публикации грузов в ATI", ("result",))
+CITY_LOOKUPS = registry.counter("asp_city_lookups_total", "Поиск ID городов ATI по источнику ответа", ("source",))
+
+def stage_timer(stage, platform=""):
+    """with stage_timer("db_write", "Transport2"): ..."""
+    return STAGE_SECONDS.time(platform=platform, stage=stage)
+
+@contextmanager
+def ati_request_timer(operation):
+    """Замеряет запрос к ATI; код ответа записывается через `result["status"]`"""
+    result = {"status": "error"}
+    with ATI_REQUEST_SECONDS.time(operation=operation):
+        try:
+            yield result
+        finally:
+            ATI_REQUESTS.inc(operation=operation, status=result["status"])
+
+def record_cycle(stats):
+    """Записывает счетчики цикла по статистике `pipeline.ingest_orders()`"""
+    platform = stats["platform"]
+    CYCLES.inc(platform=platform)
+    ORDERS_SEEN.inc(stats["seen"], platform=platform)
+    ORDERS_INSERTED.inc(stats["inserted"], platform=platform)
+    ORDERS_UPDATED.inc(stats["updated"], platform=platform)
+    ORDERS_DELETED.inc(stats["deleted"], platform=platform)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Не засоряем вывод запросами Prometheus
+
+def start_metrics_server(port=METRICS_PORT):
+    """Поднимает /metrics в фоновом потоке (для воркера). Возвращает сервер или None"""
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"📈 Метрики доступны на :{port}/metrics")
+    return server
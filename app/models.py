@@ -33,8 +33,8 @@ class Order(Base):
     external_no = Column(String, unique=True, nullable=False)  # Внешний номер заявки
     loading_city = Column(String, nullable=False)  # Город загрузки (название)
     unloading_city = Column(String, nullable=False)  # Город выгрузки (название)
-    load_date = Column(DateTime, nullable=False)  # Дата загрузки
-    unload_date = Column(DateTime, nullable=True)  # Дата выгрузки
+    load_date = Column(DateTime(timezone=True), nullable=False)  # Дата загрузки
+    unload_date = Column(DateTime(timezone=True), nullable=True)  # Дата выгрузки
     weight_volume = Column(String, nullable=True)  # Вес и объем (в одном поле)
     vehicle_type = Column(String, nullable=True)  # Тип ТС
     loading_types = Column(String, nullable=True)  # Тип загрузки/разгрузки
@@ -49,6 +49,9 @@ class Order(Base):
     loading_address = Column(String(255), nullable=True)  # ✅ поле для адреса погрузки
     unloading_address = Column(String(255), nullable=True)  # ✅ Поле для адреса выгрузки
     cargo_id = Column(String, nullable=True)  # 🆕 Сохраняем cargo_id для обновления/удаления
+    content_hash = Column(String(64), nullable=True)  # Хеш полей заявки из TMS (для пропуска неизмененных)
+    rule_id = Column(Integer, ForeignKey("distribution_rules.id", ondelete="SET NULL"), nullable=True, index=True)  # Сработавшее правило распределения
+    rule_set_version = Column(Integer, nullable=True)  # Версия набора правил на момент распределения
 
 class Logist(Base):
     __tablename__ = "logists"
@@ -78,3 +81,22 @@ class Platform(Base):
     name = Column(String, unique=True, nullable=False)  # имя площадки, например "transport2"
     enabled = Column(Boolean, default=True)  # включена или выключена площадка
     auth_data = Column(JSON, nullable=True)    # данные для авторизации (например, токены, URL и т.д.)
+
+class ScheduledPublication(Base):
+    __tablename__ = "scheduled_publications"
+    id = Column(Integer, primary_key=True)
+    external_no = Column(String, unique=True, nullable=False)  # Заявка, которую нужно опубликовать
+    publish_at = Column(DateTime, nullable=False, index=True)  # Время публикации (UTC)
+
+class RuleSetVersion(Base):
+    __tablename__ = "rule_set_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=1)  # Увеличивается при каждом изменении правил распределения
+
+class CityCache(Base):
+    __tablename__ = "ati_city_cache"
+    id = Column(Integer, primary_key=True)
+    name_key = Column(String, unique=True, nullable=False, index=True)  # Нормализованное название города
+    city_name = Column(String, nullable=False)  # Название, по которому искали в ATI
+    city_id = Column(Integer, nullable=True)  # ID города в ATI (NULL — ATI город не нашел)
+    resolved_at = Column(DateTime, nullable=False)  # Время ответа ATI (UTC)
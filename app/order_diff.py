@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from app.order_store import UPSERT_COLUMNS
+from app.transformers.datetime_normalizer import to_utc
+
+# Поля заявки из TMS, изменения которых отслеживаем (хеш — служебное поле)
+SERVICE_FIELDS = frozenset({"content_hash"})
+DIFF_FIELDS = tuple(column for column in UPSERT_COLUMNS if column not in SERVICE_FIELDS)
+
+# Поля из TMS, от которых зависит результат prepare_order_for_ati().
+# `comment` и `bid_price` в ATI не передаются — их изменение не требует обновления груза.
+# Логист, наименование груза и ставка ATI при повторной загрузке не меняются
+# (см. UPSERT_COLUMNS); грузы после изменения ставки обновляет reprice_orders().
+ATI_FIELDS = frozenset({
+    "loading_city", "unloading_city", "loading_address", "unloading_address",
+    "load_date", "unload_date", "weight_volume", "vehicle_type", "loading_types",
+    "order_type",
+})
+
+def _comparable(value):
+    """Даты сравниваем как моменты времени (в UTC), независимо от пояса"""
+    return to_utc(value) if isinstance(value, datetime) else value
+
+def diff_order(existing, row, fields=DIFF_FIELDS):
+    """Сравнивает сохраненную заявку (`existing` — словарь полей) с новой записью `row`.
+
+    Возвращает `{field: (old, new)}` только для реально изменившихся полей,
+    отсутствующие в `row` поля не сравниваются.
+    """
+    changes = {}
+    for field in fields:
+        if field not in row:
+            continue
+        old, new = existing.get(field), row[field]
+        if _comparable(old) != _comparable(new):
+            changes[field] = (old, new)
+    return changes
+
+def affects_ati(changes):
+    """True, если изменилось хотя бы одно поле, которое передается в ATI"""
+    return not ATI_FIELDS.isdisjoint(changes)
@@ -0,0 +1,184 @@
+from sqlalchemy import String, all_, bindparam, delete, literal_column, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models import Order, ScheduledPublication
+
+# Размер пачки для одного INSERT (ограничение Postgres — 65535 параметров на запрос)
+UPSERT_CHUNK_SIZE = 500
+
+# Поля, которые приходят из TMS и перезаписываются при повторной загрузке.
+# `ati_price`, `logistician_name`, `cargo_name`, `is_published` и `cargo_id`
+# не трогаем — они назначаются при создании или редактируются вручную.
+# `rule_id` и `rule_set_version` — тоже: это правило, назначившее логиста, груз и ставку;
+# все они меняются вместе в reattribute_orders() и reprice_orders().
+UPSERT_COLUMNS = (
+    "load_date", "unload_date", "loading_city", "unloading_city", "weight_volume",
+    "vehicle_type", "loading_types", "comment", "order_type", "bid_price",
+    "loading_address", "unloading_address", "content_hash",
+)
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def _dedupe_rows(rows):
+    """Оставляет первую запись для каждого external_no (как при поштучной обработке)"""
+    unique_rows = {}
+    for row in rows:
+        unique_rows.setdefault(row["external_no"], row)
+    return list(unique_rows.values())
+
+def _upsert_chunk_postgres(session: Session, chunk, update_columns):
+    """INSERT ... ON CONFLICT (external_no) DO UPDATE для одной пачки"""
+    stmt = pg_insert(Order).values(chunk)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Order.external_no],
+        set_={column: stmt.excluded[column] for column in update_columns},
+    ).returning(Order.external_no, literal_column("(xmax = 0)").label("inserted"))
+
+    inserted, updated = [], []
+    for external_no, was_inserted in session.execute(stmt):
+        (inserted if was_inserted else updated).append(external_no)
+    return inserted, updated
+
+def _upsert_chunk_generic(session: Session, chunk, update_columns):
+    """Запасной вариант для других СУБД: один SELECT и executemany на пачку"""
+    keys = [row["external_no"] for row in chunk]
+    existing_ids = dict(
+        session.query(Order.external_no, Order.id).filter(Order.external_no.in_(keys)).all()
+    )
+
+    to_insert = [row for row in chunk if row["external_no"] not in existing_ids]
+    to_update = [
+        {"id": existing_ids[row["external_no"]], **{column: row[column] for column in update_columns if column in row}}
+        for row in chunk if row["external_no"] in existing_ids
+    ]
+
+    if to_insert:
+        session.bulk_insert_mappings(Order, to_insert)
+    if to_update:
+        session.bulk_update_mappings(Order, to_update)
+
+    # В `to_update` только id и обновляемые поля — номера берем из исходных записей
+    return [row["external_no"] for row in to_insert], [row["external_no"] for row in chunk if row["external_no"] in existing_ids]
+
+def load_order_fields(session: Session, external_nos, fields):
+    """Возвращает `{external_no: {field: value}}` для существующих заявок (запрос пачками)"""
+    columns = [getattr(Order, field) for field in fields]
+    external_nos = list(external_nos)
+
+    snapshots = {}
+    for chunk in _chunks(external_nos, UPSERT_CHUNK_SIZE):
+        for row in session.query(Order.external_no, *columns).filter(Order.external_no.in_(chunk)):
+            snapshots[row[0]] = dict(zip(fields, row[1:]))
+    return snapshots
+
+def bulk_update_orders(session: Session, mappings):
+    """Обновляет заявки по `id` одним executemany на пачку и одной транзакцией.
+
+    `mappings` — список словарей {"id": ..., поле: значение}. Возвращает число строк.
+    """
+    if not mappings:
+        return 0
+    try:
+        for chunk in _chunks(mappings, UPSERT_CHUNK_SIZE):
+            session.bulk_update_mappings(Order, chunk)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return len(mappings)
+
+def bulk_upsert_orders(session: Session, rows, update_columns=UPSERT_COLUMNS):
+    """Записывает пачку заявок одной транзакцией.
+
+    Возвращает кортеж `(inserted, updated)` со списками external_no.
+    Если `update_columns=None`, обновляются все переданные поля.
+    """
+    rows = _dedupe_rows(rows)
+    if not rows:
+        return [], []
+
+    if update_columns is None:
+        update_columns = sorted({key for row in rows for key in row} - {"external_no", "id"})
+    else:
+        update_columns = [column for column in update_columns if column in rows[0]]
+
+    upsert_chunk = _upsert_chunk_postgres if session.get_bind().dialect.name == "postgresql" else _upsert_chunk_generic
+
+    inserted, updated = [], []
+    try:
+        for chunk in _chunks(rows, UPSERT_CHUNK_SIZE):
+            chunk_inserted, chunk_updated = upsert_chunk(session, chunk, update_columns)
+            inserted.extend(chunk_inserted)
+            updated.extend(chunk_updated)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    return inserted, updated
+
+def find_missing_published(session: Session, platform, active_external_nos):
+    """Опубликованные в ATI заявки площадки, которых нет в `active_external_nos`.
+
+    Возвращает строки с атрибутами `external_no` и `cargo_id` (одним запросом).
+    """
+    query = session.query(Order.external_no, Order.cargo_id).filter(
+        Order.platform == platform, Order.cargo_id.isnot(None)
+    )
+    if session.get_bind().dialect.name == "postgresql":
+        active = bindparam("active_external_nos", value=list(active_external_nos), type_=ARRAY(String))
+        return query.filter(Order.external_no != all_(active)).all()
+    return [row for row in query if row.external_no not in active_external_nos]
+
+def _delete_missing_postgres(session: Session, platform, active_external_nos):
+    """Один DELETE: список актуальных номеров передается массивом-параметром"""
+    active = bindparam("active_external_nos", value=list(active_external_nos), type_=ARRAY(String))
+    stale_filter = (Order.platform == platform, Order.external_no != all_(active))
+
+    # Отложенные публикации удаляемых заявок
+    session.execute(
+        delete(ScheduledPublication).where(
+            ScheduledPublication.external_no.in_(select(Order.external_no).where(*stale_filter))
+        ).execution_options(synchronize_session=False)
+    )
+
+    result = session.execute(
+        delete(Order).where(*stale_filter)
+        .returning(Order.external_no, Order.cargo_id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.all()
+
+def _delete_missing_generic(session: Session, platform, active_external_nos):
+    """Запасной вариант: выбираем только номера заявок площадки и удаляем пачками"""
+    rows = session.query(Order.id, Order.external_no, Order.cargo_id).filter(Order.platform == platform).all()
+    stale_rows = [row for row in rows if row.external_no not in active_external_nos]
+
+    for chunk in _chunks(stale_rows, UPSERT_CHUNK_SIZE):
+        external_nos = [row.external_no for row in chunk]
+        session.query(ScheduledPublication).filter(
+            ScheduledPublication.external_no.in_(external_nos)
+        ).delete(synchronize_session=False)
+        session.query(Order).filter(Order.id.in_([row.id for row in chunk])).delete(synchronize_session=False)
+
+    return stale_rows
+
+def delete_missing_orders(session: Session, platform, active_external_nos):
+    """Удаляет заявки площадки, которых нет в `active_external_nos`, одной транзакцией.
+
+    Грузы в ATI нужно снять заранее (см. find_missing_published). Возвращает кортеж
+    `(deleted_count, ati_rows)`, где `ati_rows` — удаленные строки, у которых все еще
+    был `cargo_id` (атрибуты `external_no` и `cargo_id`).
+    """
+    delete_missing = _delete_missing_postgres if session.get_bind().dialect.name == "postgresql" else _delete_missing_generic
+
+    try:
+        deleted_rows = delete_missing(session, platform, set(active_external_nos))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    return len(deleted_rows), [row for row in deleted_rows if row.cargo_id]
@@ -0,0 +1,45 @@
+class PlatformParser:
+    """Базовый класс парсера площадки (TMS).
+
+    Парсер только загружает и нормализует заявки, остальное (отбор изменений,
+    правила распределения, запись в БД, публикация и удаление) делает общий
+    конвейер `app.pipeline`.
+    """
+
+    name = None  # Имя площадки — пишется в `orders.platform`
+    # Типы заявок по убыванию приоритета: если заявка пришла из нескольких фидов,
+    # в БД пишется вариант с типом, указанным раньше
+    order_types = ()
+
+    def __init__(self, auth_data=None):
+        self.auth_data = auth_data or {}  # `platforms.auth_data`
+
+    def fetch(self):
+        """Загружает заявки. Возвращает кортеж `(items, complete)`.
+
+        `items` — список `(raw_order, order_type)`, `complete=False`, если какой-то
+        из источников не ответил (тогда неактуальные заявки не удаляются).
+        """
+        raise NotImplementedError
+
+    def order_key(self, raw_order):
+        """Внешний номер заявки (`orders.external_no`)"""
+        raise NotImplementedError
+
+    def order_type_rank(self, order_type):
+        """Приоритет типа заявки (меньше — важнее); неизвестные типы — в конце"""
+        try:
+            return self.order_types.index(order_type)
+        except ValueError:
+            return len(self.order_types)
+
+    def order_hash(self, raw_order, order_type):
+        """Хеш значимых полей заявки для пропуска неизмененных"""
+        raise NotImplementedError
+
+    def normalize(self, raw_order, order_type):
+        """Преобразует заявку площадки в поля таблицы `orders` (без правил распределения)"""
+        raise NotImplementedError
+
+    def close(self):
+        """Освобождает ресурсы парсера (HTTP-клиенты и т.п.)"""
@@ -0,0 +1,72 @@
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app.database import SessionLocal
+from app.models import Platform
+
+# Зарегистрированные парсеры: имя площадки (в нижнем регистре) -> "модуль:класс".
+# Модуль импортируется только в процессе площадки, поэтому ошибка одного
+# плагина (в том числе при импорте) не мешает остальным.
+PARSERS = {
+    "transport2": "app.parsers.transport2:Transport2Parser",
+}
+
+def register_parser(platform_name, parser_path):
+    """Регистрирует парсер площадки: register_parser("name", "app.parsers.name:NameParser")"""
+    PARSERS[platform_name.lower()] = parser_path
+
+def load_parser_class(platform_name):
+    """Импортирует класс парсера площадки"""
+    module_name, class_name = PARSERS[platform_name.lower()].split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+def get_enabled_platforms():
+    """Возвращает [(name, auth_data)] включенных площадок, для которых есть парсер"""
+    db = SessionLocal()
+    try:
+        platforms = db.query(Platform).filter(Platform.enabled.is_(True)).all()
+        enabled = [(platform.name, platform.auth_data) for platform in platforms]
+    finally:
+        db.close()
+
+    for name, _ in enabled:
+        if name.lower() not in PARSERS:
+            print(f"⚠️ Для площадки {name} нет парсера, пропускаем.")
+    return [(name, auth_data) for name, auth_data in enabled if name.lower() in PARSERS]
+
+def run_platform_cycle(platform_name, auth_data):
+    """Выполняется в отдельном процессе: свой движок БД, свои HTTP-пулы"""
+    from app import pipeline  # Тянет ATI-клиент и словари — нужен только в процессах площадок
+    from app.metrics import save_metrics
+    from app.publish_scheduler import publish_scheduler
+
+    parser = load_parser_class(platform_name)(auth_data)
+    db = SessionLocal()
+    try:
+        stats = pipeline.run_cycle(db, parser)
+        # Отложенные публикации площадки, срок которых уже наступил (постоянного планировщика здесь нет)
+        stats["published"] = publish_scheduler.run_due(platform=parser.name)
+        return stats
+    finally:
+        pipeline.shutdown_partition_pool()
+        parser.close()
+        db.close()
+        save_metrics("runner")  # Метрики процесса площадки (с частями пула) попадают в GET /metrics API
+
+if __name__ == "__main__":
+    # Цикл обработки всех включенных площадок, каждая — в своем процессе
+    platforms = get_enabled_platforms()
+    if not platforms:
+        print("ℹ️ Нет включенных площадок, парсинг не выполняется.")
+    else:
+        # spawn — чтобы дочерние процессы не унаследовали соединения с БД родителя
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=len(platforms), mp_context=context) as pool:
+            futures = {pool.submit(run_platform_cycle, name, auth_data): name for name, auth_data in platforms}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    print(f"✅ [{name}] Цикл завершен: {future.result()}")
+                except (Exception, SystemExit) as e:  # exit() в плагине тоже не должен ронять остальных
+                    print(f"❌ [{name}] Ошибка цикла: {e!r}")
@@ -1,14 +1,27 @@
 import os
+import json
+import hashlib
+import asyncio
+import httpx
 import requests
-import re
-from threading import Timer
+import queue
+from threading import Thread
 from datetime import datetime, timezone
 from dotenv import dotenv_values, load_dotenv
 
+try:
+    import ijson  # Потоковый разбор JSON (необязательная зависимость)
+except ImportError:
+    ijson = None
+
 # Импорт моделей, логики преобразования и работы с ATI
-from app.models import Order, DistributionRule, Platform  
-from app.transformers.ati_transformer import prepare_order_for_ati
-from app.ati_client import publish_cargo, update_cargo, delete_cargo
+from app.models import Order, Platform  
+from app.transformers.address_normalizer import extract_street_and_house
+from app.transformers.datetime_normalizer import parse_feed_datetime
+from app.order_store import UPSERT_CHUNK_SIZE
+from app.metrics import stage_timer
+from app.parsers.base import PlatformParser
+from app import pipeline
 
 # Вместо создания подключения вручную импортируем SessionLocal
 from app.database import SessionLocal
@@ -33,258 +46,401 @@ headers = {
 # Создаем сессию базы данных через SessionLocal
 session = SessionLocal()
 
+PLATFORM_NAME = "Transport2"
+
 # URL-адреса для разных типов заявок
 ASSIGNED_ORDERS_URL = "https://api.transport2.ru/carrier/graphql?operation=assignedOrders"
 AUCTION_ORDERS_URL = "https://api.transport2.ru/carrier/graphql?operation=auctionNewOrders"
 FREE_ORDERS_URL = "https://api.transport2.ru/carrier/graphql?operation=freeOrders"
 
-# Тело запросов
-assigned_payload = {
-    "query": """
-        query {
-            assignedOrders {
-                id
-                externalNo
-                loadingPlaces {
-                    storagePoint {
-                        settlement
-                        address
-                    }
-                }
-                unloadingPlaces {
-                    storagePoint {
-                        settlement
-                        address
-                    }
-                }
-                loadingDatetime
-                unloadingDatetime
-                weight
-                volume
-                loadingTypes
-                comment
-                price
-                status
-                vehicleRequirements {
-                    name
-                    bodySubtype {
-                        name
-                    }
-                }
-            }
-        }
-    """
+# Корневые поля GraphQL-запросов для каждого фида
+FEED_RESPONSE_KEYS = {
+    "ASSIGNED": "assignedOrders",
+    "AUCTION": "auctionOrders",
+    "FREE": "freeOrders",
 }
 
-auction_payload = {
-    "query": """
-        query {
-            auctionOrders {
-                id
-                externalNo
-                loadingPlaces {
-                    storagePoint {
-                        settlement
-                        address
-                    }
-                }
-                unloadingPlaces {
-                    storagePoint {
-                        settlement
-                        address
-                    }
-                }
-                loadingDatetime
-                unloadingDatetime
-                weight
-                volume
-                loadingTypes
-                comment
-                status
-                lot {
-                    auctionStatus
-                    startPrice
-                    lastBet
-                }
-                vehicleRequirements {
-                    name
-                    bodySubtype {
-                        name
-                    }
-                }
-            }
-        }
-    """
+# Статусы, которые нужны в каждом фиде (см. is_fresh_order)
+FEED_STATUSES = {
+    "ASSIGNED": ["ASSIGNED"],
+    "AUCTION": ["FREE"],
+    "FREE": ["FREE"],
+}
+
+# Поля заявки, которые читают is_fresh_order(), build_order_record() и compute_order_hash().
+# `id` и `vehicleRequirements.bodySubtype` не используются и не запрашиваются.
+# Хеш считается по полученным полям, поэтому изменение набора один раз
+# заставит первый цикл обработать все заявки заново.
+ORDER_FIELDS = (
+    "externalNo",
+    "loadingPlaces { storagePoint { settlement address } }",
+    "unloadingPlaces { storagePoint { settlement address } }",
+    "loadingDatetime",
+    "unloadingDatetime",
+    "weight",
+    "volume",
+    "loadingTypes",
+    "comment",
+    "status",
+    "vehicleRequirements { name }",
+)
+
+# Фильтрация на стороне API через переменные GraphQL (по умолчанию выключена —
+# включайте, только если схема площадки принимает эти аргументы).
+# Клиентская фильтрация в is_fresh_order() работает в любом случае. Если схема отклонит
+# аргументы, ответ с ошибками считается сбоем фида и удаление заявок пропускается.
+T2_SERVER_FILTERS = os.getenv("T2_SERVER_FILTERS", "0") == "1"
+SERVER_FILTER_ARGS = {
+    # аргумент запроса: (имя переменной, тип GraphQL)
+    "loadingDatetimeFrom": ("loadingFrom", "DateTime"),
+    "status": ("statuses", "[String!]"),
 }
 
-free_payload = {
-    "query": """
-        query {
-            freeOrders {
-                id
-                externalNo
-                loadingPlaces {
-                    storagePoint {
-                        settlement
-                        address
-                    }
-                }
-                unloadingPlaces {
-                    storagePoint {
-                        settlement
-                        address
-                    }
-                }
-                loadingDatetime
-                unloadingDatetime
-                weight
-                volume
-                loadingTypes
-                comment
-                price
-                status
-                vehicleRequirements {
-                    name
-                    bodySubtype {
-                        name
-                    }
-                }
-            }
+def build_payload(order_type, server_filters=None):
+    """Собирает тело GraphQL-запроса для фида"""
+    server_filters = T2_SERVER_FILTERS if server_filters is None else server_filters
+
+    fields = list(ORDER_FIELDS)
+    # У аукционных заявок вместо цены — лот со ставками
+    fields.append("lot { auctionStatus startPrice lastBet }" if order_type == "AUCTION" else "price")
+
+    variable_definitions = ""
+    arguments = ""
+    payload = {}
+    if server_filters:
+        values = {
+            "loadingDatetimeFrom": datetime.now(timezone.utc).isoformat(),
+            "status": FEED_STATUSES[order_type],
         }
+        variable_definitions = "(" + ", ".join(f"${var}: {gql_type}" for var, gql_type in SERVER_FILTER_ARGS.values()) + ")"
+        arguments = "(" + ", ".join(f"{arg}: ${var}" for arg, (var, _) in SERVER_FILTER_ARGS.items()) + ")"
+        payload["variables"] = {var: values[arg] for arg, (var, _) in SERVER_FILTER_ARGS.items()}
+
+    selection = "\n                ".join(fields)
+    payload["query"] = f"""
+        query{variable_definitions} {{
+            {FEED_RESPONSE_KEYS[order_type]}{arguments} {{
+                {selection}
+            }}
+        }}
     """
-}
+    return payload
 
-def fetch_orders(url, payload, is_auction=False, is_free=False):
-    """Запрашивает только актуальные заявки и фильтрует сразу при загрузке"""
-    try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        data = response.json()
-
-        if response.status_code != 200 or not data.get("data"):
-            print(f"⚠️ Ошибка или пустой ответ от API {url}")
-            return []
-
-        orders = data["data"].get("assignedOrders", []) if not is_auction and not is_free else \
-                 data["data"].get("auctionOrders", []) if is_auction else \
-                 data["data"].get("freeOrders", [])
-
-        current_datetime = datetime.now(timezone.utc)  # Текущее время в UTC
-
-        fresh_orders = []
-        for order in orders:
-            # Проверка даты отгрузки
-            loading_datetime_str = order.get("loadingDatetime")
-            if not loading_datetime_str:
-                continue
-
-            loading_datetime = datetime.fromisoformat(loading_datetime_str)
-            if loading_datetime < current_datetime:
-                continue  # Пропускаем старые заявки
-
-            # Фильтрация по статусу
-            if is_auction:
-                if order.get("status") != "FREE" or order.get("lot", {}).get("auctionStatus") != "ACTIVE":
-                    continue
-            elif is_free:
-                if order.get("status") != "FREE":
-                    continue
-            else:  # Assigned
-                if order.get("status") != "ASSIGNED":
-                    continue
-
-            fresh_orders.append(order)
-
-        print(f"✅ Загружено {len(fresh_orders)} актуальных заявок ({'Аукцион' if is_auction else 'Свободные' if is_free else 'Назначенные'})")
-        return fresh_orders
-
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Ошибка запроса {url}: {e}")
-        return []
+# Тело запросов (статические, без фильтров на стороне API)
+assigned_payload = build_payload("ASSIGNED", server_filters=False)
+auction_payload = build_payload("AUCTION", server_filters=False)
+free_payload = build_payload("FREE", server_filters=False)
 
-def process_orders():
-    """Основная функция обработки заявок"""
-    assigned_orders = fetch_orders(ASSIGNED_ORDERS_URL, assigned_payload)  # ✅ Уже список
-    auction_orders = fetch_orders(AUCTION_ORDERS_URL, auction_payload, is_auction=True)  # ✅ Уже список
-    free_orders = fetch_orders(FREE_ORDERS_URL, free_payload, is_free=True)  # ✅ Уже список
-    
-    all_orders = (
-        [(order, "ASSIGNED") for order in assigned_orders] +
-        [(order, "AUCTION") for order in auction_orders] +
-        [(order, "FREE") for order in free_orders]
-    )
-   
-    for order, order_type in all_orders:
-        process_order(order, order_type)
-
-    delete_old_orders(assigned_orders, auction_orders, free_orders)
-    
-def extract_street_and_house(address, include_house_number=True):
-    """Извлекает улицу и дом из строки адреса.
-    
-    - `include_house_number=True` → улица + номер дома (для unloading_address).
-    - `include_house_number=False` → только улица (для loading_address).
+def feed_order_type(is_auction=False, is_free=False):
+    return "AUCTION" if is_auction else "FREE" if is_free else "ASSIGNED"
+
+# Таймауты для каждого фида (секунды), можно переопределить через .env
+FEED_TIMEOUTS = {
+    "ASSIGNED": float(os.getenv("T2_ASSIGNED_TIMEOUT", 30)),
+    "AUCTION": float(os.getenv("T2_AUCTION_TIMEOUT", 30)),
+    "FREE": float(os.getenv("T2_FREE_TIMEOUT", 30)),
+}
+T2_CONNECT_TIMEOUT = float(os.getenv("T2_CONNECT_TIMEOUT", 10))
+
+def is_fresh_order(order, current_datetime, is_auction=False, is_free=False):
+    """Проверяет, что заявка актуальна и имеет нужный статус"""
+    # Проверка даты отгрузки
+    loading_datetime = parse_feed_datetime(order.get("loadingDatetime"))
+    if not loading_datetime:
+        return False
+
+    if loading_datetime < current_datetime:
+        return False  # Пропускаем старые заявки
+
+    # Фильтрация по статусу
+    if is_auction:
+        return order.get("status") == "FREE" and order.get("lot", {}).get("auctionStatus") == "ACTIVE"
+    elif is_free:
+        return order.get("status") == "FREE"
+    else:  # Assigned
+        return order.get("status") == "ASSIGNED"
+
+def filter_fresh_orders(orders, is_auction=False, is_free=False):
+    """Оставляет только актуальные заявки нужного статуса"""
+    current_datetime = datetime.now(timezone.utc)  # Текущее время в UTC
+    return [order for order in orders if is_fresh_order(order, current_datetime, is_auction=is_auction, is_free=is_free)]
+
+class FeedResponseError(ValueError):
+    """Ответ GraphQL с ошибками или без данных фида: фид считается не загруженным"""
+
+def graphql_error_messages(errors):
+    return "; ".join(str(error.get("message", error)) if isinstance(error, dict) else str(error) for error in errors)
+
+def parse_orders_response(url, data, is_auction=False, is_free=False):
+    """Достает список заявок из ответа GraphQL и фильтрует его.
+
+    Ошибки GraphQL (например, схема не приняла фильтры) и ответ без данных фида
+    вызывают FeedResponseError — пустой список удалил бы все заявки фида.
     """
+    response_key = FEED_RESPONSE_KEYS[feed_order_type(is_auction, is_free)]
+    if data.get("errors"):
+        raise FeedResponseError(f"ошибка GraphQL: {graphql_error_messages(data['errors'])}")
+    orders = (data.get("data") or {}).get(response_key)
+    if orders is None:
+        raise FeedResponseError(f"в ответе нет поля {response_key}")
 
-    if not address:
-        return None
+    with stage_timer("parse", PLATFORM_NAME):
+        fresh_orders = filter_fresh_orders(orders, is_auction=is_auction, is_free=is_free)
 
-    # Удаляем текст в скобках (например, "(Екатеринбург)")
-    address = re.sub(r"\(.*?\)|\bориентир\b", "", address).strip()  
+    print(f"✅ Загружено {len(fresh_orders)} актуальных заявок ({'Аукцион' if is_auction else 'Свободные' if is_free else 'Назначенные'})")
+    return fresh_orders
 
-    # Разбиваем строку на части
-    parts = [part.strip() for part in address.split(",")]
+def fetch_orders(url, payload=None, is_auction=False, is_free=False, errors=None):
+    """Запрашивает только актуальные заявки и фильтрует сразу при загрузке.
+
+    При ошибке запроса url добавляется в `errors` (если передан список).
+    Без `payload` тело запроса собирается заново (с текущими фильтрами).
+    """
+    payload = payload or build_payload(feed_order_type(is_auction, is_free))
+    try:
+        with stage_timer("fetch", PLATFORM_NAME):
+            response = requests.post(url, headers=headers, json=payload)
+            response.raise_for_status()
+            data = response.json()
+        return parse_orders_response(url, data, is_auction=is_auction, is_free=is_free)
 
-    # Ключевые слова для поиска улицы
-    street_keywords = ["ул", "улица", "пр-кт", "проспект", "тракт", "шоссе", "ш", "пер", "переулок", "проезд"]
+    except (requests.exceptions.RequestException, FeedResponseError) as e:
+        print(f"❌ Ошибка запроса {url}: {e}")
+        if errors is not None:
+            errors.append(url)
+        return []
 
-    # Ключевые слова для населенного пункта (чтобы пропустить его и взять следующее поле)
-    city_keywords = ["г", "город", "пос", "поселок", "д", "деревня", "пгт", "с", "село", "ст", "станция"]
+async def fetch_orders_async(client, url, payload, timeout, is_auction=False, is_free=False, errors=None):
+    """Асинхронный вариант `fetch_orders()` поверх общего `httpx.AsyncClient`.
 
-    street_part = None
-    house_number = None
-    city_found = False
+    При ошибке запроса url добавляется в `errors` (если передан список).
+    Без `payload` тело запроса собирается заново (с текущими фильтрами).
+    """
+    payload = payload or build_payload(feed_order_type(is_auction, is_free))
+    try:
+        with stage_timer("fetch", PLATFORM_NAME):
+            response = await client.post(
+                url, json=payload, timeout=httpx.Timeout(timeout, connect=T2_CONNECT_TIMEOUT)
+            )
+            response.raise_for_status()
+            data = response.json()
+        return parse_orders_response(url, data, is_auction=is_auction, is_free=is_free)
+
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"❌ Ошибка запроса {url}: {e}")
+        if errors is not None:
+            errors.append(url)
+        return []
 
-    # 1️⃣ **Сначала ищем улицу по ключевым словам**
-    for part in parts:
-        words = part.split()
+def create_async_client(client_headers=None):
+    """Создает keep-alive клиент для запросов к Transport2"""
+    limits = httpx.Limits(max_connections=10, max_keepalive_connections=3)
+    return httpx.AsyncClient(headers=client_headers or headers, limits=limits)
 
-        if any(word.lower() in street_keywords for word in words):
-            # Нашли улицу! Теперь удаляем "ул", "улица" и сохраняем
-            street_part = " ".join([word for word in words if word.lower() not in ["ул", "улица"]]).strip()
-            break  # Останавливаемся после нахождения первой улицы
+async def fetch_all_orders(client=None, errors=None, client_headers=None):
+    """Запрашивает все три фида одновременно. Возвращает (assigned, auction, free)"""
+    own_client = client is None
+    if own_client:
+        client = create_async_client(client_headers)
 
-    # 2️⃣ **Если улица не найдена, ищем первое поле после города**
-    if not street_part:
-        for part in parts:
-            words = part.split()
+    try:
+        assigned_orders, auction_orders, free_orders = await asyncio.gather(
+            fetch_orders_async(client, ASSIGNED_ORDERS_URL, None, FEED_TIMEOUTS["ASSIGNED"], errors=errors),
+            fetch_orders_async(client, AUCTION_ORDERS_URL, None, FEED_TIMEOUTS["AUCTION"], is_auction=True, errors=errors),
+            fetch_orders_async(client, FREE_ORDERS_URL, None, FEED_TIMEOUTS["FREE"], is_free=True, errors=errors),
+        )
+    finally:
+        if own_client:
+            await client.aclose()
+
+    return assigned_orders, auction_orders, free_orders
+
+# Потоковый режим: заявки читаются из ответа по одной, без загрузки всего JSON в память
+T2_STREAMING = os.getenv("T2_STREAMING", "0") == "1"
+STREAM_QUEUE_SIZE = 1000  # Сколько заявок может ждать обработки (ограничивает память)
+_STREAM_DONE = object()
+
+# (order_type, url, payload, is_auction, is_free); payload=None — собирается на каждый запрос
+FEEDS = (
+    ("ASSIGNED", ASSIGNED_ORDERS_URL, None, False, False),
+    ("AUCTION", AUCTION_ORDERS_URL, None, True, False),
+    ("FREE", FREE_ORDERS_URL, None, False, True),
+)
+
+def watch_graphql_events(events, data_prefix, state):
+    """Пропускает события ijson дальше, отмечая в `state` массив заявок фида и ошибки GraphQL"""
+    for prefix, event, value in events:
+        if prefix == data_prefix and event == "start_array":
+            state["data"] = True
+        elif prefix == "errors.item" and event == "start_map":
+            state["errors"] += 1
+        yield prefix, event, value
+
+def iter_orders_stream(url, payload, is_auction=False, is_free=False, errors=None):
+    """Генератор актуальных заявок одного фида, JSON разбирается инкрементально.
+
+    При ошибке запроса, ошибке GraphQL или ответе без данных фида url добавляется
+    в `errors` (если передан список). Заявки, полученные до ошибки, уже отданы.
+    """
+    order_type = feed_order_type(is_auction, is_free)
+    payload = payload or build_payload(order_type)
 
-            # Если нашли населенный пункт, ставим флаг `city_found`
-            if any(word.lower() in city_keywords for word in words):
-                city_found = True
-                continue
+    if ijson is None:
+        # Без ijson потоковый разбор недоступен — отдаем обычный список
+        print("⚠️ ijson не установлен, потоковый режим работает без инкрементального разбора")
+        yield from fetch_orders(url, payload, is_auction=is_auction, is_free=is_free, errors=errors)
+        return
 
-            # Если город найден и следующее поле похоже на улицу → берем его
-            if city_found:
-                street_part = part
-                break
+    current_datetime = datetime.now(timezone.utc)
+    data_prefix = f"data.{FEED_RESPONSE_KEYS[order_type]}"
+    state = {"data": False, "errors": 0}
+    count = 0
 
-    # Если улица найдена и нужно добавить номер дома
-    if include_house_number and street_part:
-        for next_part in parts[parts.index(part) + 1:]:
-            if re.search(r"\d", next_part):  # Если есть цифра – это номер дома
-                house_number = next_part
-                break  # Берем первый найденный номер
+    try:
+        timeout = (T2_CONNECT_TIMEOUT, FEED_TIMEOUTS[order_type])
+        with requests.post(url, headers=headers, json=payload, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True  # Распаковка gzip на лету
+
+            events = watch_graphql_events(ijson.parse(response.raw, use_float=True), data_prefix, state)
+            for order in ijson.items(events, f"{data_prefix}.item"):
+                if is_fresh_order(order, current_datetime, is_auction=is_auction, is_free=is_free):
+                    count += 1
+                    yield order
+
+        if state["errors"]:
+            raise FeedResponseError(f"ошибок GraphQL в ответе: {state['errors']}")
+        if not state["data"]:
+            raise FeedResponseError(f"в ответе нет поля {FEED_RESPONSE_KEYS[order_type]}")
+
+    except (requests.exceptions.RequestException, ijson.JSONError, FeedResponseError) as e:
+        print(f"❌ Ошибка потокового запроса {url}: {e}")
+        if errors is not None:
+            errors.append(url)
+
+    print(f"✅ Получено {count} актуальных заявок ({'Аукцион' if is_auction else 'Свободные' if is_free else 'Назначенные'}, поток)")
+
+def iter_all_orders_stream(errors=None):
+    """Генератор (order, order_type) по всем фидам.
+
+    Фиды читаются параллельно в отдельных потоках, заявки передаются через
+    ограниченную очередь, поэтому в памяти одновременно не больше STREAM_QUEUE_SIZE заявок.
+    """
+    buffer = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+    def produce(order_type, url, payload, is_auction, is_free):
+        try:
+            for order in iter_orders_stream(url, payload, is_auction=is_auction, is_free=is_free, errors=errors):
+                buffer.put((order, order_type))
+        finally:
+            buffer.put(_STREAM_DONE)
+
+    threads = [Thread(target=produce, args=feed, daemon=True) for feed in FEEDS]
+    for thread in threads:
+        thread.start()
+
+    finished = 0
+    while finished < len(threads):
+        item = buffer.get()
+        if item is _STREAM_DONE:
+            finished += 1
+            continue
+        yield item
+
+# Поля заявки Transport2, изменение которых требует обработки (вложенные — в проекции ORDER_FIELDS)
+HASHED_FIELDS = (
+    "externalNo", "loadingPlaces", "unloadingPlaces", "loadingDatetime", "unloadingDatetime",
+    "weight", "volume", "loadingTypes", "comment", "price", "status", "lot", "vehicleRequirements",
+)
+
+def compute_order_hash(order, order_type):
+    """Канонический sha256-хеш значимых полей заявки"""
+    payload = {field: order.get(field) for field in HASHED_FIELDS}
+    payload["orderType"] = order_type
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def process_orders(streaming=T2_STREAMING):
+    """Основная функция обработки заявок"""
+    if streaming:
+        return process_orders_stream()
 
-    # Формируем итоговый результат
-    result = f"{street_part} {house_number}" if include_house_number and house_number else street_part
+    # Все три фида загружаются параллельно, дальше — общий конвейер
+    return pipeline.run_cycle(session, transport2_parser)
 
-    return result
+def process_orders_stream():
+    """Потоковая обработка: заявки идут из фидов прямо в пакетную запись.
 
-def process_order(order, order_type):
-    """Обрабатываем заказ и сохраняем в БД без преобразования для АТИ"""
+    Фиды читаются параллельно, поэтому дубль заявки из фида с более высоким
+    приоритетом (Transport2Parser.order_types) может прийти позже. Чтобы результат
+    не зависел от порядка, заявка с типом ниже сохраненного откладывается до конца
+    потока и пишется, только если вариант с более высоким приоритетом так и не пришел.
+    """
+    rank = transport2_parser.order_type_rank
+    known = {
+        external_no: (content_hash, order_type)
+        for external_no, content_hash, order_type in session.query(Order.external_no, Order.content_hash, Order.order_type)
+        .filter(Order.platform == PLATFORM_NAME)
+    }
+    accepted = {}  # external_no -> order_type, принятый в этом цикле
+    deferred = {}  # external_no -> (order, order_type) с типом ниже сохраненного
+    pending_orders = {}  # external_no -> (order, order_type, order_hash), ждут записи
+    written = set()  # Уже записанные в этом цикле
+    feed_errors = []
+    skipped = 0
+
+    def accept(external_no, order, order_type):
+        nonlocal skipped, pending_orders
+        accepted[external_no] = order_type
+        order_hash = compute_order_hash(order, order_type)
+        if known.get(external_no, (None,))[0] == order_hash and external_no not in written:
+            pending_orders.pop(external_no, None)
+            skipped += 1
+            return  # Заявка не менялась с прошлого опроса
+
+        # Дубль с более высоким приоритетом заменяет еще не записанный вариант
+        pending_orders[external_no] = (order, order_type, order_hash)
+        if len(pending_orders) >= UPSERT_CHUNK_SIZE:
+            process_orders_batch(list(pending_orders.values()))
+            written.update(pending_orders)
+            pending_orders = {}
+
+    for order, order_type in iter_all_orders_stream(errors=feed_errors):
+        external_no = order.get("externalNo")
+        if external_no in accepted and rank(accepted[external_no]) <= rank(order_type):
+            continue  # Вариант с тем же или более высоким приоритетом уже принят
+
+        stored_type = known.get(external_no, (None, None))[1]
+        if external_no not in accepted and stored_type and rank(order_type) > rank(stored_type):
+            previous = deferred.get(external_no)
+            if previous is None or rank(order_type) < rank(previous[1]):
+                deferred[external_no] = (order, order_type)
+            continue
+
+        deferred.pop(external_no, None)
+        accept(external_no, order, order_type)
+
+    # Заявки, которые действительно сменили тип (варианта с прежним типом в фидах нет)
+    for external_no, (order, order_type) in deferred.items():
+        if external_no not in accepted:
+            accept(external_no, order, order_type)
+
+    if pending_orders:
+        process_orders_batch(list(pending_orders.values()))
+
+    active_external_nos = set(accepted)
+    print(f"⏭ Пропущено {skipped} неизмененных заявок из {len(active_external_nos)}")
+
+    # Если фид оборвался на середине, список актуальных заявок неполный
+    if feed_errors:
+        print("⚠️ Не все фиды загружены полностью, удаление неактуальных заявок пропущено.")
+        return
+
+    delete_stale_orders(active_external_nos)
+
+def build_order_record(order, order_type):
+    """Преобразует заявку Transport2 в поля таблицы `orders` (логиста назначает конвейер)"""
     external_no = order.get("externalNo", "N/A")
-    existing_order = session.query(Order).filter(Order.external_no == external_no).first()
 
     # Город погрузки и выгрузки
     loading_place = order.get("loadingPlaces", [{}])[0].get("storagePoint", {})
@@ -296,9 +452,9 @@ def process_order(order, order_type):
     loading_address = extract_street_and_house(loading_place.get("address"), include_house_number=False)  # ✅ Только улица
     unloading_address = extract_street_and_house(unloading_place.get("address"), include_house_number=True)  # ✅ Улица + дом
 
-    # Даты
-    load_date = order.get("loadingDatetime", "N/A")
-    unload_date = order.get("unloadingDatetime", "N/A")
+    # Даты (с часовым поясом; пустые → None)
+    load_date = parse_feed_datetime(order.get("loadingDatetime"))
+    unload_date = parse_feed_datetime(order.get("unloadingDatetime"))
 
     # Вес и объем
     weight = order.get("weight", 0)
@@ -321,156 +477,39 @@ def process_order(order, order_type):
     else:
         bid_price = order.get("price", 0)  # Для обычных заявок берем price
 
-    # Определение логиста по правилам распределения 
-    # 🛠 1. Ищем точное совпадение по погрузке и выгрузке
-    rule = session.query(DistributionRule).filter(
-        DistributionRule.loading_city == loading_city,
-        DistributionRule.unloading_city == unloading_city
-    ).first()
-
-    # 🛠 2. Если точного совпадения нет, ищем совпадение только по погрузке
-    if not rule:
-        rule = session.query(DistributionRule).filter(
-            DistributionRule.loading_city == loading_city,
-            DistributionRule.unloading_city.is_(None)  # Универсальное правило для выгрузки
-        ).first()
-
-    # 🛠 3. Если нет совпадений, ищем правило, где загрузка `None` (универсальное)
-    if not rule:
-        rule = session.query(DistributionRule).filter(
-            DistributionRule.loading_city.is_(None),
-            DistributionRule.unloading_city == unloading_city
-        ).first()
-
-    # 🛠 4. Если все еще нет совпадений, ищем **полностью универсальное** правило (`None` и для загрузки, и для выгрузки)
-    if not rule:
-        rule = session.query(DistributionRule).filter(
-            DistributionRule.loading_city.is_(None),
-            DistributionRule.unloading_city.is_(None)
-        ).first()
-
-    # 🛠 5. Назначаем логиста
-    logistician_name = rule.logistician if rule else None
-
-    if not logistician_name:
-        print(f"❌ Логист не найден для {loading_city} -> {unloading_city}")
-
-    # Получаем наименование груза по правилам распределения
-    cargo_name = rule.cargo_name if rule and rule.cargo_name else "ТНП"
-
-    # Рассчитываем `ati_price`
-    ati_price = None
-    if rule and bid_price:  # Проверяем, что rule найден и есть цена
-        margin_percent = rule.auction_margin_percent if order_type == "AUCTION" else rule.margin_percent
-        if margin_percent is not None:
-            ati_price = bid_price * (100 - margin_percent) / 100    
-
-
-    publish_delay = rule.publish_delay if rule and rule.publish_delay else 0
-
-    if existing_order:
-        print(f"🔄 Обновление заявки {external_no}")
-
-        # ✅ Проверяем, изменялись ли критические поля
-        is_updated = (
-            existing_order.load_date != load_date or
-            existing_order.unload_date != unload_date or
-            existing_order.weight_volume != weight_volume or
-            existing_order.vehicle_type != vehicle_type or
-            existing_order.loading_types != loading_types or
-            existing_order.bid_price != bid_price or  # ✅ Теперь проверяем `bid_price`
-            existing_order.loading_city != loading_city or  # ✅ Теперь проверяем `loading_city`
-            existing_order.unloading_city != unloading_city or  # ✅ Теперь проверяем `unloading_city`
-            existing_order.loading_address != loading_address or  # ✅ Проверяем `loading_address`
-            existing_order.unloading_address != unloading_address or  # ✅ Проверяем `unloading_address`
-            (existing_order.ati_price != order.get("price") if existing_order.ati_price else False)  # ✅ `ati_price` не перезаписывается, если редактировался вручную
-        )
+    return {
+        "external_no": external_no,
+        "platform": PLATFORM_NAME,
+        "load_date": load_date,
+        "unload_date": unload_date,
+        "loading_city": loading_city,
+        "unloading_city": unloading_city,
+        "weight_volume": weight_volume,
+        "vehicle_type": vehicle_type,
+        "loading_types": loading_types,
+        "comment": comment,
+        "ati_price": order.get("price"),
+        "is_published": False,
+        "order_type": order_type,
+        "bid_price": bid_price,
+        "loading_address": loading_address,  # ✅ Только улица
+        "unloading_address": unloading_address,  # ✅ Улица + дом
+    }
 
-        if existing_order.is_published and rule and rule.auto_publish and is_updated:
-            print(f"🚀 Авто-обновление заявки {external_no} в ATI")
-            cargo_data = prepare_order_for_ati(existing_order)
-            update_cargo(cargo_data)  # ✅ `update_cargo()` выполняется без задержки
+def process_orders_batch(pending_orders):
+    """Пакетная обработка: все заявки цикла пишутся одним upsert в одной транзакции.
 
-        session.commit()
-    
-    else:
-        # ✅ Создание новой заявки
-        new_order = Order(
-            external_no=external_no,
-            platform="Transport2",
-            load_date=load_date,
-            unload_date=unload_date,
-            loading_city=loading_city,  # ✅ Добавили `loading_city`
-            unloading_city=unloading_city,  # ✅ Добавили `unloading_city`
-            weight_volume=weight_volume,
-            vehicle_type=vehicle_type,
-            loading_types=loading_types,
-            comment=comment,
-            cargo_name=cargo_name,
-            logistician_name=logistician_name,
-            ati_price=order.get("price"),
-            is_published=False,
-            order_type=order_type,
-            bid_price=bid_price,
-            loading_address=loading_address,  # ✅ Теперь только улица
-            unloading_address=unloading_address  # ✅ Теперь улица + дом
-        )
-        session.add(new_order)
-        session.commit()
-        print(f"➕ Добавлена новая заявка {external_no}")
-
-        if rule:
-            # Выбираем авто-публикацию в зависимости от типа заявки
-            auto_publish_flag = rule.auto_publish_auction if order_type == "AUCTION" else rule.auto_publish
-            if auto_publish_flag:
-                print(f"🚀 Авто-публикация заявки {external_no} через {publish_delay} минут.")
-                if publish_delay == 0:
-                    publish_now(external_no)
-                else:
-                    Timer(publish_delay * 60, publish_now, args=[external_no]).start()
+    `pending_orders` — список кортежей (order, order_type, order_hash).
+    """
+    return pipeline.write_orders_batch(session, transport2_parser, pending_orders)
 
 def publish_now(external_no):
     """Публикует заявку в ATI, если она есть в БД"""
-    order = session.query(Order).filter(Order.external_no == external_no).first()
-    
-    if not order:
-        print(f"⚠️ Ошибка: Заявка {external_no} не найдена в БД, публикация отменена.")
-        return
-
-    cargo_data = prepare_order_for_ati(order)
-    response = publish_cargo(cargo_data)
-
-    if response and "cargo_id" in response:
-        order.cargo_id = response["cargo_id"]
-        order.is_published = response["cargo_number"]
-        session.commit()
-        print(f"✅ Заявка {external_no} успешно опубликована в ATI: {response['cargo_number']}")
-    else:
-        print(f"❌ Ошибка публикации заявки {external_no}.")
-
-def delete_old_orders(assigned_orders, auction_orders, free_orders):
-    """Удаляет заявки, которых больше нет в TMS"""
-
-    active_external_nos = {
-        order["externalNo"] for order in assigned_orders + auction_orders + free_orders
-    }
+    pipeline.publish_now(session, external_no)
 
-    db_orders = session.query(Order).all()  
-    to_delete = [order for order in db_orders if order.external_no not in active_external_nos]
-
-    if not to_delete:
-        print("✅ Нет заявок для удаления.")
-        return
-
-    for order in to_delete:
-        if order.cargo_id:
-            print(f"🗑 Удаляем заявку {order.external_no} из ATI")
-            delete_cargo(order)  # ✅ Теперь передаем `order` целиком
-
-        session.delete(order)  # ✅ Теперь безопасно удаляем из БД
-
-    session.commit()
-    print(f"🗑 Удалено {len(to_delete)} неактуальных заявок")
+def delete_stale_orders(active_external_nos):
+    """Удаляет заявки площадки, external_no которых нет в `active_external_nos`"""
+    return pipeline.delete_stale_orders(session, PLATFORM_NAME, active_external_nos)
 
 def save_order(order_data):
     """Сохраняем или обновляем данные в таблицу `orders`"""
@@ -495,8 +534,45 @@ def is_platform_enabled(platform_name: str) -> bool:
     db.close()
     return platform.enabled if platform else False
 
+class Transport2Parser(PlatformParser):
+    """Плагин площадки Transport2: три GraphQL-фида (назначенные, аукцион, свободные)"""
+
+    name = PLATFORM_NAME
+    order_types = ("ASSIGNED", "AUCTION", "FREE")  # Аукционный лот точнее, чем та же заявка в свободных
+
+    def __init__(self, auth_data=None):
+        super().__init__(auth_data)
+        # Токен из `platforms.auth_data` имеет приоритет над .env
+        token = self.auth_data.get("token")
+        self.headers = {**headers, "Authorization": f"Token {token}"} if token else headers
+
+    def fetch(self):
+        errors = []
+        assigned_orders, auction_orders, free_orders = asyncio.run(
+            fetch_all_orders(errors=errors, client_headers=self.headers)
+        )
+        items = (
+            [(order, "ASSIGNED") for order in assigned_orders] +
+            [(order, "AUCTION") for order in auction_orders] +
+            [(order, "FREE") for order in free_orders]
+        )
+        return items, not errors
+
+    def order_key(self, raw_order):
+        return raw_order.get("externalNo")
+
+    def order_hash(self, raw_order, order_type):
+        return compute_order_hash(raw_order, order_type)
+
+    def normalize(self, raw_order, order_type):
+        return build_order_record(raw_order, order_type)
+
+transport2_parser = Transport2Parser()
+
 if __name__ == "__main__":
-    if is_platform_enabled("Transport2"):
+    if is_platform_enabled(PLATFORM_NAME):
         process_orders()  # Ваша функция парсинга
+        pipeline.shutdown_partition_pool()
+        publish_scheduler.run_due()  # Отложенные публикации, срок которых уже наступил
     else:
         print("Площадка transport2 отключена, парсинг не выполняется.") 
\ No newline at end of file
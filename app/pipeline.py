@@ -0,0 +1,340 @@
+import os
+import zlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import Order
+from app.distribution_rules import RuleEngine
+from app.order_store import bulk_upsert_orders, delete_missing_orders, find_missing_published, load_order_fields
+from app.order_diff import DIFF_FIELDS, diff_order, affects_ati
+from app.transformers.ati_transformer import prepare_order_for_ati
+from app.ati_client import publish_cargo, update_cargo, delete_cargos, ati_rate_limiter, ATI_MAX_CONCURRENCY
+from app.publish_scheduler import publish_scheduler
+from app.city_cache import prewarm_city_ids
+from app.metrics import registry, stage_timer, record_cycle
+
+# Общий конвейер обработки заявок: парсер площадки (app/parsers/base.py) отдает
+# сырые заявки, а отбор изменений, правила распределения, запись в БД,
+# авто-публикация и удаление неактуальных заявок выполняются здесь.
+
+
+# Многопроцессная обработка больших циклов: заявки делятся по хешу external_no
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", 0))  # 0 или 1 — в одном процессе
+PARTITION_MIN_ORDERS = int(os.getenv("PARTITION_MIN_ORDERS", 2000))  # Меньшие циклы не делим
+
+def load_order_hashes(session: Session, platform):
+    """Возвращает {external_no: content_hash} для всех заявок площадки"""
+    rows = session.query(Order.external_no, Order.content_hash).filter(Order.platform == platform).all()
+    return {external_no: content_hash for external_no, content_hash in rows}
+
+def dedupe_items(parser, items):
+    """Одна запись на заявку: при дублях из разных фидов остается тип с высшим приоритетом.
+
+    Выбор не зависит от порядка фидов — иначе тип и хеш заявки менялись бы каждый цикл.
+    """
+    best = {}
+    for raw_order, order_type in items:
+        key = parser.order_key(raw_order)
+        current = best.get(key)
+        if current is None or parser.order_type_rank(order_type) < parser.order_type_rank(current[1]):
+            best[key] = (raw_order, order_type)
+    return list(best.values())
+
+def select_changed_orders(session: Session, parser, items, known_hashes=None):
+    """Отбирает новые и изменившиеся заявки. Возвращает список (raw_order, order_type, order_hash)"""
+    # Хеши всех заявок площадки загружаем одним запросом
+    if known_hashes is None:
+        known_hashes = load_order_hashes(session, parser.name)
+    skipped = 0
+    items = dedupe_items(parser, items)
+
+    pending_orders = []
+
+    with stage_timer("filter", parser.name):
+        for raw_order, order_type in items:
+            order_hash = parser.order_hash(raw_order, order_type)
+            if known_hashes.get(parser.order_key(raw_order)) == order_hash:
+                skipped += 1
+                continue  # Заявка не менялась с прошлого опроса
+            pending_orders.append((raw_order, order_type, order_hash))
+
+    print(f"⏭ [{parser.name}] Пропущено {skipped} неизмененных заявок из {len(items)}")
+    return pending_orders
+
+def assign_rule(row, match, version=None):
+    """Записывает результат правил в запись заявки: логист, наименование груза и сработавшее правило"""
+    row["logistician_name"] = match.logistician
+    row["rule_id"] = match.rule.id if match.rule else None
+    row["rule_set_version"] = version
+
+    if not row["logistician_name"]:
+        print(f"❌ Логист не найден для {row['loading_city']} -> {row['unloading_city']}")
+
+    row["cargo_name"] = match.cargo_name
+    return match.rule
+
+def publish_now(session: Session, external_no):
+    """Публикует заявку в ATI, если она есть в БД"""
+    order = session.query(Order).filter(Order.external_no == external_no).first()
+
+    if not order:
+        print(f"⚠️ Ошибка: Заявка {external_no} не найдена в БД, публикация отменена.")
+        return
+
+    cargo_data = prepare_order_for_ati(order)
+    response = publish_cargo(cargo_data)
+
+    if response and "cargo_id" in response:
+        order.cargo_id = response["cargo_id"]
+        order.is_published = response["cargo_number"]
+        session.commit()
+        print(f"✅ Заявка {external_no} успешно опубликована в ATI: {response['cargo_number']}")
+    else:
+        print(f"❌ Ошибка публикации заявки {external_no}.")
+
+def schedule_auto_publish(session: Session, external_no, order_type, rule):
+    """Запускает авто-публикацию новой заявки, если она включена в правиле"""
+    if not rule:
+        return
+
+    # Выбираем авто-публикацию в зависимости от типа заявки
+    auto_publish_flag = rule.auto_publish_auction if order_type == "AUCTION" else rule.auto_publish
+    if not auto_publish_flag:
+        return
+
+    publish_delay = rule.publish_delay if rule.publish_delay else 0
+    print(f"🚀 Авто-публикация заявки {external_no} через {publish_delay} минут.")
+    if publish_delay == 0:
+        publish_now(session, external_no)
+    else:
+        publish_scheduler.schedule(external_no, publish_delay)  # Задача сохраняется в БД
+
+def write_orders_batch(session: Session, parser, pending_orders):
+    """Пакетная обработка: все заявки пишутся одним upsert в одной транзакции.
+
+    `pending_orders` — список кортежей (raw_order, order_type, order_hash).
+    Возвращает `(inserted, updated)` со списками external_no.
+    """
+    rows = []
+    with stage_timer("normalize", parser.name):
+        for raw_order, order_type, order_hash in pending_orders:
+            row = parser.normalize(raw_order, order_type)
+            row["content_hash"] = order_hash
+            rows.append((row, order_type))
+
+    rules = {}
+    with stage_timer("rules", parser.name):
+        # Правила и логисты — одним набором на пачку (правила могли измениться через API)
+        engine = RuleEngine.load(session)
+        matches = engine.match_many([row for row, _ in rows])
+        for (row, order_type), match in zip(rows, matches):
+            rule = assign_rule(row, match, engine.version)
+            rules.setdefault(row["external_no"], (rule, order_type))
+    rows = [row for row, _ in rows]
+
+    with stage_timer("db_write", parser.name):
+        # Текущие значения полей (до записи) — чтобы знать, что именно изменилось
+        snapshots = load_order_fields(session, rules.keys(), DIFF_FIELDS + ("is_published",))
+        changes = {}
+        for row in rows:
+            if row["external_no"] in snapshots and row["external_no"] not in changes:
+                changes[row["external_no"]] = diff_order(snapshots[row["external_no"]], row)
+
+        inserted, updated = bulk_upsert_orders(session, rows)
+    print(f"💾 [{parser.name}] Пакетная запись: добавлено {len(inserted)}, обновлено {len(updated)}")
+
+    # ID новых городов — до публикации, чтобы она не ждала запросов к ATI
+    with stage_timer("city_prewarm", parser.name):
+        try:
+            prewarm_city_ids(session, rows)
+        except Exception as e:
+            print(f"⚠️ [{parser.name}] Прогрев ID городов не выполнен: {e}")
+
+    # Авто-обновление опубликованных заявок — только если изменились поля, которые уходят в ATI
+    ati_updates = [
+        external_no for external_no in updated
+        if snapshots[external_no]["is_published"] and rules[external_no][0] and rules[external_no][0].auto_publish
+        and affects_ati(changes[external_no])
+    ]
+    if ati_updates:
+        changed_orders = session.query(Order).filter(Order.external_no.in_(ati_updates)).all()
+        for existing_order in changed_orders:
+            print(f"🚀 Авто-обновление заявки {existing_order.external_no} в ATI: {', '.join(sorted(changes[existing_order.external_no]))}")
+            update_cargo(prepare_order_for_ati(existing_order))
+
+    # Авто-публикация новых заявок
+    for external_no in inserted:
+        rule, order_type = rules[external_no]
+        schedule_auto_publish(session, external_no, order_type, rule)
+
+    return inserted, updated
+
+def push_cargo_updates(external_nos, max_workers=ATI_MAX_CONCURRENCY):
+    """Обновляет опубликованные грузы в ATI параллельно, с учетом лимита запросов.
+
+    Каждый поток работает со своей сессией БД. Возвращает число успешных обновлений.
+    """
+    def update_one(external_no):
+        db = SessionLocal()
+        try:
+            order = db.query(Order).filter(Order.external_no == external_no).first()
+            if not order or not order.cargo_id:
+                return False
+            cargo_data = prepare_order_for_ati(order)
+            ati_rate_limiter.acquire()
+            response = update_cargo(cargo_data)
+            return bool(response) and "error" not in response
+        except Exception as e:
+            print(f"❌ Ошибка обновления заявки {external_no} в ATI: {e}")
+            return False
+        finally:
+            db.close()
+
+    external_nos = list(external_nos)
+    if not external_nos:
+        return 0
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ati-update") as pool:
+        updated = sum(pool.map(update_one, external_nos))
+    print(f"🔁 Обновлено в ATI: {updated} из {len(external_nos)}")
+    return updated
+
+def delete_stale_orders(session: Session, platform, active_external_nos):
+    """Удаляет заявки площадки, external_no которых нет в `active_external_nos`.
+
+    Сначала грузы снимаются с ATI: заявки, груз которых снять не удалось, остаются
+    в БД (с `cargo_id`), чтобы повторить удаление в следующем цикле.
+    """
+    active_external_nos = set(active_external_nos)
+    ati_orders = find_missing_published(session, platform, active_external_nos)
+    if ati_orders:
+        print(f"🗑 Удаляем {len(ati_orders)} заявок из ATI")
+        _, failed = delete_cargos(ati_orders)  # Параллельно, с учетом лимита запросов ATI
+        if failed:
+            print(f"⚠️ Не сняты с ATI {len(failed)} заявок — оставляем в БД до следующего цикла")
+            active_external_nos |= set(failed)
+
+    with stage_timer("db_delete", platform):
+        deleted, _ = delete_missing_orders(session, platform, active_external_nos)
+
+    if not deleted:
+        print("✅ Нет заявок для удаления.")
+        return 0
+
+    print(f"🗑 Удалено {deleted} неактуальных заявок")
+    return deleted
+
+def partition_items(parser, items, partitions):
+    """Делит заявки на `partitions` частей по стабильному хешу external_no.
+
+    Дубли одной заявки из разных фидов попадают в одну часть.
+    """
+    buckets = [[] for _ in range(partitions)]
+    for raw_order, order_type in items:
+        key = parser.order_key(raw_order) or ""
+        buckets[zlib.crc32(key.encode("utf-8")) % partitions].append((raw_order, order_type))
+    return [bucket for bucket in buckets if bucket]
+
+def ingest_partition(parser, items):
+    """Выполняется в процессе пула: своя сессия и движок БД.
+
+    Возвращает `(inserted, updated, metrics)`, где `metrics` — прирост метрик процесса
+    пула (этапы конвейера, запросы к ATI) для объединения с метриками родителя.
+    """
+    db = SessionLocal()
+    try:
+        # Хеши только своей части, а не всей площадки
+        keys = {parser.order_key(raw_order) for raw_order, _ in items}
+        known_hashes = {
+            external_no: fields["content_hash"]
+            for external_no, fields in load_order_fields(db, keys, ("content_hash",)).items()
+        }
+        pending_orders = select_changed_orders(db, parser, items, known_hashes)
+        inserted, updated = write_orders_batch(db, parser, pending_orders)
+    finally:
+        db.close()
+    # В родительском процессе (без пула) метрики и так общие
+    return inserted, updated, registry.delta() if multiprocessing.parent_process() else {}
+
+_partition_pool = None
+
+def get_partition_pool(workers=PIPELINE_WORKERS):
+    """Пул процессов живет между циклами (словари ATI и движки БД грузятся один раз)"""
+    global _partition_pool
+    if _partition_pool is None:
+        # spawn — чтобы процессы не унаследовали соединения с БД родителя
+        _partition_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _partition_pool
+
+def shutdown_partition_pool():
+    global _partition_pool
+    if _partition_pool is not None:
+        _partition_pool.shutdown()
+        _partition_pool = None
+
+def write_orders_partitioned(parser, items, workers=PIPELINE_WORKERS):
+    """Нормализация, правила и запись заявок в `workers` процессах.
+
+    Возвращает `(inserted, updated, failed_partitions)`.
+    """
+    partitions = partition_items(parser, items, workers)
+    pool = get_partition_pool(workers)
+
+    inserted, updated, failed = [], [], 0
+    futures = [pool.submit(ingest_partition, parser, partition) for partition in partitions]
+    for future in as_completed(futures):
+        try:
+            partition_inserted, partition_updated, partition_metrics = future.result()
+        except Exception as e:
+            failed += 1
+            print(f"❌ [{parser.name}] Ошибка обработки части заявок: {e!r}")
+            continue
+        registry.merge(partition_metrics)
+        inserted.extend(partition_inserted)
+        updated.extend(partition_updated)
+
+    # Отложенные публикации, поставленные процессами пула
+    publish_scheduler.reload()
+    print(f"🧩 [{parser.name}] Обработано частями: {len(partitions)}, с ошибкой: {failed}")
+    return inserted, updated, failed
+
+def ingest_orders(session: Session, parser, items, complete=True, workers=PIPELINE_WORKERS, active_external_nos=None):
+    """Прогоняет загруженные заявки через конвейер. Возвращает статистику цикла.
+
+    `active_external_nos` — актуальные заявки площадки для удаления остальных,
+    если `items` содержит не все (например, один фид); по умолчанию — ключи `items`.
+    """
+    if workers > 1 and len(items) >= PARTITION_MIN_ORDERS:
+        inserted, updated, failed = write_orders_partitioned(parser, items, workers)
+        complete = complete and not failed  # Без результатов части заявок удалять нельзя
+    else:
+        # Новые и измененные заявки записываем одним пакетом
+        pending_orders = select_changed_orders(session, parser, items)
+        inserted, updated = write_orders_batch(session, parser, pending_orders)
+
+    # Если источник ответил не полностью, список актуальных заявок неполный
+    if complete:
+        if active_external_nos is None:
+            active_external_nos = {parser.order_key(raw_order) for raw_order, _ in items}
+        deleted = delete_stale_orders(session, parser.name, active_external_nos)
+    else:
+        print(f"⚠️ [{parser.name}] Не все заявки загружены или записаны, удаление неактуальных заявок пропущено.")
+        deleted = 0
+
+    stats = {
+        "platform": parser.name,
+        "seen": len(items),
+        "inserted": len(inserted),
+        "updated": len(updated),
+        "deleted": deleted,
+    }
+    record_cycle(stats)
+    return stats
+
+def run_cycle(session: Session, parser):
+    """Один цикл: загрузка заявок парсером и обработка конвейером"""
+    with stage_timer("fetch_cycle", parser.name):
+        items, complete = parser.fetch()
+    return ingest_orders(session, parser, items, complete=complete)
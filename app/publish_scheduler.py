@@ -0,0 +1,216 @@
+import os
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+from app.database import SessionLocal
+from app.models import Order, ScheduledPublication
+from app.transformers.ati_transformer import prepare_order_for_ati
+from app.ati_client import publish_cargo
+
+# Загружаем переменные окружения
+load_dotenv()
+
+PUBLISH_WORKERS = int(os.getenv("PUBLISH_WORKERS", 4))  # Сколько публикаций может идти одновременно
+
+class PublishScheduler:
+    """Отложенная публикация заявок в ATI.
+
+    Задачи хранятся в таблице `scheduled_publications` и переживают перезапуск.
+    Один поток следит за кучей сроков, сами публикации выполняет пул из PUBLISH_WORKERS потоков.
+    """
+
+    def __init__(self, max_workers=PUBLISH_WORKERS):
+        self.max_workers = max_workers
+        self._heap = []  # (publish_at, external_no)
+        self._due_at = {}  # external_no -> актуальный publish_at (устаревшие записи кучи пропускаются)
+        self._condition = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self._stopping = False
+
+    def start(self):
+        """Загружает задачи из БД и запускает планировщик"""
+        if self._thread:
+            return
+
+        db = SessionLocal()
+        try:
+            tasks = db.query(ScheduledPublication.external_no, ScheduledPublication.publish_at).all()
+        finally:
+            db.close()
+
+        with self._condition:
+            self._stopping = False
+            for external_no, publish_at in tasks:
+                self._push(external_no, publish_at)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="publish")
+        self._thread = threading.Thread(target=self._run, name="publish-scheduler", daemon=True)
+        self._thread.start()
+        print(f"⏰ Планировщик публикаций запущен, задач в очереди: {len(tasks)}")
+
+    def reload(self):
+        """Подхватывает задачи, поставленные в БД другими процессами. Возвращает число новых"""
+        if not self._thread:
+            return 0
+
+        db = SessionLocal()
+        try:
+            tasks = db.query(ScheduledPublication.external_no, ScheduledPublication.publish_at).all()
+        finally:
+            db.close()
+
+        added = 0
+        with self._condition:
+            for external_no, publish_at in tasks:
+                if self._due_at.get(external_no) != publish_at:
+                    self._push(external_no, publish_at)
+                    added += 1
+        return added
+
+    def stop(self, wait=True):
+        """Останавливает планировщик. Незавершенные задачи остаются в БД"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._executor:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def schedule(self, external_no, delay_minutes):
+        """Ставит (или переносит) публикацию заявки через `delay_minutes` минут"""
+        publish_at = datetime.utcnow() + timedelta(minutes=delay_minutes)
+
+        db = SessionLocal()
+        try:
+            task = db.query(ScheduledPublication).filter(ScheduledPublication.external_no == external_no).first()
+            if task:
+                task.publish_at = publish_at
+            else:
+                db.add(ScheduledPublication(external_no=external_no, publish_at=publish_at))
+            db.commit()
+        finally:
+            db.close()
+
+        with self._condition:
+            self._push(external_no, publish_at)
+
+        return publish_at
+
+    reschedule = schedule
+
+    def cancel(self, external_nos):
+        """Отменяет публикации для списка заявок. Возвращает число отмененных задач"""
+        external_nos = list(external_nos)
+        if not external_nos:
+            return 0
+
+        db = SessionLocal()
+        try:
+            cancelled = db.query(ScheduledPublication).filter(
+                ScheduledPublication.external_no.in_(external_nos)
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+        with self._condition:
+            for external_no in external_nos:
+                self._due_at.pop(external_no, None)
+
+        if cancelled:
+            print(f"🚫 Отменено отложенных публикаций: {cancelled}")
+        return cancelled
+
+    def run_due(self, platform=None):
+        """Синхронно публикует все наступившие задачи (для разового запуска по cron).
+
+        `platform` — только задачи заявок этой площадки (процессы площадок не
+        публикуют одни и те же задачи одновременно).
+        """
+        db = SessionLocal()
+        try:
+            query = db.query(ScheduledPublication.external_no).filter(ScheduledPublication.publish_at <= datetime.utcnow())
+            if platform:
+                query = query.join(Order, Order.external_no == ScheduledPublication.external_no).filter(Order.platform == platform)
+            due = [external_no for (external_no,) in query]
+        finally:
+            db.close()
+
+        if due:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="publish") as pool:
+                list(pool.map(self._publish, due))
+        return len(due)
+
+    def _push(self, external_no, publish_at):
+        """Вызывается под `self._condition`"""
+        self._due_at[external_no] = publish_at
+        heapq.heappush(self._heap, (publish_at, external_no))
+        self._condition.notify()
+
+    def _pop_due(self):
+        """Вызывается под `self._condition`: достает все задачи, срок которых наступил"""
+        now = datetime.utcnow()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            publish_at, external_no = heapq.heappop(self._heap)
+            if self._due_at.get(external_no) != publish_at:
+                continue  # Задача отменена или перенесена
+            del self._due_at[external_no]
+            due.append(external_no)
+        return due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                due = []
+                while not self._stopping and not due:
+                    due = self._pop_due()
+                    if not due:
+                        timeout = (self._heap[0][0] - datetime.utcnow()).total_seconds() if self._heap else None
+                        self._condition.wait(timeout)
+                if self._stopping:
+                    return
+
+            for external_no in due:
+                self._executor.submit(self._publish, external_no)
+
+    def _publish(self, external_no):
+        """Публикует заявку в собственной сессии БД и удаляет задачу"""
+        db = SessionLocal()
+        try:
+            # Задачу могли отменить или перенести (в том числе из другого процесса)
+            task = db.query(ScheduledPublication).filter(ScheduledPublication.external_no == external_no).first()
+            if not task or task.publish_at > datetime.utcnow():
+                return
+
+            order = db.query(Order).filter(Order.external_no == external_no).first()
+            if not order:
+                print(f"⚠️ Ошибка: Заявка {external_no} не найдена в БД, публикация отменена.")
+            elif order.cargo_id:
+                print(f"ℹ️ Заявка {external_no} уже опубликована в ATI, задача снята.")
+            else:
+                # publish_cargo() сам сохраняет cargo_id и номер груза в БД
+                response = publish_cargo(prepare_order_for_ati(order))
+                if response and "cargo_id" in response:
+                    print(f"✅ Заявка {external_no} успешно опубликована в ATI: {response['cargo_number']}")
+                else:
+                    print(f"❌ Ошибка публикации заявки {external_no}.")
+
+            db.delete(task)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"❌ Ошибка отложенной публикации {external_no}: {e}")
+        finally:
+            db.close()
+
+# Общий планировщик процесса
+publish_scheduler = PublishScheduler()
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from app.database import SessionLocal
 from app.models import DistributionRule
+from app.rule_index import rule_index, bump_rule_set_version
+from app.distribution_rules import simulate_rule_set, reprice_orders, reattribute_orders
+from app.pipeline import push_cargo_updates
 
 router = APIRouter()
 
@@ -16,8 +19,8 @@ def get_db():
 
 # Pydantic-модель для валидации входящих данных для DistributionRule
 class DistributionRuleSchema(BaseModel):
-    loading_city: str | None = None           # Город погрузки (может быть None, если универсальное правило)
-    unloading_city: str | None = None         # Город выгрузки (может быть None)
+    loading_city: str | None = None           # Город погрузки (None или "*" — универсальное правило, "Моск*" — по началу названия)
+    unloading_city: str | None = None         # Город выгрузки (может быть None, "*" или шаблоном "Моск*")
     logistician: str                         # Имя логиста
     margin_percent: float | None = None        # Процент маржи для обычных заявок
     auction_margin_percent: float | None = None  # Процент маржи для аукционных заявок
@@ -29,9 +32,27 @@ class DistributionRuleSchema(BaseModel):
     class Config:
         orm_mode = True  # Это позволяет Pydantic работать с объектами SQLAlchemy
 
+# Правило-кандидат для симуляции (id — чтобы видеть, какое правило сработало)
+class DistributionRuleCandidateSchema(DistributionRuleSchema):
+    id: int | None = None
+    platform: str = "transport2"
+    auto_publish_auction: bool = False
+
 # ──────────────── CREATE (Создание нового правила) ───────────────
+def rule_pattern(rule):
+    """Шаблон направления правила для reattribute_orders()"""
+    return (rule.platform, rule.loading_city, rule.unloading_city)
+
+def reattribute_rule_orders(db: Session, background_tasks: BackgroundTasks, patterns, rule_id=None):
+    """Сверяет заявки, затронутые правилом; опубликованные грузы обновляются в ATI в фоне"""
+    _, ati_updates = reattribute_orders(db, patterns, rule_id)
+    if ati_updates:
+        background_tasks.add_task(push_cargo_updates, ati_updates)
+
 @router.post("/", response_model=DistributionRuleSchema)
-def create_distribution_rule(rule_data: DistributionRuleSchema, db: Session = Depends(get_db)):
+def create_distribution_rule(
+    rule_data: DistributionRuleSchema, background_tasks: BackgroundTasks, db: Session = Depends(get_db)
+):
     """
     Создаёт новое правило распределения.
     Пример запроса (JSON):
@@ -59,20 +80,34 @@ def create_distribution_rule(rule_data: DistributionRuleSchema, db: Session = De
         cargo_name=rule_data.cargo_name,
     )
     db.add(new_rule)
+    bump_rule_set_version(db)
     db.commit()
     db.refresh(new_rule)
+    rule_index.rebuild(db)
+    # Новое правило может забрать заявки у других — проверяются только его направления
+    reattribute_rule_orders(db, background_tasks, [rule_pattern(new_rule)])
     return new_rule
 
 # ──────────────── UPDATE (Изменение правила) ───────────────
 @router.put("/{rule_id}", response_model=DistributionRuleSchema)
-def update_distribution_rule(rule_id: int, rule_data: DistributionRuleSchema, db: Session = Depends(get_db)):
+def update_distribution_rule(
+    rule_id: int, rule_data: DistributionRuleSchema, background_tasks: BackgroundTasks, db: Session = Depends(get_db)
+):
     """
     Изменяет правило распределения по его ID.
     В запросе передаётся полное тело правила.
+    Если изменилась маржа, ставки ATI заявок по этому правилу пересчитываются,
+    а опубликованные грузы с новой ставкой обновляются в ATI в фоне.
     """
     rule = db.query(DistributionRule).filter(DistributionRule.id == rule_id).first()
     if not rule:
         raise HTTPException(status_code=404, detail="Правило не найдено")
+
+    margins_changed = (
+        rule.margin_percent != rule_data.margin_percent or
+        rule.auction_margin_percent != rule_data.auction_margin_percent
+    )
+    old_pattern = rule_pattern(rule)
     
     # Обновляем поля правила
     rule.loading_city = rule_data.loading_city
@@ -85,23 +120,48 @@ def update_distribution_rule(rule_id: int, rule_data: DistributionRuleSchema, db
     rule.payment_days = rule_data.payment_days
     rule.cargo_name = rule_data.cargo_name
     
+    bump_rule_set_version(db)
     db.commit()
     db.refresh(rule)
+    rule_index.rebuild(db)
+    # Города правила могли измениться: проверяются его заявки и направления до и после изменения
+    reattribute_rule_orders(db, background_tasks, [old_pattern, rule_pattern(rule)], rule_id)
+
+    if margins_changed:
+        _, ati_updates = reprice_orders(db, rule_id)
+        if ati_updates:
+            background_tasks.add_task(push_cargo_updates, ati_updates)
     return rule
 
 # ──────────────── DELETE (Удаление правила) ───────────────
 @router.delete("/{rule_id}")
-def delete_distribution_rule(rule_id: int, db: Session = Depends(get_db)):
+def delete_distribution_rule(rule_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """
     Удаляет правило распределения по его ID.
     """
     rule = db.query(DistributionRule).filter(DistributionRule.id == rule_id).first()
     if not rule:
         raise HTTPException(status_code=404, detail="Правило не найдено")
+    pattern = rule_pattern(rule)
     db.delete(rule)
+    bump_rule_set_version(db)
     db.commit()
+    rule_index.rebuild(db)
+    # Заявки удаленного правила переходят к другим правилам
+    reattribute_rule_orders(db, background_tasks, [pattern], rule_id)
     return {"message": "Правило удалено"}
 
+# ──────────────── SIMULATE (Проверка набора правил без сохранения) ───────────────
+@router.post("/simulate")
+def simulate_distribution_rules(rules: list[DistributionRuleCandidateSchema], db: Session = Depends(get_db)):
+    """
+    Прогоняет все заявки через переданный набор правил (вместо текущего) и возвращает,
+    что изменится: логисты, ставки ATI (bid_price * (100 - маржа) / 100, для аукциона —
+    маржа аукциона) и заявки, у которых включится или выключится авто-публикация.
+    Правила в БД не меняются. Порядок в списке — приоритет при одинаковых городах.
+    """
+    return simulate_rule_set(db, rules)
+
 @router.get("/")
 async def get_distribution_rules(db: Session = Depends(get_db)):
     """Возвращает список всех правил распределения."""
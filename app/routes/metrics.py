@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.metrics import registry, load_saved_metrics
+
+router = APIRouter()
+
+@router.get("", response_class=PlainTextResponse)
+def get_metrics():
+    """Метрики API и процессов обработки заявок (воркер, runner) в формате Prometheus"""
+    return PlainTextResponse(registry.render(load_saved_metrics()), media_type="text/plain; version=0.0.4; charset=utf-8")
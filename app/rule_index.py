@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy.orm import Session
+from app.models import DistributionRule, RuleSetVersion
+from app.transformers.city_normalizer import normalize_city_name
+
+# Как часто (секунды) читатели вне конвейера сверяют версию правил с БД
+RULE_INDEX_TTL = float(os.getenv("RULE_INDEX_TTL", 30))
+
+# Правило распределения, отвязанное от сессии БД (безопасно читать из любых потоков)
+CompiledRule = namedtuple("CompiledRule", (
+    "id", "platform", "loading_city", "unloading_city", "logistician", "margin_percent",
+    "auction_margin_percent", "cargo_name", "auto_publish", "auto_publish_auction",
+    "publish_delay", "payment_days",
+))
+
+def _platform_key(platform):
+    return (platform or "").lower()
+
+def bump_rule_set_version(session: Session):
+    """Отмечает изменение правил (в той же транзакции, что и само изменение)"""
+    updated = session.query(RuleSetVersion).filter(RuleSetVersion.id == 1).update(
+        {RuleSetVersion.version: RuleSetVersion.version + 1}, synchronize_session=False
+    )
+    if not updated:
+        session.add(RuleSetVersion(id=1, version=1))
+
+def get_rule_set_version(session: Session):
+    row = session.query(RuleSetVersion.version).filter(RuleSetVersion.id == 1).first()
+    return row[0] if row else 0
+
+# Шаблон города в правиле: "Моск*" — все города, начинающиеся на "моск"; "*" — любой город (как пусто)
+WILDCARD = "*"
+
+def parse_city_pattern(value):
+    """Значение города из правила → (тип, ключ): ("exact", key), ("prefix", key) или ("any", None)"""
+    if value is None or not value.strip() or value.strip() == WILDCARD:
+        return ("any", None)
+    value = value.strip()
+    if value.endswith(WILDCARD):
+        return ("prefix", normalize_city_name(value.rstrip(WILDCARD)))
+    return ("exact", normalize_city_name(value))
+
+class PrefixTrie:
+    """Префиксное дерево по символам: поиск всех шаблонов-префиксов строки за O(длины строки)"""
+
+    def __init__(self):
+        self.root = {}
+
+    def setdefault(self, prefix, value):
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        return node.setdefault(None, value)  # None — маркер конца шаблона
+
+    def iter_prefixes(self, key):
+        """Значения шаблонов, которые являются префиксами `key`, от самого длинного к короткому"""
+        found = []
+        node = self.root
+        if None in node:
+            found.append(node[None])
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found.append(node[None])
+        return reversed(found)
+
+class CityIndex:
+    """Значения по шаблону города: точный ключ → префикс (длинный раньше) → любой город"""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.exact = {}
+        self.prefixes = PrefixTrie()
+        self.any = None
+
+    def setdefault(self, pattern):
+        kind, key = pattern
+        if kind == "exact":
+            return self.exact.setdefault(key, self.factory())
+        if kind == "prefix":
+            return self.prefixes.setdefault(key, self.factory())
+        if self.any is None:
+            self.any = self.factory()
+        return self.any
+
+    def candidates(self, key):
+        """Все подходящие значения в порядке приоритета"""
+        if key is not None:
+            if key in self.exact:
+                yield self.exact[key]
+            yield from self.prefixes.iter_prefixes(key)
+        if self.any is not None:
+            yield self.any
+
+class RuleSlot:
+    """Первое (по id) правило для пары шаблонов"""
+
+    def __init__(self):
+        self.rule = None
+
+class RuleSnapshot:
+    """Неизменяемый набор правил одной версии с индексом по нормализованным городам.
+
+    Порядок поиска прежний — сначала подбирается город погрузки, затем выгрузки:
+    точное → по погрузке → по выгрузке → универсальное; шаблон "Моск*" менее точен,
+    чем точный город, но точнее пустого значения.
+    """
+
+    def __init__(self, version, rules):
+        self.version = version
+        self.rules = rules
+        self.platforms = {}  # площадка -> CityIndex(погрузка) -> CityIndex(выгрузка) -> RuleSlot
+        for rule in rules:  # По id: при дублях побеждает правило, созданное раньше
+            loading_index = self.platforms.setdefault(_platform_key(rule.platform), CityIndex(lambda: CityIndex(RuleSlot)))
+            slot = loading_index.setdefault(parse_city_pattern(rule.loading_city)).setdefault(parse_city_pattern(rule.unloading_city))
+            if slot.rule is None:
+                slot.rule = rule
+        self.resolved = {}  # Кеш результатов поиска для пар городов
+
+    def match(self, platform, loading_city, unloading_city):
+        """Правило для направления или None"""
+        key = (_platform_key(platform), loading_city, unloading_city)
+        if key in self.resolved:
+            return self.resolved[key]
+
+        rule = None
+        loading_index = self.platforms.get(key[0])
+        if loading_index is not None:
+            loading_key, unloading_key = normalize_city_name(loading_city), normalize_city_name(unloading_city)
+            for unloading_index in loading_index.candidates(loading_key):
+                slot = next(unloading_index.candidates(unloading_key), None)
+                if slot is not None:
+                    rule = slot.rule
+                    break
+
+        self.resolved[key] = rule
+        return rule
+
+class DistributionRuleIndex:
+    """Индекс правил распределения в памяти процесса.
+
+    Перестраивается целиком и подменяется одной операцией: читатели всегда видят
+    согласованный набор правил. Изменения из других процессов (API) видны по
+    номеру версии в таблице `rule_set_version`.
+    """
+
+    def __init__(self, ttl=RULE_INDEX_TTL):
+        self.ttl = ttl
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()  # Одна перестройка за раз
+
+    @property
+    def version(self):
+        return self._snapshot.version if self._snapshot else None
+
+    def rebuild(self, session: Session):
+        """Загружает все правила одним запросом и атомарно подменяет индекс"""
+        with self._lock:
+            version = get_rule_set_version(session)
+            rules = [
+                CompiledRule(*row) for row in session.query(*(getattr(DistributionRule, field) for field in CompiledRule._fields))
+                .order_by(DistributionRule.id)
+            ]
+            self._snapshot = RuleSnapshot(version, rules)
+            self._checked_at = time.monotonic()
+        print(f"📚 Индекс правил распределения перестроен: {len(rules)} правил, версия {version}")
+        return self._snapshot
+
+    def refresh(self, session: Session):
+        """Перестраивает индекс, если правила изменились (один легкий запрос)"""
+        snapshot = self._snapshot
+        if snapshot is None or get_rule_set_version(session) != snapshot.version:
+            return self.rebuild(session)
+        self._checked_at = time.monotonic()
+        return snapshot
+
+    def current(self, session: Session):
+        """Текущий набор правил; версия сверяется с БД не чаще раза в `ttl` секунд"""
+        if self._snapshot is None or time.monotonic() - self._checked_at > self.ttl:
+            return self.refresh(session)
+        return self._snapshot
+
+    def match(self, session: Session, platform, loading_city, unloading_city):
+        return self.current(session).match(platform, loading_city, unloading_city)
+
+# Общий индекс процесса
+rule_index = DistributionRuleIndex()
@@ -1,8 +1,8 @@
 import os
-import requests
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
 from app.models import Logist
+from app.ati_http import get_ati_http, ATI_API_BASE_URL
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -10,7 +10,6 @@ load_dotenv()
 
 # Конфигурация API
 ATI_API_TOKEN = os.getenv("ATI_API_TOKEN")
-ATI_API_BASE_URL = "https://api.ati.su"
 
 HEADERS = {
     "Authorization": f"Bearer {ATI_API_TOKEN}",
@@ -20,7 +19,7 @@ HEADERS = {
 def fetch_logists_from_ati():
     """Запрашивает список логистов с ATI"""
     url = f"{ATI_API_BASE_URL}/v1.0/firms/contacts"
-    response = requests.get(url, headers=HEADERS)
+    response = get_ati_http().get(url, headers=HEADERS)
 
     if response.status_code != 200:
         print(f"❌ Ошибка запроса к ATI: {response.status_code}")
@@ -0,0 +1,90 @@
+import os
+import re
+from functools import lru_cache
+
+# Сколько разобранных адресов держим в памяти (склады повторяются тысячи раз в день)
+ADDRESS_CACHE_SIZE = int(os.getenv("ADDRESS_CACHE_SIZE", 10000))
+
+class AddressNormalizer:
+    """Извлекает улицу и дом из адресов TMS.
+
+    Регулярные выражения компилируются один раз, результаты кешируются (LRU) по исходной строке.
+    """
+
+    # Текст в скобках (например, "(Екатеринбург)") и слово "ориентир"
+    NOISE_RE = re.compile(r"\(.*?\)|\bориентир\b")
+    DIGIT_RE = re.compile(r"\d")
+
+    # Ключевые слова для поиска улицы
+    STREET_KEYWORDS = frozenset({"ул", "улица", "пр-кт", "проспект", "тракт", "шоссе", "ш", "пер", "переулок", "проезд"})
+
+    # Ключевые слова для населенного пункта (чтобы пропустить его и взять следующее поле)
+    CITY_KEYWORDS = frozenset({"г", "город", "пос", "поселок", "д", "деревня", "пгт", "с", "село", "ст", "станция"})
+
+    # Слова, которые убираем из названия улицы
+    STREET_PREFIXES = frozenset({"ул", "улица"})
+
+    def __init__(self, cache_size=ADDRESS_CACHE_SIZE):
+        self.extract = lru_cache(maxsize=cache_size)(self._extract)
+
+    def cache_info(self):
+        return self.extract.cache_info()
+
+    def cache_clear(self):
+        self.extract.cache_clear()
+
+    def _extract(self, address, include_house_number=True):
+        """Извлекает улицу и дом из строки адреса.
+
+        - `include_house_number=True` → улица + номер дома (для unloading_address).
+        - `include_house_number=False` → только улица (для loading_address).
+        """
+        if not address:
+            return None
+
+        address = self.NOISE_RE.sub("", address).strip()
+
+        # Разбиваем строку на части; нижний регистр считаем один раз для всей строки
+        parts = [part.strip() for part in address.split(",")]
+        parts_lower = [part.split() for part in address.lower().split(",")]
+
+        street_part = None
+        street_index = None
+
+        # 1️⃣ Сначала ищем улицу по ключевым словам
+        for index, words_lower in enumerate(parts_lower):
+            if not self.STREET_KEYWORDS.isdisjoint(words_lower):
+                street_part = " ".join(word for word in parts[index].split() if word.lower() not in self.STREET_PREFIXES).strip()
+                street_index = index
+                break
+
+        # 2️⃣ Если улица не найдена, берем первое поле после населенного пункта
+        if not street_part:
+            city_found = False
+            for index, part in enumerate(parts):
+                if not self.CITY_KEYWORDS.isdisjoint(parts_lower[index]):
+                    city_found = True
+                    continue
+
+                if city_found:
+                    street_part = part
+                    street_index = index
+                    break
+
+        # Номер дома — первое следующее поле с цифрой
+        house_number = None
+        if include_house_number and street_part:
+            start = parts.index(parts[street_index]) + 1
+            for next_part in parts[start:]:
+                if self.DIGIT_RE.search(next_part):
+                    house_number = next_part
+                    break
+
+        return f"{street_part} {house_number}" if include_house_number and house_number else street_part
+
+# Общий нормализатор процесса
+address_normalizer = AddressNormalizer()
+
+def extract_street_and_house(address, include_house_number=True):
+    """Извлекает улицу и дом из строки адреса (с кешированием)"""
+    return address_normalizer.extract(address, include_house_number)
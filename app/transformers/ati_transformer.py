@@ -1,23 +1,25 @@
 import os
 import math
 import re
-from datetime import datetime
-from app.models import DistributionRule
-from app.ati_client import get_city_id, get_contact_id, get_car_types, get_loading_types, get_unloading_types
+from app.transformers.datetime_normalizer import to_timezone, format_utc_offset
+from app.distribution_rules import RuleEngine
+from app.ati_client import get_contact_id, get_car_types, get_loading_types, get_unloading_types
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
+from app.metrics import stage_timer
+from app.city_cache import resolve_city_id
 
 # Подключаемся к БД
 DATABASE_URL = os.getenv("DATABASE_URL")
 engine = create_engine(DATABASE_URL)
 Session = sessionmaker(bind=engine)
-session = Session()
 
 # Загружаем словари один раз при старте
 car_type_dict = get_car_types()
 loading_type_dict = get_loading_types()
 unloading_type_dict = get_unloading_types()
 
+@stage_timer("transform")
 def prepare_order_for_ati(order):
     """Готовим данные для публикации на АТИ"""
 
@@ -72,9 +74,9 @@ def prepare_order_for_ati(order):
         numbers = re.findall(r"\d+", order.vehicle_type)
         volume = int(numbers[-1]) if numbers else 0
 
-    # Получаем ID городов
-    loading_city_id = get_city_id(order.loading_city)
-    unloading_city_id = get_city_id(order.unloading_city)
+    # Получаем ID городов (из кеша; в ATI — только для новых городов)
+    loading_city_id = resolve_city_id(order.loading_city)
+    unloading_city_id = resolve_city_id(order.unloading_city)
 
     # Получаем ID логиста
     logist_id = get_contact_id(order.logistician_name)
@@ -82,25 +84,16 @@ def prepare_order_for_ati(order):
     # Берем `ati_price` из `orders`
     ati_price = order.ati_price
 
-    # Получаем `payment_days` из `distribution_rules`
-    rule = session.query(DistributionRule).filter(
-        (DistributionRule.loading_city == order.loading_city) | (DistributionRule.loading_city.is_(None)),
-        (DistributionRule.unloading_city == order.unloading_city) | (DistributionRule.unloading_city.is_(None))
-    ).first()
-    payment_days = rule.payment_days if rule and rule.payment_days else 30  # По умолчанию 30 дней
-
-    # 🆕 Проверяем, какой тип у даты, и приводим к `datetime`, если нужно
-    load_date_obj = (
-        order.load_date if isinstance(order.load_date, datetime) 
-        else datetime.strptime(order.load_date, "%Y-%m-%d %H:%M:%S") if order.load_date 
-        else None
-    )
-
-    unload_date_obj = (
-        order.unload_date if isinstance(order.unload_date, datetime) 
-        else datetime.strptime(order.unload_date, "%Y-%m-%d %H:%M:%S") if order.unload_date 
-        else None
-    )
+    # Получаем `payment_days` из правила направления (тот же движок правил, что и при загрузке)
+    db = Session()  # Запрос к БД — только если пора сверить версию правил
+    try:
+        payment_days = RuleEngine.current(db).match(order).payment_days  # По умолчанию 30 дней
+    finally:
+        db.close()
+
+    # Даты хранятся с часовым поясом — в ATI передаем в ATI_TIMEZONE вместе со смещением
+    load_date_obj = to_timezone(order.load_date)
+    unload_date_obj = to_timezone(order.unload_date)
 
     # 🆕 Формируем `dates` для загрузки
     load_first_date = load_date_obj.strftime("%Y-%m-%d") if load_date_obj else None
@@ -112,7 +105,7 @@ def prepare_order_for_ati(order):
             "type": "bounded",
             "start": load_time,
             "end": load_time,
-            "offset": "+00:00"
+            "offset": format_utc_offset(load_date_obj)
         },
         "first_date": load_first_date,
         "last_date": load_first_date
@@ -129,7 +122,7 @@ def prepare_order_for_ati(order):
             "type": "round-the-clock" if unload_time is None else "bounded",
             "start": unload_time,
             "end": unload_time,
-            "offset": "+00:00"
+            "offset": format_utc_offset(unload_date_obj)
         }
     }
 
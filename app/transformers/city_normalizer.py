@@ -0,0 +1,41 @@
+import os
+import re
+from functools import lru_cache
+
+# Сколько нормализованных названий держим в памяти
+CITY_CACHE_SIZE = int(os.getenv("CITY_CACHE_SIZE", 10000))
+
+class CityNormalizer:
+    """Приводит название населенного пункта к ключу для сравнения.
+
+    "г. Москва", "Москва г", " москва " → "москва"; ё → е.
+    Результаты кешируются (LRU) по исходной строке.
+    """
+
+    # Типы населенных пунктов перед названием ("г. Москва", "пгт Белоярский") и после него ("Москва г")
+    TYPES = r"г|гор|город|пос|поселок|п|пгт|рп|дп|с|село|д|дер|деревня|ст|ст-ца|станица|х|хутор|аул|мкр"
+    PREFIX_RE = re.compile(rf"^(?:{TYPES})(?:\.\s*|\s+)")
+    SUFFIX_RE = re.compile(rf"\s+(?:{TYPES})\.?$")
+    SPACES_RE = re.compile(r"\s+")
+
+    def __init__(self, cache_size=CITY_CACHE_SIZE):
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def cache_info(self):
+        return self.normalize.cache_info()
+
+    def _normalize(self, name):
+        if name is None:
+            return None
+
+        key = self.SPACES_RE.sub(" ", name.lower().replace("ё", "е")).strip(" ,.")
+        key = self.PREFIX_RE.sub("", key, count=1)
+        key = self.SUFFIX_RE.sub("", key, count=1)
+        return key.strip(" ,.")
+
+# Общий нормализатор процесса
+city_normalizer = CityNormalizer()
+
+def normalize_city_name(name):
+    """Ключ населенного пункта для сравнения (с кешированием)"""
+    return city_normalizer.normalize(name)
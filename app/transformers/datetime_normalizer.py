@@ -0,0 +1,42 @@
+import os
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+# Даты из TMS без смещения считаем UTC
+DEFAULT_TIMEZONE = timezone.utc
+
+# Часовой пояс, в котором даты уходят в ATI (смещение передается вместе со временем)
+ATI_TIMEZONE = ZoneInfo(os.getenv("ATI_TIMEZONE", "UTC"))
+
+def parse_feed_datetime(value, default_tz=DEFAULT_TIMEZONE):
+    """Преобразует дату из фида (ISO-строка) в datetime с часовым поясом.
+
+    Пустые и нераспознанные значения → None.
+    """
+    if not value:
+        return None
+
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except (TypeError, ValueError):
+            return None
+
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=default_tz)
+
+def to_utc(value):
+    """datetime с часовым поясом → UTC (значения без пояса считаются UTC)"""
+    if value is None:
+        return None
+    return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def to_timezone(value, tz=ATI_TIMEZONE):
+    """Переводит дату в часовой пояс `tz` (значения без пояса считаются UTC)"""
+    return to_utc(value).astimezone(tz) if value is not None else None
+
+def format_utc_offset(value):
+    """Смещение даты в виде "+05:00" (для ATI)"""
+    offset = value.strftime("%z") if value is not None else ""
+    return f"{offset[:3]}:{offset[3:5]}" if offset else "+00:00"
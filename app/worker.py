@@ -0,0 +1,169 @@
+import os
+import asyncio
+import random
+import signal
+from dotenv import load_dotenv
+from sqlalchemy import func
+
+from app import pipeline
+from app.database import SessionLocal
+from app.models import Platform
+from app.parsers import transport2
+from app.parsers.runner import load_parser_class
+from app.publish_scheduler import publish_scheduler
+from app.metrics import start_metrics_server, save_metrics
+from app.ati_http import close_ati_http
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Базовые интервалы опроса для каждого фида (секунды)
+POLL_INTERVALS = {
+    "ASSIGNED": float(os.getenv("T2_POLL_INTERVAL_ASSIGNED", 60)),
+    "AUCTION": float(os.getenv("T2_POLL_INTERVAL_AUCTION", 30)),
+    "FREE": float(os.getenv("T2_POLL_INTERVAL_FREE", 60)),
+}
+POLL_MIN_INTERVAL = float(os.getenv("T2_POLL_MIN_INTERVAL", 15))
+POLL_MAX_INTERVAL = float(os.getenv("T2_POLL_MAX_INTERVAL", 600))
+POLL_JITTER = float(os.getenv("T2_POLL_JITTER", 0.1))  # ±10% к интервалу
+
+POLL_SLOWDOWN = 1.5  # Множитель интервала, если изменений не было
+POLL_SPEEDUP = 0.5  # Множитель интервала, если заявки менялись
+
+def next_interval(interval, changes):
+    """Замедляет опрос при отсутствии изменений и ускоряет при их появлении"""
+    if changes:
+        return max(POLL_MIN_INTERVAL, interval * POLL_SPEEDUP)
+    return min(POLL_MAX_INTERVAL, interval * POLL_SLOWDOWN)
+
+def with_jitter(interval):
+    """Добавляет случайный разброс, чтобы фиды не опрашивались синхронно"""
+    return interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+def load_platform_parser(platform_name):
+    """Парсер площадки из реестра с `auth_data` из таблицы `platforms` (как у runner)"""
+    db = SessionLocal()
+    try:
+        platform = db.query(Platform).filter(func.lower(Platform.name) == platform_name.lower()).first()
+        auth_data = platform.auth_data if platform else None
+    finally:
+        db.close()
+    return load_parser_class(platform_name)(auth_data)
+
+class Transport2Worker:
+    """Постоянно работающий воркер: каждый фид опрашивается по своему расписанию.
+
+    Заявки обрабатывает общий конвейер (app.pipeline) с парсером из реестра площадок.
+    HTTP-клиент, подключения к БД и словари ATI живут между циклами.
+    """
+
+    def __init__(self):
+        self.stop_event = asyncio.Event()
+        self.db_lock = asyncio.Lock()  # Сессия БД общая — обрабатываем фиды по очереди
+        self.snapshots = {}  # order_type -> external_no последнего успешного опроса
+        self.parser = load_platform_parser(transport2.PLATFORM_NAME)
+        self.db = SessionLocal()
+
+    def stop(self):
+        print("🛑 Получен сигнал остановки, завершаем текущие циклы...")
+        self.stop_event.set()
+
+    async def sleep(self, delay):
+        """Ждет `delay` секунд или сигнала остановки"""
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def process_feed(self, order_type, orders):
+        """Записывает заявки фида и удаляет неактуальные. Возвращает число изменений"""
+        parser = self.parser
+        self.snapshots[order_type] = {parser.order_key(order) for order in orders}
+
+        # Заявки, которые есть в фиде с более высоким приоритетом, пишет тот фид
+        shadowed = set().union(*(
+            keys for feed_type, keys in self.snapshots.items()
+            if parser.order_type_rank(feed_type) < parser.order_type_rank(order_type)
+        ))
+        items = [(order, order_type) for order in orders if parser.order_key(order) not in shadowed]
+
+        # Удалять можно только когда есть актуальные данные по всем фидам
+        complete = len(self.snapshots) == len(transport2.FEEDS)
+        try:
+            stats = pipeline.ingest_orders(
+                self.db, parser, items, complete=complete,
+                active_external_nos=set().union(*self.snapshots.values()),
+            )
+        except Exception:
+            self.db.rollback()
+            raise
+        finally:
+            save_metrics("worker")  # Для GET /metrics API
+        return stats["inserted"] + stats["updated"] + stats["deleted"]
+
+    async def poll_feed(self, client, order_type, url, payload, is_auction, is_free):
+        """Цикл опроса одного фида"""
+        interval = POLL_INTERVALS[order_type]
+
+        while not self.stop_event.is_set():
+            changes = None
+            enabled = await asyncio.to_thread(transport2.is_platform_enabled, transport2.PLATFORM_NAME)
+
+            if enabled:
+                errors = []
+                orders = await transport2.fetch_orders_async(
+                    client, url, payload, transport2.FEED_TIMEOUTS[order_type],
+                    is_auction=is_auction, is_free=is_free, errors=errors
+                )
+                if not errors:
+                    try:
+                        async with self.db_lock:
+                            changes = await asyncio.to_thread(self.process_feed, order_type, orders)
+                    except Exception as e:
+                        print(f"❌ Ошибка обработки фида {order_type}: {e}")
+            else:
+                print(f"⏸ Площадка {transport2.PLATFORM_NAME} отключена, фид {order_type} пропущен.")
+
+            # При ошибках и выключенной площадке интервал не меняем
+            if changes is not None:
+                interval = next_interval(interval, changes)
+
+            delay = with_jitter(interval)
+            print(f"⏱ {order_type}: изменений {changes if changes is not None else '—'}, следующий опрос через {delay:.0f} с")
+            await self.sleep(delay)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except NotImplementedError:
+                pass  # Windows: остановка по KeyboardInterrupt
+
+        publish_scheduler.start()
+        # Метрики воркера отдает GET /metrics API (через METRICS_DIR); свой порт —
+        # METRICS_PORT=9100, если API и воркер на разных машинах
+        metrics_server = start_metrics_server()
+        try:
+            # Заголовки парсера — с токеном из `platforms.auth_data`, если он задан
+            async with transport2.create_async_client(self.parser.headers) as client:
+                await asyncio.gather(*(self.poll_feed(client, *feed) for feed in transport2.FEEDS))
+        finally:
+            # Текущие публикации дорабатывают, остальные задачи остаются в БД
+            await asyncio.to_thread(publish_scheduler.stop)
+            if metrics_server:
+                metrics_server.shutdown()
+
+        pipeline.shutdown_partition_pool()
+        save_metrics("worker")
+        self.parser.close()
+        self.db.close()
+        close_ati_http()
+        print("👋 Воркер Transport2 остановлен")
+
+def run_worker():
+    """Точка входа: python -m app.worker"""
+    asyncio.run(Transport2Worker().run())
+
+if __name__ == "__main__":
+    run_worker()
@@ -0,0 +1,91 @@
+"""Микро-бенчмарк нормализатора адресов.
+
+Запуск: python -m benchmarks.address_normalizer_bench
+Сравнивает прежнюю реализацию `extract_street_and_house` (регулярки и списки на каждый вызов)
+с `AddressNormalizer` на корпусе, где одни и те же склады повторяются много раз.
+Совпадение результатов проверяет tests/test_address_normalizer.py.
+"""
+import random
+import re
+import time
+
+from app.transformers.address_normalizer import AddressNormalizer
+
+def legacy_extract_street_and_house(address, include_house_number=True):
+    """Прежняя реализация из app/parsers/transport2.py — для сравнения"""
+    if not address:
+        return None
+
+    address = re.sub(r"\(.*?\)|\bориентир\b", "", address).strip()
+    parts = [part.strip() for part in address.split(",")]
+    street_keywords = ["ул", "улица", "пр-кт", "проспект", "тракт", "шоссе", "ш", "пер", "переулок", "проезд"]
+    city_keywords = ["г", "город", "пос", "поселок", "д", "деревня", "пгт", "с", "село", "ст", "станция"]
+
+    street_part = None
+    house_number = None
+    city_found = False
+
+    for part in parts:
+        words = part.split()
+        if any(word.lower() in street_keywords for word in words):
+            street_part = " ".join([word for word in words if word.lower() not in ["ул", "улица"]]).strip()
+            break
+
+    if not street_part:
+        for part in parts:
+            words = part.split()
+            if any(word.lower() in city_keywords for word in words):
+                city_found = True
+                continue
+            if city_found:
+                street_part = part
+                break
+
+    if include_house_number and street_part:
+        for next_part in parts[parts.index(part) + 1:]:
+            if re.search(r"\d", next_part):
+                house_number = next_part
+                break
+
+    return f"{street_part} {house_number}" if include_house_number and house_number else street_part
+
+CITIES = ["г Москва", "г. Екатеринбург", "г Челябинск", "пгт Белоярский", "д Шувакиш", "с Кольцово", "г Казань"]
+STREETS = ["ул Ленина", "улица Мира", "пр-кт Космонавтов", "Сибирский тракт", "ш Энтузиастов", "пер Базовый", "Складская"]
+
+def build_corpus(unique_addresses=300, total=100_000, seed=42):
+    """Корпус: `unique_addresses` складов, повторяющихся до `total` адресов"""
+    rnd = random.Random(seed)
+    warehouses = []
+    for _ in range(unique_addresses):
+        parts = [f"{rnd.randint(100000, 699999)}", "Свердловская обл", rnd.choice(CITIES), rnd.choice(STREETS), f"д {rnd.randint(1, 200)}"]
+        if rnd.random() < 0.3:
+            parts.append(f"стр {rnd.randint(1, 9)}")
+        address = ", ".join(parts)
+        if rnd.random() < 0.2:
+            address += " (ориентир склад №3)"
+        warehouses.append(address)
+    return [rnd.choice(warehouses) for _ in range(total)]
+
+def run(label, func, corpus):
+    started = time.perf_counter()
+    for address in corpus:
+        func(address, include_house_number=False)
+        func(address, include_house_number=True)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed:8.3f} с  ({len(corpus) * 2 / elapsed:,.0f} адресов/с)")
+    return elapsed
+
+def main():
+    corpus = build_corpus()
+    normalizer = AddressNormalizer()
+    uncached = AddressNormalizer(cache_size=0)
+
+    legacy = run("legacy", legacy_extract_street_and_house, corpus)
+    compiled = run("normalizer (без кеша)", uncached.extract, corpus)
+    cached = run("normalizer (LRU)", normalizer.extract, corpus)
+
+    print(f"Ускорение: без кеша x{legacy / compiled:.1f}, с кешем x{legacy / cached:.1f}")
+    print(f"Кеш: {normalizer.cache_info()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""Запись ответов Transport2 и нагрузочный прогон `process_orders()` на них.
+
+Запись фикстур (нужны доступ к Transport2 и токен в .env):
+    python -m benchmarks.ingest_replay record
+
+Прогон (офлайн: запросы к Transport2 и ATI заглушены):
+    python -m benchmarks.ingest_replay replay --sizes 1000 10000 100000
+
+Заявки из фикстур размножаются до нужного объема (новые externalNo, даты
+сдвигаются в будущее). Если фикстур нет, используется встроенный образец заявки.
+БД берется из BENCH_DATABASE_URL (по умолчанию — SQLite во временном каталоге),
+таблицы пересоздаются перед каждым прогоном, поэтому для Postgres нужна отдельная пустая база.
+
+Для каждого объема выполняются три цикла: "cold" (все заявки новые), "warm"
+(повторный опрос без изменений) и "changed" (у доли заявок, --changed-share,
+изменились ставка и комментарий — обновление существующих записей). Отчет: заявок в секунду, SQL-запросов на заявку,
+пиковая память Python (tracemalloc).
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import requests
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "transport2"
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+# order_type -> (файл фикстуры, корневое поле ответа)
+FIXTURE_FILES = {
+    "ASSIGNED": ("assigned.json", "assignedOrders"),
+    "AUCTION": ("auction.json", "auctionOrders"),
+    "FREE": ("free.json", "freeOrders"),
+}
+
+# Образец заявки на случай, если фикстуры еще не записаны
+SAMPLE_ORDER = {
+    "externalNo": "BENCH",
+    "loadingPlaces": [{"storagePoint": {"settlement": "Екатеринбург", "address": "г Екатеринбург, ул Монтажников, 4 (склад)"}}],
+    "unloadingPlaces": [{"storagePoint": {"settlement": "Пермь", "address": "г Пермь, ш Космонавтов, 111, корп 2"}}],
+    "loadingDatetime": None,
+    "unloadingDatetime": None,
+    "weight": 10,
+    "volume": 82,
+    "loadingTypes": "Задняя, Боковая",
+    "comment": "Паллеты, 33 шт",
+    "status": None,
+    "vehicleRequirements": {"name": "Тент 82 м3"},
+}
+
+# ---------------------------------------------------------------------------
+# Заглушка сети: все запросы через `requests` обрабатываются здесь
+# ---------------------------------------------------------------------------
+
+ATI_STUB_RESPONSES = (
+    # (метод, фрагмент url, код, тело)
+    ("GET", "/dictionaries/carTypes", 200, [{"Name": "Тент", "TypeId": 200}, {"Name": "Реф", "TypeId": 300}]),
+    ("GET", "/dictionaries/loadingTypes", 200, [{"Name": "Задняя", "Id": 4}, {"Name": "Боковая", "Id": 2}, {"Name": "Верхняя", "Id": 1}]),
+    ("GET", "/dictionaries/unloadingTypes", 200, [{"Name": "Задняя", "Id": 4}, {"Name": "Боковая", "Id": 2}, {"Name": "Верхняя", "Id": 1}]),
+    ("POST", "/autocomplete/suggestions", 200, {"suggestions": [{"city": {"id": 1}}]}),
+    ("GET", "/firms/contacts", 200, [{"id": 1, "name": "Бенчмарк"}]),
+    ("POST", "/v2/cargos", 200, {"cargo_application": {"cargo_id": "bench", "cargo_number": "BENCH-1"}}),
+    ("PUT", "/v2/cargos/", 200, {}),
+    ("DELETE", "/loads/", 200, {}),
+)
+
+class NetworkDisabled(RuntimeError):
+    pass
+
+def _stub_request(self, method, url, *args, **kwargs):
+    for stub_method, fragment, status_code, body in ATI_STUB_RESPONSES:
+        if method.upper() == stub_method and fragment in url:
+            response = requests.models.Response()
+            response.status_code = status_code
+            response._content = json.dumps(body).encode("utf-8")
+            response.headers["Content-Type"] = "application/json"
+            response.url = url
+            return response
+    raise NetworkDisabled(f"Бенчмарк работает без сети: {method} {url}")
+
+def disable_network():
+    """Подменяет `requests` (все вызовы идут через Session.request)"""
+    requests.sessions.Session.request = _stub_request
+
+# ---------------------------------------------------------------------------
+# Фикстуры
+# ---------------------------------------------------------------------------
+
+def record_fixtures():
+    """Сохраняет текущие ответы трех фидов Transport2 как есть"""
+    from app.parsers import transport2
+
+    FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+    urls = {feed[0]: feed[1] for feed in transport2.FEEDS}
+
+    for order_type, (file_name, response_key) in FIXTURE_FILES.items():
+        response = requests.post(urls[order_type], headers=transport2.headers, json=transport2.build_payload(order_type))
+        response.raise_for_status()
+        data = response.json()
+        (FIXTURES_DIR / file_name).write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"💾 {order_type}: {len((data.get('data') or {}).get(response_key) or [])} заявок → {FIXTURES_DIR / file_name}")
+
+def load_fixture_orders():
+    """Возвращает {order_type: [orders]} из фикстур (или образец заявки)"""
+    feeds = {}
+    for order_type, (file_name, response_key) in FIXTURE_FILES.items():
+        path = FIXTURES_DIR / file_name
+        if path.exists():
+            data = json.loads(path.read_text(encoding="utf-8"))
+            feeds[order_type] = (data.get("data") or {}).get(response_key) or []
+
+    if not any(feeds.values()):
+        print("ℹ️ Фикстуры не найдены, используется встроенный образец заявки")
+        auction_order = {**SAMPLE_ORDER, "lot": {"auctionStatus": "ACTIVE", "startPrice": 50000, "lastBet": None}}
+        feeds = {
+            "ASSIGNED": [{**SAMPLE_ORDER, "price": 45000}],
+            "AUCTION": [auction_order],
+            "FREE": [{**SAMPLE_ORDER, "price": 40000}],
+        }
+    return feeds
+
+def scale_feeds(feeds, size):
+    """Размножает заявки до `size` штук (поровну по непустым фидам)"""
+    feeds = {order_type: orders for order_type, orders in feeds.items() if orders}
+    per_feed = size // len(feeds)
+    now = datetime.now(timezone.utc)
+    statuses = {"ASSIGNED": "ASSIGNED", "AUCTION": "FREE", "FREE": "FREE"}
+
+    scaled = {}
+    for feed_index, (order_type, templates) in enumerate(feeds.items()):
+        count = per_feed + (size - per_feed * len(feeds) if feed_index == 0 else 0)
+        orders = []
+        for index in range(count):
+            order = copy.deepcopy(templates[index % len(templates)])
+            order["externalNo"] = f"{order.get('externalNo')}-{order_type[:2]}{index}"
+            # Даты в будущем, чтобы заявки прошли фильтр актуальности
+            loading = now + timedelta(days=1, hours=index % 72)
+            order["loadingDatetime"] = loading.isoformat()
+            order["unloadingDatetime"] = (loading + timedelta(days=1)).isoformat()
+            order["status"] = statuses[order_type]
+            if order_type == "AUCTION":
+                order["lot"] = {**(order.get("lot") or {}), "auctionStatus": "ACTIVE"}
+            orders.append(order)
+        scaled[order_type] = orders
+    return scaled
+
+def change_feeds(feeds, share):
+    """Копия фидов, где у каждой 1/share-й заявки изменены ставка и комментарий"""
+    step = max(1, round(1 / share)) if share > 0 else None
+    changed = {}
+    for order_type, orders in feeds.items():
+        changed[order_type] = []
+        for index, order in enumerate(orders):
+            if step and index % step == 0:
+                order = {**order, "comment": f"{order.get('comment') or ''} (изм.)"}
+                if order_type == "AUCTION":
+                    lot = order.get("lot") or {}
+                    order["lot"] = {**lot, "lastBet": (lot.get("lastBet") or lot.get("startPrice") or 50000) - 500}
+                else:
+                    order["price"] = (order.get("price") or 40000) + 500
+            changed[order_type].append(order)
+    return changed
+
+# ---------------------------------------------------------------------------
+# Прогон
+# ---------------------------------------------------------------------------
+
+class StatementCounter:
+    """Считает SQL-запросы всех движков процесса (executemany — один запрос)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+def reset_database(transport2, auto_publish):
+    from app.models import Base, Platform, DistributionRule
+
+    transport2.session.close()
+    engine = transport2.session.get_bind()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    transport2.session.add(Platform(name=transport2.PLATFORM_NAME, enabled=True, auth_data={}))
+    transport2.session.add(DistributionRule(
+        platform=transport2.PLATFORM_NAME, loading_city=None, unloading_city=None, logistician="Бенчмарк",
+        margin_percent=10, auction_margin_percent=5, auto_publish=auto_publish, auto_publish_auction=auto_publish,
+        publish_delay=0,
+    ))
+    transport2.session.commit()
+
+def install_feeds(transport2, feeds):
+    """Подменяет загрузку фидов: ответы берутся из памяти, разбор — штатный"""
+    urls = {feed[0]: feed[1] for feed in transport2.FEEDS}
+
+    async def fetch_all_orders(client=None, errors=None, client_headers=None):
+        return tuple(
+            transport2.parse_orders_response(
+                urls[order_type], {"data": {FIXTURE_FILES[order_type][1]: feeds.get(order_type, [])}},
+                is_auction=order_type == "AUCTION", is_free=order_type == "FREE",
+            )
+            for order_type in ("ASSIGNED", "AUCTION", "FREE")
+        )
+
+    transport2.fetch_all_orders = fetch_all_orders
+
+def run_pass(transport2, counter, size, trace_memory, verbose):
+    counter.count = 0
+    if trace_memory:
+        tracemalloc.start()
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    started = time.perf_counter()
+    with output:
+        stats = transport2.process_orders(streaming=False)
+    elapsed = time.perf_counter() - started
+
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "seconds": elapsed,
+        "orders_per_sec": size / elapsed if elapsed else 0,
+        "statements": counter.count,
+        "statements_per_order": counter.count / size,
+        "peak_mb": peak / 1024 / 1024 if peak is not None else None,
+        "stats": stats,
+    }
+
+def replay(sizes, auto_publish=False, trace_memory=True, verbose=False, changed_share=0.1):
+    disable_network()  # До импорта приложения: ati_transformer загружает словари ATI при импорте
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app.parsers import transport2
+
+    counter = StatementCounter()
+    event.listen(Engine, "before_cursor_execute", counter)
+
+    feeds = load_fixture_orders()
+    print(f"{'заявок':>8} {'проход':>7} {'сек':>8} {'заявок/с':>10} {'SQL':>8} {'SQL/заявка':>11} {'пик, МБ':>8}")
+
+    results = []
+    for size in sizes:
+        reset_database(transport2, auto_publish)
+        scaled = scale_feeds(feeds, size)
+        install_feeds(transport2, scaled)
+
+        for pass_name in ("cold", "warm", "changed"):
+            if pass_name == "changed":
+                install_feeds(transport2, change_feeds(scaled, changed_share))
+            result = run_pass(transport2, counter, size, trace_memory, verbose)
+            result.update(size=size, name=pass_name)
+            results.append(result)
+            peak = f"{result['peak_mb']:8.1f}" if result["peak_mb"] is not None else f"{'—':>8}"
+            print(
+                f"{size:>8} {pass_name:>7} {result['seconds']:8.2f} {result['orders_per_sec']:10.0f} "
+                f"{result['statements']:>8} {result['statements_per_order']:11.3f} {peak}"
+            )
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("record", help="записать ответы Transport2 в фикстуры")
+
+    replay_parser = subparsers.add_parser("replay", help="прогнать фикстуры через process_orders()")
+    replay_parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    replay_parser.add_argument("--auto-publish", action="store_true", help="включить авто-публикацию (ATI заглушен)")
+    replay_parser.add_argument("--no-memory", action="store_true", help="не замерять память (tracemalloc замедляет прогон)")
+    replay_parser.add_argument("--verbose", action="store_true", help="не скрывать вывод конвейера")
+    replay_parser.add_argument("--changed-share", type=float, default=0.1, help="доля заявок, измененных в проходе changed")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record_fixtures()
+        return
+
+    # БД прогона задается до импорта приложения (.env не переопределяет переменные окружения)
+    os.environ["DATABASE_URL"] = os.getenv(
+        "BENCH_DATABASE_URL", f"sqlite:///{Path(tempfile.mkdtemp()) / 'ingest_bench.db'}"
+    )
+    os.environ.setdefault("ATI_API_TOKEN", "bench")
+    replay(
+        args.sizes, auto_publish=args.auto_publish, trace_memory=not args.no_memory, verbose=args.verbose,
+        changed_share=args.changed_share,
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Orders dates with timezone
+
+Revision ID: 5a7c0e9d2f61
+Revises: 8e2d47b0c915
+Create Date: 2025-03-26 11:42:07.519304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a7c0e9d2f61'
+down_revision: Union[str, None] = '8e2d47b0c915'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Старые значения уходили в ATI со смещением +00:00 — считаем их UTC
+    op.alter_column('orders', 'load_date',
+               existing_type=sa.DateTime(),
+               type_=sa.DateTime(timezone=True),
+               existing_nullable=False,
+               postgresql_using="load_date AT TIME ZONE 'UTC'")
+    op.alter_column('orders', 'unload_date',
+               existing_type=sa.DateTime(),
+               type_=sa.DateTime(timezone=True),
+               existing_nullable=True,
+               postgresql_using="unload_date AT TIME ZONE 'UTC'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('orders', 'unload_date',
+               existing_type=sa.DateTime(timezone=True),
+               type_=sa.DateTime(),
+               existing_nullable=True,
+               postgresql_using="unload_date AT TIME ZONE 'UTC'")
+    op.alter_column('orders', 'load_date',
+               existing_type=sa.DateTime(timezone=True),
+               type_=sa.DateTime(),
+               existing_nullable=False,
+               postgresql_using="load_date AT TIME ZONE 'UTC'")
@@ -0,0 +1,96 @@
+"""Общие фикстуры тестов.
+
+Тесты работают офлайн на временной SQLite-базе: переменные окружения задаются
+до импорта приложения (движки БД и словари ATI создаются при импорте модулей).
+"""
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+import requests
+
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'asp_test.db'}"
+os.environ.setdefault("ATI_API_TOKEN", "test")
+os.environ["ATI_RATE_LIMIT"] = "0"
+os.environ["CITY_PREWARM_WORKERS"] = "0"
+os.environ["METRICS_DIR"] = tempfile.mkdtemp()
+
+# Ответы ATI, которые нужны при импорте приложения (словари типов кузова и загрузки)
+ATI_DICTIONARIES = {
+    "/dictionaries/carTypes": [{"Name": "Тент", "TypeId": 200}],
+    "/dictionaries/loadingTypes": [{"Name": "Задняя", "Id": 4}, {"Name": "Боковая", "Id": 2}, {"Name": "Верхняя", "Id": 1}],
+    "/dictionaries/unloadingTypes": [{"Name": "Задняя", "Id": 4}, {"Name": "Боковая", "Id": 2}, {"Name": "Верхняя", "Id": 1}],
+}
+
+class NetworkDisabled(RuntimeError):
+    pass
+
+def _offline_request(self, method, url, *args, **kwargs):
+    for fragment, body in ATI_DICTIONARIES.items():
+        if method.upper() == "GET" and fragment in url:
+            response = requests.models.Response()
+            response.status_code = 200
+            response._content = json.dumps(body).encode("utf-8")
+            response.url = url
+            return response
+    raise NetworkDisabled(f"Тесты работают без сети: {method} {url}")
+
+requests.sessions.Session.request = _offline_request
+
+from app.database import SessionLocal, engine
+from app.models import Base, DistributionRule, Platform
+
+@pytest.fixture
+def db():
+    """Сессия на пустой базе (таблицы пересоздаются для каждого теста)"""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def make_rule(db):
+    """Создает правило распределения; по умолчанию — универсальное для transport2"""
+    def make_rule(**fields):
+        values = {
+            "platform": "transport2", "loading_city": None, "unloading_city": None, "logistician": "Иванов",
+            "margin_percent": 10, "auction_margin_percent": 5, "auto_publish": False,
+            "auto_publish_auction": False, "publish_delay": 0, "payment_days": 0,
+        }
+        values.update(fields)
+        rule = DistributionRule(**values)
+        db.add(rule)
+        db.commit()
+        return rule
+    return make_rule
+
+def order_row(external_no, **fields):
+    """Запись таблицы `orders` в том виде, в каком ее готовит конвейер"""
+    from datetime import datetime, timedelta, timezone
+
+    row = {
+        "external_no": external_no,
+        "platform": "transport2",
+        "load_date": datetime.now(timezone.utc) + timedelta(days=1),
+        "unload_date": None,
+        "loading_city": "Екатеринбург",
+        "unloading_city": "Пермь",
+        "weight_volume": "10 т / 82 м³",
+        "vehicle_type": "Тент 82 м3",
+        "loading_types": "Задняя",
+        "comment": "",
+        "ati_price": None,
+        "is_published": False,
+        "order_type": "FREE",
+        "bid_price": 40000,
+        "loading_address": "ул Монтажников",
+        "unloading_address": "ш Космонавтов, 111",
+        "content_hash": f"hash-{external_no}",
+    }
+    row.update(fields)
+    return row
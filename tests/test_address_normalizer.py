@@ -0,0 +1,41 @@
+import pytest
+
+from app.transformers.address_normalizer import AddressNormalizer
+from benchmarks.address_normalizer_bench import build_corpus, legacy_extract_street_and_house
+
+# Адреса, на которых прежняя реализация ведет себя неочевидно
+EDGE_CASES = [
+    None,
+    "",
+    "   ",
+    "620000, Свердловская обл, г Екатеринбург, ул Монтажников, д 4",
+    "г. Екатеринбург, Улица Мира, 12, стр 3",
+    "Свердловская обл, пгт Белоярский, Складская, 7",
+    "г Москва (ориентир склад №3), ш Энтузиастов, 5",
+    "Пермь, ш Космонавтов, 111",
+    "Пермь, Космонавтов, 111",                      # Нет ни улицы, ни населенного пункта
+    "г Казань, ул Ленина",                          # Нет номера дома
+    "г Казань, пер Базовый, Складская, 4",
+    "д 5, ул Ленина, д 5",                          # Повторяющиеся поля
+    "Сибирский тракт, 1-й км, г Екатеринбург",
+    "ориентир, г Челябинск, ул Ленина, 1",
+    "г Челябинск,, ул Ленина,, 1",
+    "УЛ ЛЕНИНА, Д 1",
+    "с Кольцово, Г Екатеринбург",
+]
+
+@pytest.mark.parametrize("include_house_number", [False, True])
+def test_normalizer_matches_legacy_implementation(include_house_number):
+    normalizer = AddressNormalizer()
+    corpus = EDGE_CASES + sorted(set(build_corpus(unique_addresses=500, total=500)))
+
+    for address in corpus:
+        expected = legacy_extract_street_and_house(address, include_house_number)
+        assert normalizer.extract(address, include_house_number) == expected, address
+
+def test_cached_results_match_uncached():
+    cached, uncached = AddressNormalizer(), AddressNormalizer(cache_size=0)
+    corpus = build_corpus(unique_addresses=50, total=1000)
+
+    assert [cached.extract(address) for address in corpus] == [uncached.extract(address) for address in corpus]
+    assert cached.cache_info().hits >= 950
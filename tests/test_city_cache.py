@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+from app import city_cache
+from app.city_cache import CityIdCache
+from app.models import CityCache
+
+@pytest.fixture
+def ati(monkeypatch):
+    """Заглушка поиска города в ATI: ответы задаются в `ati.responses`, запросы пишутся в `ati.calls`"""
+    class Ati:
+        responses = {}
+        calls = []
+
+    def fetch_city_id(city_name):
+        Ati.calls.append(city_name)
+        response = Ati.responses.get(city_name, (200, None))
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    Ati.responses, Ati.calls = {}, []
+    monkeypatch.setattr(city_cache, "fetch_city_id", fetch_city_id)
+    return Ati
+
+def age_entries(db, seconds):
+    """Сдвигает время ответов ATI в таблице в прошлое"""
+    db.query(CityCache).update({CityCache.resolved_at: datetime.utcnow() - timedelta(seconds=seconds)})
+    db.commit()
+
+def test_found_city_is_cached_in_memory_and_table(db, ati):
+    ati.responses["Москва"] = (200, 1)
+    cache = CityIdCache()
+
+    assert cache.get("Москва", db) == 1
+    assert cache.get("г. Москва", db) == 1
+    cache.invalidate()
+    assert cache.get("Москва", db) == 1
+    assert ati.calls == ["Москва"]
+
+def test_found_city_is_rechecked_after_ttl(db, ati):
+    ati.responses["Москва"] = (200, 1)
+    cache = CityIdCache(ttl=60)
+    cache.get("Москва", db)
+
+    age_entries(db, 120)
+    cache.invalidate()
+    ati.responses["Москва"] = (200, 2)
+
+    assert cache.get("Москва", db) == 2
+    assert ati.calls == ["Москва", "Москва"]
+
+def test_missing_city_is_cached_for_miss_ttl(db, ati):
+    cache = CityIdCache(ttl=3600, miss_ttl=60)
+
+    assert cache.get("Нигде", db) is None
+    cache.invalidate()
+    assert cache.get("Нигде", db) is None
+    assert ati.calls == ["Нигде"]
+
+    age_entries(db, 120)
+    cache.invalidate()
+    assert cache.get("Нигде", db) is None
+    assert ati.calls == ["Нигде", "Нигде"]
+
+@pytest.mark.parametrize("error", [(500, None), requests.exceptions.ConnectionError("offline")])
+def test_errors_are_not_cached(db, ati, error):
+    ati.responses["Москва"] = error
+    cache = CityIdCache()
+
+    assert cache.get("Москва", db) is None
+    assert cache.get("Москва", db) is None
+    assert len(ati.calls) == 2
+    assert db.query(CityCache).count() == 0
+
+def test_stale_id_is_used_while_ati_is_unavailable(db, ati):
+    ati.responses["Москва"] = (200, 1)
+    cache = CityIdCache(ttl=60)
+    cache.get("Москва", db)
+
+    age_entries(db, 120)
+    cache.invalidate()
+    ati.responses["Москва"] = (503, None)
+
+    assert cache.get("Москва", db) == 1
+
+def test_memory_is_bounded(db, ati):
+    ati.responses.update({"Москва": (200, 1), "Пермь": (200, 2)})
+    cache = CityIdCache(maxsize=1)
+
+    cache.get("Москва", db)
+    cache.get("Пермь", db)
+
+    assert list(cache._entries) == ["пермь"]
+
+def test_prewarm_requests_only_unknown_cities(db, ati):
+    ati.responses.update({"Москва": (200, 1), "г. Пермь": (200, 2)})
+    cache = CityIdCache()
+    cache.get("Москва", db)
+
+    assert cache.prewarm(["Москва", "г. Пермь", "Пермь"], db, max_workers=1) == 1
+    assert ati.calls == ["Москва", "г. Пермь"]
+    assert cache.get("Пермь", db) == 2
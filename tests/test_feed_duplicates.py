@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import pipeline
+from app.models import Order
+from app.parsers import transport2
+
+def raw_order(external_no, **fields):
+    loading = datetime.now(timezone.utc) + timedelta(days=1)
+    order = {
+        "externalNo": external_no,
+        "loadingPlaces": [{"storagePoint": {"settlement": "Екатеринбург", "address": "г Екатеринбург, ул Монтажников, 4"}}],
+        "unloadingPlaces": [{"storagePoint": {"settlement": "Пермь", "address": "г Пермь, ш Космонавтов, 111"}}],
+        "loadingDatetime": loading.isoformat(),
+        "unloadingDatetime": (loading + timedelta(days=1)).isoformat(),
+        "weight": 10,
+        "volume": 82,
+        "loadingTypes": "Задняя",
+        "comment": "",
+        "status": "FREE",
+        "vehicleRequirements": {"name": "Тент 82 м3"},
+        "price": 40000,
+    }
+    order.update(fields)
+    return order
+
+@pytest.fixture
+def parser(db, make_rule):
+    make_rule()
+    transport2.session.close()
+    return transport2.transport2_parser
+
+def test_dedupe_prefers_higher_priority_feed(parser):
+    free = raw_order("T-1")
+    auction = raw_order("T-1", lot={"auctionStatus": "ACTIVE", "startPrice": 50000, "lastBet": None})
+
+    for items in ([(free, "FREE"), (auction, "AUCTION")], [(auction, "AUCTION"), (free, "FREE")]):
+        assert pipeline.dedupe_items(parser, items) == [(auction, "AUCTION")]
+
+def test_order_in_two_feeds_is_not_rewritten_every_cycle(db, parser):
+    free = raw_order("T-1")
+    auction = raw_order("T-1", lot={"auctionStatus": "ACTIVE", "startPrice": 50000, "lastBet": None})
+
+    first = pipeline.ingest_orders(db, parser, [(free, "FREE"), (auction, "AUCTION")], workers=0)
+    assert first["inserted"] == 1
+
+    for items in ([(free, "FREE"), (auction, "AUCTION")], [(auction, "AUCTION"), (free, "FREE")]) * 2:
+        stats = pipeline.ingest_orders(db, parser, items, workers=0)
+        assert (stats["inserted"], stats["updated"], stats["deleted"]) == (0, 0, 0)
+
+    assert db.query(Order.order_type).scalar() == "AUCTION"
+
+@pytest.mark.parametrize("arrival", [("FREE", "AUCTION"), ("AUCTION", "FREE")])
+def test_stream_picks_same_duplicate_regardless_of_arrival(db, parser, monkeypatch, arrival):
+    orders = {
+        "FREE": raw_order("T-1"),
+        "AUCTION": raw_order("T-1", lot={"auctionStatus": "ACTIVE", "startPrice": 50000, "lastBet": None}),
+    }
+    batches = []
+    real_batch = transport2.process_orders_batch
+    monkeypatch.setattr(transport2, "process_orders_batch", lambda pending: batches.append(pending) or real_batch(pending))
+
+    for order_arrival in (arrival, tuple(reversed(arrival)), arrival):
+        monkeypatch.setattr(transport2, "iter_all_orders_stream", lambda errors=None, order_arrival=order_arrival: (
+            (orders[order_type], order_type) for order_type in order_arrival
+        ))
+        transport2.process_orders_stream()
+
+    transport2.session.expire_all()
+    assert transport2.session.query(Order.order_type).scalar() == "AUCTION"
+    assert [[order_type for _, order_type, _ in pending] for pending in batches] == [["AUCTION"]]
+
+def test_stream_writes_real_type_change(db, parser, monkeypatch):
+    auction = raw_order("T-1", lot={"auctionStatus": "ACTIVE", "startPrice": 50000, "lastBet": None})
+    free = raw_order("T-1")
+
+    monkeypatch.setattr(transport2, "iter_all_orders_stream", lambda errors=None: iter([(auction, "AUCTION")]))
+    transport2.process_orders_stream()
+    monkeypatch.setattr(transport2, "iter_all_orders_stream", lambda errors=None: iter([(free, "FREE")]))
+    transport2.process_orders_stream()
+
+    transport2.session.expire_all()
+    assert transport2.session.query(Order.order_type).scalar() == "FREE"
@@ -0,0 +1,83 @@
+import json
+
+from app.metrics import CYCLES, MetricsRegistry, load_saved_metrics, save_metrics
+from app.routes.metrics import get_metrics
+
+def make_registry():
+    metrics = MetricsRegistry()
+    requests = metrics.counter("asp_requests_total", "Запросы", ("operation", "status"))
+    stage = metrics.histogram("asp_stage_seconds", "Длительность этапа", ("stage",), buckets=(0.1, 1))
+    return metrics, requests, stage
+
+def test_render_text_format():
+    metrics, requests, stage = make_registry()
+    requests.inc(operation="publish", status="200")
+    requests.inc(2, operation='up"date\\', status="5\n00")
+    stage.observe(0.05, stage="fetch")
+    stage.observe(0.5, stage="fetch")
+
+    assert metrics.render().splitlines() == [
+        "# HELP asp_requests_total Запросы",
+        "# TYPE asp_requests_total counter",
+        'asp_requests_total{operation="publish",status="200"} 1',
+        'asp_requests_total{operation="up\\"date\\\\",status="5\\n00"} 2',
+        "# HELP asp_stage_seconds Длительность этапа",
+        "# TYPE asp_stage_seconds histogram",
+        'asp_stage_seconds_bucket{stage="fetch",le="0.1"} 1',
+        'asp_stage_seconds_bucket{stage="fetch",le="1"} 2',
+        'asp_stage_seconds_bucket{stage="fetch",le="+Inf"} 2',
+        'asp_stage_seconds_sum{stage="fetch"} 0.55',
+        'asp_stage_seconds_count{stage="fetch"} 2',
+    ]
+
+def test_empty_metrics_render_only_headers():
+    metrics, _, _ = make_registry()
+
+    assert metrics.render() == (
+        "# HELP asp_requests_total Запросы\n# TYPE asp_requests_total counter\n"
+        "# HELP asp_stage_seconds Длительность этапа\n# TYPE asp_stage_seconds histogram\n"
+    )
+
+def test_delta_reports_only_growth():
+    metrics, requests, stage = make_registry()
+    requests.inc(operation="publish", status="200")
+    stage.observe(2, stage="fetch")
+    assert metrics.delta() == {
+        "asp_requests_total": [[["publish", "200"], 1]],
+        "asp_stage_seconds": [[["fetch"], [[0, 0], 2, 1]]],
+    }
+
+    requests.inc(operation="publish", status="200")
+    assert metrics.delta() == {"asp_requests_total": [[["publish", "200"], 1]]}
+    assert metrics.delta() == {}
+
+def test_saved_metrics_are_rendered_by_api_process(tmp_path):
+    worker, requests, stage = make_registry()
+    requests.inc(operation="publish", status="200")
+    stage.observe(0.5, stage="fetch")
+    save_metrics("worker", worker, str(tmp_path))
+
+    # Второй процесс с тем же именем дописывает свой прирост, а не затирает файл
+    runner, runner_requests, _ = make_registry()
+    runner_requests.inc(3, operation="publish", status="200")
+    save_metrics("worker", runner, str(tmp_path))
+    requests.inc(operation="delete", status="404")
+    save_metrics("worker", worker, str(tmp_path))
+
+    api, _, _ = make_registry()
+    lines = api.render(load_saved_metrics(str(tmp_path))).splitlines()
+
+    assert 'asp_requests_total{operation="publish",status="200"} 4' in lines
+    assert 'asp_requests_total{operation="delete",status="404"} 1' in lines
+    assert 'asp_stage_seconds_bucket{stage="fetch",le="1"} 1' in lines
+    assert 'asp_stage_seconds_count{stage="fetch"} 1' in lines
+
+def test_metrics_route_includes_saved_metrics(monkeypatch, tmp_path):
+    saved = {"asp_cycles_total": [[["Transport2"], 5]]}
+    (tmp_path / "runner.json").write_text(json.dumps(saved), encoding="utf-8")
+    monkeypatch.setattr("app.metrics.METRICS_DIR", str(tmp_path))
+
+    own = CYCLES.values.get(("Transport2",), 0)  # Циклы, выполненные другими тестами в этом процессе
+    body = get_metrics().body.decode("utf-8")
+
+    assert f'asp_cycles_total{{platform="Transport2"}} {own + 5}' in body.splitlines()
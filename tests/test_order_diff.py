@@ -0,0 +1,29 @@
+from datetime import datetime, timezone, timedelta
+
+from app.order_diff import ATI_FIELDS, DIFF_FIELDS, affects_ati, diff_order
+
+def test_every_ati_field_can_change():
+    assert ATI_FIELDS <= set(DIFF_FIELDS)
+
+def test_diff_reports_only_changed_fields_present_in_row():
+    existing = {"comment": "старый", "bid_price": 100, "loading_city": "Пермь"}
+    row = {"comment": "новый", "bid_price": 100}
+
+    assert diff_order(existing, row) == {"comment": ("старый", "новый")}
+
+def test_dates_compare_as_moments():
+    moment = datetime(2025, 3, 1, 9, 0, tzinfo=timezone.utc)
+    same_moment = moment.astimezone(timezone(timedelta(hours=5)))
+
+    assert diff_order({"load_date": moment}, {"load_date": same_moment}) == {}
+    assert diff_order({"load_date": moment}, {"load_date": moment + timedelta(hours=1)}) == {
+        "load_date": (moment, moment + timedelta(hours=1))
+    }
+
+def test_service_fields_are_not_diffed():
+    assert diff_order({"content_hash": "a", "rule_id": 1}, {"content_hash": "b", "rule_id": 2}) == {}
+
+def test_affects_ati():
+    assert not affects_ati({})
+    assert not affects_ati({"comment": ("a", "b"), "bid_price": (1, 2)})
+    assert affects_ati({"comment": ("a", "b"), "vehicle_type": ("Тент", "Реф")})
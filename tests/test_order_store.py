@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from app.models import Order
+from app.order_store import (
+    bulk_upsert_orders, bulk_update_orders, load_order_fields, delete_missing_orders, find_missing_published,
+)
+from tests.conftest import order_row
+
+def test_generic_upsert_inserts_then_updates_same_key(db):
+    inserted, updated = bulk_upsert_orders(db, [order_row("T-1", comment="первая версия")])
+    assert (inserted, updated) == (["T-1"], [])
+
+    inserted, updated = bulk_upsert_orders(db, [order_row("T-1", comment="вторая версия")])
+    assert (inserted, updated) == ([], ["T-1"])
+
+    orders = db.query(Order).all()
+    assert len(orders) == 1
+    assert orders[0].comment == "вторая версия"
+
+def test_generic_upsert_keeps_fields_outside_update_columns(db):
+    bulk_upsert_orders(db, [order_row("T-1", ati_price=36000, logistician_name="Иванов")])
+    bulk_upsert_orders(db, [order_row("T-1", ati_price=1, logistician_name="Петров", bid_price=50000)])
+
+    order = db.query(Order).filter(Order.external_no == "T-1").one()
+    assert order.bid_price == 50000
+    assert order.ati_price == 36000  # Назначается при создании
+    assert order.logistician_name == "Иванов"
+
+def test_generic_upsert_mixed_batch_and_duplicates(db):
+    bulk_upsert_orders(db, [order_row("T-1")])
+    inserted, updated = bulk_upsert_orders(db, [order_row("T-2"), order_row("T-1"), order_row("T-2", comment="дубль")])
+
+    assert inserted == ["T-2"]
+    assert updated == ["T-1"]
+    assert db.query(Order).filter(Order.external_no == "T-2").one().comment == ""  # Побеждает первая запись
+
+def test_upsert_all_columns(db):
+    bulk_upsert_orders(db, [order_row("T-1")], update_columns=None)
+    inserted, updated = bulk_upsert_orders(db, [order_row("T-1", ati_price=100)], update_columns=None)
+
+    assert updated == ["T-1"]
+    assert db.query(Order).one().ati_price == 100
+
+def test_load_and_bulk_update(db):
+    bulk_upsert_orders(db, [order_row("T-1"), order_row("T-2")])
+    fields = load_order_fields(db, ["T-1", "T-2", "T-3"], ("id", "bid_price"))
+    assert set(fields) == {"T-1", "T-2"}
+
+    assert bulk_update_orders(db, [{"id": fields["T-1"]["id"], "ati_price": 123}]) == 1
+    assert db.query(Order).filter(Order.external_no == "T-1").one().ati_price == 123
+
+def test_delete_missing_returns_published_rows(db):
+    bulk_upsert_orders(db, [order_row("T-1"), order_row("T-2"), order_row("T-3")])
+    db.query(Order).filter(Order.external_no == "T-2").update({Order.cargo_id: "cargo-2"})
+    db.commit()
+
+    deleted, ati_rows = delete_missing_orders(db, "transport2", {"T-1"})
+
+    assert deleted == 2
+    assert [(row.external_no, row.cargo_id) for row in ati_rows] == [("T-2", "cargo-2")]
+    assert [order.external_no for order in db.query(Order)] == ["T-1"]
+
+# Postgres-вариант (INSERT ... ON CONFLICT): нужна пустая база в TEST_POSTGRES_URL
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+@pytest.fixture
+def pg_db():
+    if not TEST_POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL не задан")
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.models import Base
+
+    engine = create_engine(TEST_POSTGRES_URL)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(engine)
+        engine.dispose()
+
+def test_postgres_upsert_inserts_then_updates_same_key(pg_db):
+    assert bulk_upsert_orders(pg_db, [order_row("T-1", comment="первая версия")]) == (["T-1"], [])
+    assert bulk_upsert_orders(pg_db, [order_row("T-1", comment="вторая версия"), order_row("T-2")]) == (["T-2"], ["T-1"])
+    assert pg_db.query(Order).filter(Order.external_no == "T-1").one().comment == "вторая версия"
+
+def test_postgres_delete_missing(pg_db):
+    bulk_upsert_orders(pg_db, [order_row("T-1"), order_row("T-2")])
+    deleted, ati_rows = delete_missing_orders(pg_db, "transport2", {"T-1"})
+    assert (deleted, ati_rows) == (1, [])
+
+def test_postgres_find_missing_published(pg_db):
+    bulk_upsert_orders(pg_db, [order_row("T-1", cargo_id=None), order_row("T-2", cargo_id="cargo-2"), order_row("T-3", cargo_id="cargo-3")])
+    rows = find_missing_published(pg_db, "transport2", {"T-1", "T-3"})
+    assert [(row.external_no, row.cargo_id) for row in rows] == [("T-2", "cargo-2")]
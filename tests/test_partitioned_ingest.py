@@ -0,0 +1,111 @@
+from concurrent.futures import Future
+
+import pytest
+
+from app import pipeline
+from app.metrics import MetricsRegistry
+from app.models import Order
+from app.order_store import bulk_upsert_orders
+from app.parsers import transport2
+from tests.conftest import order_row
+from tests.test_feed_duplicates import raw_order
+
+LOT = {"auctionStatus": "ACTIVE", "startPrice": 50000, "lastBet": None}
+
+class InlinePool:
+    """Пул процессов в текущем процессе: задача выполняется сразу при submit"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+@pytest.fixture
+def parser(db, make_rule, monkeypatch):
+    make_rule()
+    monkeypatch.setattr(pipeline, "PARTITION_MIN_ORDERS", 0)
+    monkeypatch.setattr(pipeline, "get_partition_pool", lambda workers: InlinePool())
+    return transport2.transport2_parser
+
+def feed_items(count):
+    """Заявки трех фидов; каждая пятая есть и в свободных, и в аукционе"""
+    items = [(raw_order(f"T-{index}"), "FREE") for index in range(count)]
+    items += [(raw_order(f"T-{index}", lot=LOT), "AUCTION") for index in range(0, count, 5)]
+    items += [(raw_order(f"A-{index}", status="ASSIGNED"), "ASSIGNED") for index in range(count // 2)]
+    return items
+
+def stored(db):
+    db.expire_all()
+    return dict(db.query(Order.external_no, Order.order_type))
+
+def test_partitions_are_stable_and_keep_duplicates_together(parser):
+    items = feed_items(60)
+    partitions = pipeline.partition_items(parser, items, 4)
+
+    assert len(partitions) <= 4
+    key = lambda item: (item[0]["externalNo"], item[1])
+    assert sorted(map(key, (item for part in partitions for item in part))) == sorted(map(key, items))
+    assert pipeline.partition_items(parser, items, 4) == partitions
+    part_of = {}
+    for index, part in enumerate(partitions):
+        for raw, _ in part:
+            assert part_of.setdefault(raw["externalNo"], index) == index
+
+def test_partitioned_results_are_merged_once_per_order(db, parser):
+    items = feed_items(60)
+
+    stats = pipeline.ingest_orders(db, parser, items, workers=3)
+    assert (stats["inserted"], stats["updated"], stats["deleted"]) == (90, 0, 0)
+    orders = stored(db)
+    assert len(orders) == 90
+    assert {external_no for external_no, order_type in orders.items() if order_type == "AUCTION"} == {
+        f"T-{index}" for index in range(0, 60, 5)
+    }
+
+    # Повторный цикл тех же фидов (в другом порядке) ничего не меняет
+    stats = pipeline.ingest_orders(db, parser, list(reversed(items)), workers=3)
+    assert (stats["inserted"], stats["updated"], stats["deleted"]) == (0, 0, 0)
+
+def test_failed_partition_skips_stale_deletion(db, parser, monkeypatch):
+    bulk_upsert_orders(db, [order_row("OLD-1", platform=transport2.PLATFORM_NAME)])
+    items = feed_items(30)
+    failing = pipeline.partition_items(parser, items, 3)[0]
+    real_ingest_partition = pipeline.ingest_partition
+
+    def ingest_partition(parser, part):
+        if part == failing:
+            raise RuntimeError("процесс части завершился с ошибкой")
+        return real_ingest_partition(parser, part)
+
+    monkeypatch.setattr(pipeline, "ingest_partition", ingest_partition)
+    stats = pipeline.ingest_orders(db, parser, items, workers=3)
+
+    failing_keys = {raw["externalNo"] for raw, _ in failing}
+    assert stats["deleted"] == 0
+    assert "OLD-1" in stored(db)
+    assert stats["inserted"] == 45 - len(failing_keys)
+    assert not failing_keys & set(stored(db))
+
+    # Следующий полный цикл без ошибок записывает пропущенную часть и удаляет неактуальную заявку
+    monkeypatch.setattr(pipeline, "ingest_partition", real_ingest_partition)
+    stats = pipeline.ingest_orders(db, parser, items, workers=3)
+    assert (stats["inserted"], stats["deleted"]) == (len(failing_keys), 1)
+    assert "OLD-1" not in stored(db)
+
+def test_partition_metrics_are_merged_into_parent(db, parser, monkeypatch):
+    metrics = MetricsRegistry()
+    stage = metrics.histogram("asp_stage_duration_seconds", "Длительность этапа", ("platform", "stage"), buckets=(1,))
+    monkeypatch.setattr(pipeline, "registry", metrics)
+
+    def ingest_partition(parser, part):
+        # Так выглядит прирост метрик, присланный процессом пула
+        return [], [], {"asp_stage_duration_seconds": [[["Transport2", "db_write"], [[1], 0.5, 1]]]}
+
+    monkeypatch.setattr(pipeline, "ingest_partition", ingest_partition)
+    pipeline.ingest_orders(db, parser, feed_items(30), workers=3, complete=False)
+
+    parts = len(pipeline.partition_items(parser, feed_items(30), 3))
+    assert stage.values[("Transport2", "db_write")] == [[parts], 0.5 * parts, parts]
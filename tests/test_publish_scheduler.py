@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import publish_scheduler as scheduler_module
+from app.models import Order, ScheduledPublication
+from app.publish_scheduler import PublishScheduler
+from tests.conftest import order_row
+
+@pytest.fixture
+def published(monkeypatch):
+    """Заглушка ATI: список заявок, отправленных на публикацию"""
+    published = []
+
+    def publish_cargo(order):
+        published.append(order.external_no)
+        return {"cargo_id": f"cargo-{order.external_no}", "cargo_number": order.external_no}
+
+    monkeypatch.setattr(scheduler_module, "prepare_order_for_ati", lambda order: order)
+    monkeypatch.setattr(scheduler_module, "publish_cargo", publish_cargo)
+    return published
+
+def add_orders(db, *rows):
+    db.add_all(Order(**row) for row in rows)
+    db.commit()
+
+def tasks(db):
+    db.expire_all()
+    return {task.external_no: task.publish_at for task in db.query(ScheduledPublication)}
+
+def test_schedule_stores_and_reschedules_task(db):
+    scheduler = PublishScheduler(max_workers=1)
+
+    first = scheduler.schedule("T-1", 30)
+    assert tasks(db) == {"T-1": first}
+
+    second = scheduler.schedule("T-1", 60)
+    assert second > first
+    assert tasks(db) == {"T-1": second}
+    assert scheduler._due_at == {"T-1": second}
+
+def test_run_due_publishes_only_due_tasks(db, published):
+    add_orders(db, order_row("T-1"), order_row("T-2"))
+    scheduler = PublishScheduler(max_workers=1)
+    scheduler.schedule("T-1", -1)
+    scheduler.schedule("T-2", 30)
+
+    assert scheduler.run_due() == 1
+    assert published == ["T-1"]
+    assert list(tasks(db)) == ["T-2"]
+
+def test_run_due_filters_by_platform(db, published):
+    add_orders(db, order_row("T-1"), order_row("O-1", platform="other"))
+    scheduler = PublishScheduler(max_workers=1)
+    scheduler.schedule("T-1", -1)
+    scheduler.schedule("O-1", -1)
+
+    assert scheduler.run_due(platform="transport2") == 1
+    assert published == ["T-1"]
+    assert list(tasks(db)) == ["O-1"]
+
+def test_already_published_order_is_not_sent_again(db, published):
+    add_orders(db, order_row("T-1", cargo_id="cargo-1"))
+    scheduler = PublishScheduler(max_workers=1)
+    scheduler.schedule("T-1", -1)
+
+    assert scheduler.run_due() == 1
+    assert published == []
+    assert tasks(db) == {}
+
+def test_cancel_removes_tasks(db, published):
+    add_orders(db, order_row("T-1"))
+    scheduler = PublishScheduler(max_workers=1)
+    scheduler.schedule("T-1", -1)
+
+    assert scheduler.cancel(["T-1"]) == 1
+    assert scheduler.run_due() == 0
+    assert published == []
+
+def test_reload_picks_up_tasks_of_other_processes(db):
+    scheduler = PublishScheduler(max_workers=1)
+    assert scheduler.reload() == 0  # Планировщик не запущен
+
+    scheduler.start()
+    try:
+        db.add(ScheduledPublication(external_no="T-1", publish_at=datetime.utcnow() + timedelta(hours=1)))
+        db.commit()
+
+        assert scheduler.reload() == 1
+        assert scheduler.reload() == 0
+        assert "T-1" in scheduler._due_at
+    finally:
+        scheduler.stop()
@@ -0,0 +1,152 @@
+from fastapi import BackgroundTasks
+
+from app import pipeline
+from app.distribution_rules import RuleEngine, reprice_orders, reattribute_orders
+from app.models import Order
+from app.order_store import bulk_upsert_orders
+from app.routes.distribution_rules import (
+    DistributionRuleSchema, create_distribution_rule, update_distribution_rule, delete_distribution_rule,
+)
+from tests.conftest import order_row
+
+def ingest(db, *rows):
+    """Записывает заявки с правилами, как это делает конвейер"""
+    engine = RuleEngine.load(db)
+    for row in rows:
+        pipeline.assign_rule(row, engine.match(row), engine.version)
+    bulk_upsert_orders(db, list(rows))
+
+def rule_schema(**fields):
+    values = {"loading_city": "Екатеринбург", "unloading_city": "Пермь", "logistician": "Петров", "margin_percent": 20}
+    values.update(fields)
+    return DistributionRuleSchema(**values)
+
+def prices(db):
+    db.expire_all()
+    return {order.external_no: (order.rule_id, order.ati_price) for order in db.query(Order).order_by(Order.external_no)}
+
+def attributions(db):
+    """{external_no: (rule_id, логист, груз, ставка)}"""
+    db.expire_all()
+    return {
+        order.external_no: (order.rule_id, order.logistician_name, order.cargo_name, order.ati_price)
+        for order in db.query(Order).order_by(Order.external_no)
+    }
+
+def test_reprice_only_orders_of_edited_rule(db, make_rule):
+    universal = make_rule(margin_percent=10)
+    ingest(db, order_row("T-1"), order_row("T-2", loading_city="Казань"))
+    route = create_distribution_rule(rule_schema(), BackgroundTasks(), db)
+
+    update_distribution_rule(route.id, rule_schema(margin_percent=25), BackgroundTasks(), db)
+
+    assert prices(db) == {"T-1": (route.id, 30000), "T-2": (universal.id, None)}
+
+def test_new_rule_takes_over_orders_with_its_logist_and_price(db, make_rule):
+    universal = make_rule(margin_percent=10)
+    ingest(db, order_row("T-1"))
+    assert attributions(db) == {"T-1": (universal.id, "Иванов", "ТНП", None)}
+
+    route = create_distribution_rule(rule_schema(), BackgroundTasks(), db)
+    assert attributions(db) == {"T-1": (route.id, "Петров", "Груз", 32000)}
+
+    update_distribution_rule(route.id, rule_schema(margin_percent=50), BackgroundTasks(), db)
+    assert prices(db) == {"T-1": (route.id, 20000)}
+
+def test_deleted_rule_hands_orders_back(db, make_rule):
+    universal = make_rule(margin_percent=10)
+    ingest(db, order_row("T-1"))
+    route = create_distribution_rule(rule_schema(), BackgroundTasks(), db)
+
+    delete_distribution_rule(route.id, BackgroundTasks(), db)
+    assert attributions(db) == {"T-1": (universal.id, "Иванов", "ТНП", 36000)}
+
+    universal_update = rule_schema(loading_city=None, unloading_city=None, logistician="Иванов", margin_percent=5)
+    update_distribution_rule(universal.id, universal_update, BackgroundTasks(), db)
+    assert prices(db) == {"T-1": (universal.id, 38000)}
+
+def test_deleting_last_rule_clears_its_logist(db):
+    ingest(db, order_row("T-1"))
+    route = create_distribution_rule(rule_schema(), BackgroundTasks(), db)
+    assert attributions(db)["T-1"][:2] == (route.id, "Петров")
+
+    # В Postgres внешний ключ обнуляет rule_id при удалении правила
+    db.query(Order).update({Order.rule_id: None})
+    db.commit()
+    delete_distribution_rule(route.id, BackgroundTasks(), db)
+
+    assert attributions(db) == {"T-1": (None, None, "ТНП", None)}
+
+def test_city_change_moves_orders_between_rules(db, make_rule):
+    universal = make_rule(margin_percent=10)
+    ingest(db, order_row("T-1"), order_row("T-2", loading_city="Казань"))
+    route = create_distribution_rule(rule_schema(), BackgroundTasks(), db)
+
+    update_distribution_rule(route.id, rule_schema(loading_city="Казань", margin_percent=30), BackgroundTasks(), db)
+
+    assert attributions(db) == {
+        "T-1": (universal.id, "Иванов", "ТНП", 36000),
+        "T-2": (route.id, "Петров", "Груз", 28000),
+    }
+
+def test_reattribution_reads_only_dependent_orders(db, make_rule):
+    universal = make_rule()
+    ingest(db, order_row("T-1"), order_row("T-2", loading_city="Казань"))
+
+    # Заявки вне направлений правила не перечитываются (здесь обе заявки нарочно рассогласованы)
+    db.query(Order).update({Order.rule_id: None})
+    db.commit()
+    route = create_distribution_rule(rule_schema(), BackgroundTasks(), db)
+
+    assert prices(db) == {"T-1": (route.id, 32000), "T-2": (None, None)}
+    assert reattribute_orders(db, [], universal.id) == (0, [])
+
+def test_unchecked_orders_are_reattributed_once(db, make_rule):
+    universal = make_rule(margin_percent=10)
+    ingest(db, order_row("T-1", loading_city="Казань"))
+    db.query(Order).update({Order.rule_id: None, Order.rule_set_version: None, Order.logistician_name: None})
+    db.commit()
+
+    assert reattribute_orders(db, []) == (1, [])
+    assert attributions(db) == {"T-1": (universal.id, "Иванов", "ТНП", 36000)}
+    assert reattribute_orders(db, []) == (0, [])
+
+def test_reattribution_reports_published_orders(db, make_rule):
+    make_rule()
+    ingest(db, order_row("T-1"), order_row("T-2"))
+    db.query(Order).filter(Order.external_no == "T-2").update({Order.cargo_id: "cargo-2"})
+    db.commit()
+
+    tasks = BackgroundTasks()
+    create_distribution_rule(rule_schema(), tasks, db)
+
+    assert [task.args for task in tasks.tasks] == [(["T-2"],)]
+
+def test_reprice_reports_published_orders(db, make_rule):
+    universal = make_rule(margin_percent=10)
+    ingest(db, order_row("T-1"), order_row("T-2"))
+    db.query(Order).filter(Order.external_no == "T-2").update({Order.cargo_id: "cargo-2"})
+    db.commit()
+
+    repriced, ati_updates = reprice_orders(db, universal.id)
+
+    assert repriced == 2
+    assert ati_updates == ["T-2"]
+    assert prices(db) == {"T-1": (universal.id, 36000), "T-2": (universal.id, 36000)}
+
+def test_full_reprice_takes_over_orders_with_attribution(db, make_rule):
+    universal = make_rule(margin_percent=10)
+    ingest(db, order_row("T-1"))
+    db.query(Order).update({Order.rule_id: None})
+    db.commit()
+
+    assert reprice_orders(db, universal.id) == (0, [])
+    assert reprice_orders(db, universal.id, dependent_only=False) == (1, [])
+    assert attributions(db) == {"T-1": (universal.id, "Иванов", "ТНП", 36000)}
+
+def test_zero_bid_is_not_priced(db, make_rule):
+    universal = make_rule(margin_percent=10)
+    ingest(db, order_row("T-1", bid_price=0))
+
+    assert reprice_orders(db, universal.id) == (0, [])
+    assert prices(db) == {"T-1": (universal.id, None)}
@@ -0,0 +1,60 @@
+from app.distribution_rules import compile_rules
+from app.rule_index import RuleSnapshot, parse_city_pattern
+
+def snapshot(*routes):
+    """Правила (id по порядку) для пар (погрузка, выгрузка)"""
+    return RuleSnapshot(1, compile_rules([
+        {"id": rule_id, "platform": "transport2", "loading_city": loading, "unloading_city": unloading}
+        for rule_id, (loading, unloading) in enumerate(routes, start=1)
+    ]))
+
+def matched_id(rules, loading_city, unloading_city, platform="Transport2"):
+    rule = rules.match(platform, loading_city, unloading_city)
+    return rule.id if rule else None
+
+def test_parse_city_pattern():
+    assert parse_city_pattern(None) == ("any", None)
+    assert parse_city_pattern(" * ") == ("any", None)
+    assert parse_city_pattern("Моск*")[0] == "prefix"
+    assert parse_city_pattern("г. Москва") == parse_city_pattern("Москва")
+
+def test_precedence_exact_then_loading_then_unloading_then_any():
+    rules = snapshot((None, None), (None, "Пермь"), ("Екатеринбург", None), ("Екатеринбург", "Пермь"))
+
+    assert matched_id(rules, "Екатеринбург", "Пермь") == 4
+    assert matched_id(rules, "Екатеринбург", "Казань") == 3
+    assert matched_id(rules, "Казань", "Пермь") == 2
+    assert matched_id(rules, "Казань", "Уфа") == 1
+
+def test_city_names_are_normalized():
+    rules = snapshot(("Екатеринбург", "Пермь"))
+
+    assert matched_id(rules, "г. Екатеринбург", "г Пермь") == 1
+
+def test_prefix_is_between_exact_and_any():
+    rules = snapshot((None, None), ("Моск*", None), ("Москва", None))
+
+    assert matched_id(rules, "Москва", "Пермь") == 3
+    assert matched_id(rules, "Московский", "Пермь") == 2
+    assert matched_id(rules, "Казань", "Пермь") == 1
+
+def test_longest_prefix_wins():
+    rules = snapshot(("Мо*", None), ("Моск*", None))
+
+    assert matched_id(rules, "Московский", "Пермь") == 2
+    assert matched_id(rules, "Мончегорск", "Пермь") == 1
+
+def test_loading_city_is_matched_before_unloading_city():
+    rules = snapshot((None, "Пермь"), ("Моск*", None))
+
+    assert matched_id(rules, "Москва", "Пермь") == 2
+
+def test_first_rule_wins_for_duplicate_patterns():
+    rules = snapshot(("Екатеринбург", "Пермь"), ("Екатеринбург", "Пермь"))
+
+    assert matched_id(rules, "Екатеринбург", "Пермь") == 1
+
+def test_rules_of_other_platforms_are_ignored():
+    rules = snapshot((None, None))
+
+    assert matched_id(rules, "Екатеринбург", "Пермь", platform="other") is None
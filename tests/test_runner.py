@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app.publish_scheduler as scheduler_module
+from app.models import Order, ScheduledPublication
+from app.parsers import runner
+from app.parsers.base import PlatformParser
+from tests.conftest import order_row
+
+class StaticParser(PlatformParser):
+    """Парсер без сети: заявки берутся из `auth_data["orders"]`"""
+
+    name = "static"
+
+    def fetch(self):
+        return [(raw_order, "FREE") for raw_order in self.auth_data["orders"]], True
+
+    def order_key(self, raw_order):
+        return raw_order["external_no"]
+
+    def order_hash(self, raw_order, order_type):
+        return raw_order["content_hash"]
+
+    def normalize(self, raw_order, order_type):
+        return dict(raw_order)
+
+@pytest.fixture
+def published(db, monkeypatch):
+    monkeypatch.setitem(runner.PARSERS, "static", f"{__name__}:StaticParser")
+    monkeypatch.setattr(scheduler_module, "prepare_order_for_ati", lambda order: {"external_id": order.external_no})
+
+    published = []
+    def publish_cargo(cargo_data):
+        published.append(cargo_data["external_id"])
+        return {"cargo_id": "cargo", "cargo_number": "N-1"}
+    monkeypatch.setattr(scheduler_module, "publish_cargo", publish_cargo)
+    return published
+
+def test_platform_cycle_drains_due_publications_of_its_platform(db, make_rule, published):
+    make_rule(platform="static")
+    db.add(Order(**order_row("OTHER-1", platform="transport2")))
+    db.add(ScheduledPublication(external_no="OTHER-1", publish_at=datetime.utcnow() - timedelta(minutes=1)))
+    db.add(ScheduledPublication(external_no="S-1", publish_at=datetime.utcnow() - timedelta(minutes=1)))
+    db.add(ScheduledPublication(external_no="S-2", publish_at=datetime.utcnow() + timedelta(hours=1)))
+    db.commit()
+
+    orders = [order_row("S-1", platform="static"), order_row("S-2", platform="static")]
+    stats = runner.run_platform_cycle("static", {"orders": orders})
+
+    assert (stats["inserted"], stats["published"]) == (2, 1)
+    assert published == ["S-1"]
+    db.expire_all()
+    assert sorted(task.external_no for task in db.query(ScheduledPublication)) == ["OTHER-1", "S-2"]
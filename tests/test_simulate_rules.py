@@ -0,0 +1,44 @@
+from app.models import DistributionRule, Order
+from app.routes.distribution_rules import DistributionRuleCandidateSchema, simulate_distribution_rules
+from tests.conftest import order_row
+from tests.test_reprice import attributions, ingest
+
+def candidate(**fields):
+    values = {"loading_city": "Екатеринбург", "unloading_city": "Пермь", "logistician": "Петров", "margin_percent": 20}
+    values.update(fields)
+    return DistributionRuleCandidateSchema(**values)
+
+def stored_state(db):
+    """Заявки и правила в БД — симуляция не должна их менять"""
+    db.expire_all()
+    orders = {order.external_no: (order.rule_set_version, order.cargo_id) for order in db.query(Order)}
+    rules = [(rule.id, rule.loading_city, rule.logistician, rule.margin_percent) for rule in db.query(DistributionRule)]
+    return attributions(db), orders, rules
+
+def test_simulation_reports_changes_without_writing(db, make_rule):
+    universal = make_rule(margin_percent=10)
+    ingest(db, order_row("T-1"), order_row("T-2", loading_city="Казань", cargo_id="cargo-2"))
+    before = stored_state(db)
+
+    # Точное направление важнее универсального правила, даже если стоит в списке после него
+    universal_candidate = candidate(id=universal.id, loading_city=None, unloading_city=None, logistician="Иванов")
+    result = simulate_distribution_rules([universal_candidate, candidate(auto_publish=True)], db)
+
+    assert stored_state(db) == before
+    assert (result["orders"], result["rules"]) == (2, 2)
+    assert result["logist_changes"] == [{"external_no": "T-1", "from": "Иванов", "to": "Петров", "rule_id": None}]
+    assert sorted(result["price_changes"], key=lambda change: change["external_no"]) == [
+        {"external_no": "T-1", "bid_price": 40000, "from": None, "to": 32000, "is_published": False},
+        {"external_no": "T-2", "bid_price": 40000, "from": None, "to": 32000, "is_published": True},
+    ]
+    assert (result["auto_publish_start"], result["auto_publish_stop"]) == (["T-1"], [])
+
+def test_simulation_uses_list_order_for_same_cities(db, make_rule):
+    make_rule()
+    ingest(db, order_row("T-1"))
+    before = stored_state(db)
+
+    first, second = candidate(logistician="Петров"), candidate(logistician="Сидоров", margin_percent=50)
+    assert simulate_distribution_rules([first, second], db)["logist_changes"][0]["to"] == "Петров"
+    assert simulate_distribution_rules([second, first], db)["logist_changes"][0]["to"] == "Сидоров"
+    assert stored_state(db) == before
@@ -0,0 +1,41 @@
+import pytest
+
+from app import pipeline
+from app.models import Order
+from app.order_store import bulk_upsert_orders, find_missing_published
+from tests.conftest import order_row
+
+@pytest.fixture
+def published_orders(db):
+    bulk_upsert_orders(db, [order_row("T-1"), order_row("T-2"), order_row("T-3"), order_row("T-4")])
+    for external_no in ("T-2", "T-3"):
+        db.query(Order).filter(Order.external_no == external_no).update({Order.cargo_id: f"cargo-{external_no}", Order.is_published: True})
+    db.commit()
+
+def remaining(db):
+    db.expire_all()
+    return {order.external_no: order.cargo_id for order in db.query(Order)}
+
+def test_find_missing_published(db, published_orders):
+    rows = find_missing_published(db, "transport2", {"T-1", "T-3"})
+    assert [(row.external_no, row.cargo_id) for row in rows] == [("T-2", "cargo-T-2")]
+
+def test_cargo_is_removed_from_ati_before_row_delete(db, published_orders, monkeypatch):
+    calls = []
+
+    def delete_cargos(orders):
+        # Строки заявок еще в БД, когда груз снимается с ATI
+        calls.append(sorted((row.external_no, remaining(db)[row.external_no]) for row in orders))
+        return [row.external_no for row in orders], []
+
+    monkeypatch.setattr(pipeline, "delete_cargos", delete_cargos)
+
+    assert pipeline.delete_stale_orders(db, "transport2", {"T-1"}) == 3
+    assert calls == [[("T-2", "cargo-T-2"), ("T-3", "cargo-T-3")]]
+    assert remaining(db) == {"T-1": None}
+
+def test_order_stays_when_ati_deletion_fails(db, published_orders, monkeypatch):
+    monkeypatch.setattr(pipeline, "delete_cargos", lambda orders: (["T-2"], ["T-3"]))
+
+    assert pipeline.delete_stale_orders(db, "transport2", {"T-1"}) == 2
+    assert remaining(db) == {"T-1": None, "T-3": "cargo-T-3"}
@@ -0,0 +1,100 @@
+import io
+import json
+
+import httpx
+import pytest
+import requests
+
+from app.models import Order
+from app.order_store import bulk_upsert_orders
+from app.parsers import transport2
+from tests.conftest import order_row
+
+@pytest.fixture
+def stored_order(db, make_rule):
+    """Заявка Transport2, уже сохраненная в прошлом цикле"""
+    make_rule()
+    bulk_upsert_orders(db, [order_row("T-1", platform=transport2.PLATFORM_NAME)])
+    db.commit()
+    transport2.session.close()
+    return "T-1"
+
+def stored_external_nos():
+    transport2.session.expire_all()
+    return [external_no for (external_no,) in transport2.session.query(Order.external_no)]
+
+def test_stream_without_ijson_reports_failed_feed(stored_order, monkeypatch):
+    def post(*args, **kwargs):
+        raise requests.exceptions.ConnectionError("offline")
+
+    deleted = []
+    monkeypatch.setattr(transport2, "ijson", None)
+    monkeypatch.setattr(transport2.requests, "post", post)
+    monkeypatch.setattr(transport2, "delete_stale_orders", deleted.append)
+
+    errors = []
+    assert list(transport2.iter_orders_stream(transport2.FREE_ORDERS_URL, None, is_free=True, errors=errors)) == []
+    assert errors == [transport2.FREE_ORDERS_URL]
+
+    transport2.process_orders_stream()
+    assert deleted == []
+    assert stored_external_nos() == [stored_order]
+
+SCHEMA_ERROR = {"errors": [{"message": "Unknown argument \"loadingDatetimeFrom\""}], "data": None}
+
+class StreamResponse:
+    """Ответ `requests.post(..., stream=True)` с телом из памяти"""
+
+    def __init__(self, body):
+        self.raw = io.BytesIO(json.dumps(body).encode("utf-8"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+@pytest.mark.parametrize("body", [SCHEMA_ERROR, {"data": {}}, {}])
+def test_response_without_feed_data_is_an_error(body):
+    with pytest.raises(transport2.FeedResponseError):
+        transport2.parse_orders_response(transport2.FREE_ORDERS_URL, body, is_free=True)
+
+def test_empty_feed_is_not_an_error():
+    assert transport2.parse_orders_response(transport2.FREE_ORDERS_URL, {"data": {"freeOrders": []}}, is_free=True) == []
+
+def test_graphql_errors_skip_stale_deletion(db, stored_order, monkeypatch):
+    def handler(request):
+        return httpx.Response(200, json=SCHEMA_ERROR)
+
+    monkeypatch.setattr(transport2, "create_async_client", lambda client_headers=None: httpx.AsyncClient(
+        transport=httpx.MockTransport(handler)
+    ))
+
+    items, complete = transport2.transport2_parser.fetch()
+    assert (items, complete) == ([], False)
+
+    transport2.process_orders(streaming=False)
+    assert stored_external_nos() == [stored_order]
+
+@pytest.mark.parametrize("body", [SCHEMA_ERROR, {"data": {"freeOrders": None}}])
+def test_stream_reports_graphql_errors(stored_order, monkeypatch, body):
+    monkeypatch.setattr(transport2.requests, "post", lambda *args, **kwargs: StreamResponse(body))
+
+    errors = []
+    assert list(transport2.iter_orders_stream(transport2.FREE_ORDERS_URL, None, is_free=True, errors=errors)) == []
+    assert errors == [transport2.FREE_ORDERS_URL]
+
+    transport2.process_orders_stream()
+    assert stored_external_nos() == [stored_order]
+
+def test_stream_reads_orders_of_valid_response(monkeypatch):
+    body = {"data": {"freeOrders": [{"externalNo": "T-1", "status": "FREE", "loadingDatetime": "2999-01-01T00:00:00+00:00"}]}}
+    monkeypatch.setattr(transport2.requests, "post", lambda *args, **kwargs: StreamResponse(body))
+
+    errors = []
+    orders = list(transport2.iter_orders_stream(transport2.FREE_ORDERS_URL, None, is_free=True, errors=errors))
+    assert [order["externalNo"] for order in orders] == ["T-1"]
+    assert errors == []
@@ -0,0 +1,21 @@
+from app.parsers import transport2
+
+def test_payload_requests_only_fields_in_use():
+    query = transport2.build_payload("FREE", server_filters=False)["query"]
+
+    assert "bodySubtype" not in query
+    assert "\n                id\n" not in query
+    assert "vehicleRequirements { name }" in query
+    assert "price" in query and "lot" not in query
+
+def test_auction_payload_requests_lot_instead_of_price():
+    query = transport2.build_payload("AUCTION", server_filters=False)["query"]
+
+    assert "lot { auctionStatus startPrice lastBet }" in query
+    assert "price\n" not in query
+
+def test_server_filters_are_passed_as_variables():
+    payload = transport2.build_payload("ASSIGNED", server_filters=True)
+
+    assert payload["variables"]["statuses"] == ["ASSIGNED"]
+    assert "$loadingFrom: DateTime" in payload["query"]
@@ -0,0 +1,36 @@
+import pytest
+
+from app.models import Order, Platform
+from app.worker import Transport2Worker
+from tests.test_feed_duplicates import raw_order
+
+@pytest.fixture
+def worker(db, make_rule):
+    make_rule()
+    db.add(Platform(name="transport2", enabled=True, auth_data={"token": "from-db"}))
+    db.commit()
+    worker = Transport2Worker()
+    yield worker
+    worker.db.close()
+
+def stored(db):
+    db.expire_all()
+    return {order.external_no: order.order_type for order in db.query(Order)}
+
+def test_worker_uses_registry_parser_with_platform_token(worker):
+    assert worker.parser.headers["Authorization"] == "Token from-db"
+
+def test_worker_feeds_go_through_pipeline(db, worker):
+    auction = raw_order("T-1", lot={"auctionStatus": "ACTIVE", "startPrice": 50000, "lastBet": None})
+    free = [raw_order("T-1"), raw_order("T-3")]
+
+    assert worker.process_feed("ASSIGNED", [raw_order("T-2", status="ASSIGNED")]) == 1
+    assert worker.process_feed("AUCTION", [auction]) == 1
+    # Та же заявка в свободных — уже записана из аукционного фида
+    assert worker.process_feed("FREE", free) == 1
+    assert worker.process_feed("FREE", free) == 0
+    assert stored(db) == {"T-1": "AUCTION", "T-2": "ASSIGNED", "T-3": "FREE"}
+
+    # Все фиды опрошены — заявка, пропавшая из фида, удаляется
+    assert worker.process_feed("ASSIGNED", []) == 1
+    assert stored(db) == {"T-1": "AUCTION", "T-3": "FREE"}